@@ -1,600 +1,349 @@
-from flask import Flask, render_template, redirect, url_for, request, session
-from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.sql import text, select
-from sqlalchemy.exc import SQLAlchemyError
-from datetime import date
-import re
+from flask import Flask, current_app, render_template, request
+from flask.cli import with_appcontext
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import inspect
+from datetime import datetime
+from extensions import db, page_cache, passwords, view_counter, feeds, bootstrap
+from database import configure_database, tune_engine, on_engine
+from query_guard import QueryCountGuard
+from metrics import Metrics
+from admission import AdmissionControl
+from http_cache import StaticVersioning
+from errors import ErrorPages
+from views.common import Get_Search_Index, Setup_Search
+from search import create_search_index
+from views import auth, posts, profiles, search
+from views import feeds as feed_views
+import migrations
+import assets
+import rendering
+import bulk
+import user_stats
+import click
+import gc
+import os
 
 # Configure app
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
-app.config['SECRET_KEY'] = '77916e7166d54cf2bdc184058c4bf3d6'
-
-# Configure database
-db = SQLAlchemy(app)
-engine = db.engine
-
-# Configure bootstrap
-Bootstrap(app)
-
-class User(db.Model):
-    """User model for DB"""
-
-    id = db.Column(db.Integer, primary_key = True)
-    username = db.Column(db.String(20), nullable = False, unique = True)
-    email = db.Column(db.String(50), nullable = False, unique = True)
-    password = db.Column(db.String, nullable = False)
-    about = db.Column(db.Text)
-
-    # References the Post class
-    # Allows posts to access the User that created it
-    posts = db.relationship('Post', backref = 'author', lazy = True)
-
-    def __init__(self, username, email, password):
-        self.username = username
-        self.email = email
-        self.password = password
-
-    def __repr__(self):
-        return f'User({self.username}, {self.email})'
-
-class Post(db.Model):
-    """Post model for DB"""
+# Everything here can be overridden by the config passed to create_app
+DEFAULTS = {
+    'SECRET_KEY': os.environ.get('SECRET_KEY', '77916e7166d54cf2bdc184058c4bf3d6'), # Set SECRET_KEY in production
+    'SEARCH_BACKEND': 'auto', # 'auto' uses FTS5 when SQLite supports it, else 'memory'
+    'SEARCH_REFRESH_INTERVAL': 60.0, # Seconds between the memory index picking up other workers' writes, None never
+    'SEARCH_PAGE_SIZE': 20,
+    'FEED_PAGE_SIZE': 25,
+    'AUTHORS_PAGE_SIZE': 50, # Authors on the leaderboard at /authors
+    'TRENDING_SIZE': 25, # Posts on the trending page, ranked by views with a TRENDING_HALF_LIFE decay
+    'STREAM_PAGES': True, # Stream profiles and search results as they render, cached pages are always sent whole
+    'STREAM_PAGE_SIZE': 250, # Posts on a streamed profile page, read STREAM_CHUNK_SIZE rows at a time
+    'STREAM_CHUNK_SIZE': 50,
+    'STREAM_BUFFER_SIZE': 8192, # Characters sent per chunk after the head and navbar
+    'MAX_QUERIES_PER_REQUEST': 10, # Raises in debug/testing, logs a warning otherwise
+    'PAGE_CACHE_BACKEND': 'memory', # 'memory' (per process), 'sqlite' (at PAGE_CACHE_PATH, shared by the workers) or None to disable
+    'PAGE_CACHE_SIZE': 1024,
+    'SLOW_REQUEST_THRESHOLD': 0.5, # Seconds, slower requests are logged with their SQL
+    'TRUSTED_PROXIES': int(os.environ.get('TRUSTED_PROXIES', 0)), # Reverse proxies in front of the app, whose X-Forwarded-* headers are trusted
+    'ASSET_VENDOR_FOLDER': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor') # Filled by flask vendor-assets
+}
+
+def create_app(config = None):
+    """Creates an app, config is a dict or object whose upper case keys override the defaults"""
+
+    app = Flask(__name__)
+    app.config.from_mapping(DEFAULTS)
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # Configure database
+    # The URI comes from DATABASE_URL, see database.py for the pool and SQLite tuning options
+    # The engine is only created on first use, the extensions below hook into it then
+    configure_database(app)
+    db.init_app(app)
+    on_engine(app, lambda engine: tune_engine(app, engine))
+
+    # Take the client's address and scheme from the proxies' headers, so rate limits and external URLs see the real ones
+    # Only headers set by the trusted proxies are read, a client can't spoof its address past them
+    proxies = app.config['TRUSTED_PROXIES']
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for = proxies, x_proto = proxies, x_host = proxies)
+
+    # Catch N+1 query patterns
+    QueryCountGuard(app)
+
+    # Record per-endpoint latency, SQL and render times, served at /metrics
+    Metrics(app)
+
+    # Rate limit the expensive routes per client and cap how many run at once, see admission.py for the limits
+    AdmissionControl(app)
+
+    # Configure the rendered page cache
+    page_cache.init_app(app)
+
+    # Serve static files under content-hashed URLs
+    StaticVersioning(app)
+
+    # Hash passwords on a bounded worker pool, its threads start on the first login
+    passwords.init_app(app)
+
+    # Count post views in memory, its flusher thread starts on the first view
+    view_counter.init_app(app)
+
+    # Write the Atom feeds and sitemaps as static files, regenerated behind the writes that change them
+    feeds.init_app(app)
+
+    # Render errors in place with their status codes instead of redirecting to /error
+    ErrorPages(app, db)
+
+    # Configure bootstrap
+    bootstrap.init_app(app)
+
+    # Configure routes
+    app.add_template_filter(Format_Day, 'day')
+    app.add_url_rule('/', 'Main', Main)
+    app.add_url_rule('/error', 'Error', Error)
+    for blueprint in (auth.bp, posts.bp, profiles.bp, search.bp, feed_views.bp):
+        app.register_blueprint(blueprint)
+
+    app.before_first_request(Setup_Search)
+    app.cli.add_command(Upgrade_DB)
+    app.cli.add_command(Rebuild_Search)
+    app.cli.add_command(Render_Posts)
+    app.cli.add_command(Check_Stats)
+    app.cli.add_command(Build_Feeds)
+    app.cli.add_command(Import_Users)
+    app.cli.add_command(Import_Posts)
+    app.cli.add_command(Export_Users)
+    app.cli.add_command(Export_Posts)
+    app.cli.add_command(Vendor_Assets)
+    app.cli.add_command(Build_Assets)
+
+    return app
+
+def preload(app):
+    """Does the work every worker would repeat, so workers forked from a preloaded app share it copy-on-write"""
+
+    # Parse and compile every template into the environment's cache
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # Hash the static files for their versioned URLs
+    app.extensions['static_versioning'].preload()
+
+    # Connections can't be shared across processes, each worker opens its own
+    for engine in app.extensions.get('hooked_engines', {}).values():
+        engine.dispose()
+
+    # Keep the garbage collector from writing to the preloaded objects, which would copy their pages into every worker
+    gc.freeze()
+
+def Format_Day(value):
+    """Formats a post timestamp as its day"""
+
+    # Raw SQL rows hold the timestamp as text on SQLite
+    return value.strftime('%Y-%m-%d') if isinstance(value, datetime) else str(value)[:10]
+
+@click.command('upgrade-db')
+@with_appcontext
+def Upgrade_DB():
+    """Creates missing tables and applies pending schema migrations"""
+
+    with db.engine.connect() as con:
+        if 'post' not in inspect(con).get_table_names():
+            # A new database gets the latest schema straight from the models
+            db.create_all()
+            migrations.stamp(con)
+            click.echo(f"Created the database at version {migrations.latest_version()}")
+            return
+
+        applied = migrations.upgrade(con, log = click.echo)
+
+        # The FTS5 tables of a database from before search, or an empty index, are built now rather than on the first request
+        # The memory index is built by each worker, building it here would only be thrown away
+        index = create_search_index(con, current_app.config['SEARCH_BACKEND'])
+        if index.name == 'fts5' and index.setup(con):
+            click.echo("Built the search index")
+
+    click.echo(f"Applied {applied} migrations, the database is at version {migrations.latest_version()}")
+
+@click.command('rebuild-search')
+@with_appcontext
+def Rebuild_Search():
+    """Rebuilds the search index from the post and user tables"""
+
+    with db.engine.connect() as con:
+        index = Get_Search_Index()
+        index.rebuild(con)
+
+    click.echo(f"Rebuilt the {index.name} search index")
+
+@click.command('render-posts')
+@click.option('--batch-size', default = 200, help = "Posts read and written per transaction")
+@click.option('--workers', type = int, help = "Rendering processes, defaults to one per CPU")
+@click.option('--all', 'everything', is_flag = True, help = "Re-render every post, not only those rendered by an older renderer")
+@with_appcontext
+def Render_Posts(batch_size, workers, everything):
+    """Renders the Markdown of the posts rendered by an older renderer version"""
+
+    with db.engine.connect() as con:
+        rendered = rendering.render_posts(con, batch_size, workers, everything, log = click.echo)
+
+    # Pages cached in memory by running servers go when they restart, as they do when the renderer is deployed
+    page_cache.clear()
+    feeds.clear()
+    click.echo(f"Rendered {rendered} posts with renderer version {rendering.RENDERER_VERSION}")
+
+@click.command('check-stats')
+@click.option('--repair', is_flag = True, help = "Rebuild every user's stats from their posts if any have drifted")
+@with_appcontext
+def Check_Stats(repair):
+    """Compares the user stats with the posts and lists the users whose stats have drifted"""
+
+    with db.engine.connect() as con:
+        drifted = user_stats.drifted(con)
+        for row in drifted:
+            click.echo(f"{row.username}: {row.post_count} posts, {row.word_count} words, latest {row.latest_post_at} "
+                f"but has {row.actual_post_count} posts, {row.actual_word_count} words, latest {row.actual_latest_post_at}")
+
+        if drifted and repair:
+            user_stats.rebuild(con)
+            page_cache.clear()
+            click.echo(f"Rebuilt the stats, {len(drifted)} users had drifted")
+        else:
+            click.echo(f"{len(drifted)} users have drifted stats" + (", run with --repair to rebuild them" if drifted else ""))
 
-    id = db.Column(db.Integer, primary_key = True)
-    date_created = db.Column(db.String(10), nullable = False)
-    title = db.Column(db.String(100), nullable = False)
-    content = db.Column(db.Text, nullable = False)
+@click.command('build-feeds')
+@click.option('--base-url', help = "The site's URL the feeds link to, defaults to SITE_URL")
+@with_appcontext
+def Build_Feeds(base_url):
+    """Writes every Atom feed and sitemap, which are otherwise written as they are first requested"""
 
-    # Foreign key references the author's User's id
-    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
+    base_url = base_url or current_app.config['SITE_URL']
+    if not base_url:
+        raise click.ClickException("Pass --base-url or set SITE_URL, the feeds hold absolute links")
 
-    def __init__(self, author_id, title, content):
-        self.date_created = str(date.today())
-        self.title = title
-        self.content = content
-        self.author_id = author_id
+    with db.engine.connect() as con:
+        feeds.build(con, base_url)
 
-    def __repr__(self):
-        return f'Post({self.author}, {self.date_created}, {self.title})'
+    click.echo(f"Wrote the feeds and sitemaps to {current_app.config['FEEDS_FOLDER']}")
 
-# Handle 404 errors
-@app.errorhandler(404)
-def Page_Not_Found(e):
-    """Redirects the 404 errors to the error template"""
+@click.command('import-users')
+@click.argument('path', type = click.Path(exists = True))
+@click.option('--batch-size', default = 10000, help = "Users inserted per transaction")
+@with_appcontext
+def Import_Users(path, batch_size):
+    """Imports users from a JSONL or CSV file with username, email, password and about fields"""
 
-    return redirect(url_for('Error', title = "Error: 404", msg = e))
+    with db.engine.connect() as con:
+        try:
+            imported, skipped = bulk.import_users(con, bulk.read_records(path), batch_size, hash_password = passwords.hash, log = click.echo)
+        except bulk.TransferError as e:
+            raise click.ClickException(str(e))
+        finally:
+            # The batches committed before a failure are indexed and listed too
+            Get_Search_Index().rebuild(con)
+
+            # The sitemaps list the new profiles
+            feeds.clear()
+
+    click.echo(f"Imported {imported} users, skipped {skipped} without a username, email or password or already taken")
+
+@click.command('import-posts')
+@click.argument('path', type = click.Path(exists = True))
+@click.option('--batch-size', default = 10000, help = "Posts inserted per transaction")
+@click.option('--author', help = "Username of the author of the posts that don't name one, such as Markdown files without a header")
+@click.option('--keep-ids', is_flag = True, help = "Insert the posts with the ids in the records, to keep links to them working")
+@click.option('--keep-indexes', is_flag = True, help = "Update the indexes on every insert instead of rebuilding them afterwards, for small imports into big tables")
+@click.option('--workers', type = int, help = "Processes preparing the posts, defaults to one per CPU")
+@click.option('--render', is_flag = True, help = "Render the posts' Markdown afterwards, as flask render-posts does")
+@with_appcontext
+def Import_Posts(path, batch_size, author, keep_ids, keep_indexes, workers, render):
+    """Imports posts from a JSONL or CSV file, or a folder of Markdown files, by their authors' usernames"""
+
+    records = bulk.read_records(path)
+    if author:
+        records = ({'author': author, **record} for record in records)
+
+    with db.engine.connect() as con:
+        try:
+            imported, skipped = bulk.import_posts(con, records, batch_size, keep_ids, not keep_indexes, workers, log = click.echo)
+        except bulk.TransferError as e:
+            raise click.ClickException(str(e))
+        finally:
+            # Indexed once for the whole import rather than post by post, the batches committed before a failure too
+            click.echo("Rebuilding the search index")
+            Get_Search_Index().rebuild(con)
+            page_cache.clear()
+            feeds.clear()
+
+        if render:
+            rendering.render_posts(con, workers = workers, log = click.echo)
+
+    click.echo(f"Imported {imported} posts, skipped {skipped} without a title, content or known author")
+
+@click.command('export-users')
+@click.argument('output', type = click.File('w', encoding = 'utf-8', lazy = False))
+@with_appcontext
+def Export_Users(output):
+    """Writes every user to a JSONL file, or - for stdout, in the format import-users reads"""
+
+    with db.engine.connect() as con:
+        exported = bulk.export_users(con, output, log = lambda message: click.echo(message, err = True))
+
+    click.echo(f"Exported {exported} users", err = True)
+
+@click.command('export-posts')
+@click.argument('output', type = click.File('w', encoding = 'utf-8', lazy = False))
+@with_appcontext
+def Export_Posts(output):
+    """Writes every post to a JSONL file, or - for stdout, in the format import-posts reads"""
+
+    with db.engine.connect() as con:
+        exported = bulk.export_posts(con, output, log = lambda message: click.echo(message, err = True))
+
+    click.echo(f"Exported {exported} posts", err = True)
+
+@click.command('vendor-assets')
+@with_appcontext
+def Vendor_Assets():
+    """Downloads the CSS, JS and fonts the layout loads from CDNs, checked against their integrity hashes"""
+
+    try:
+        assets.vendor(current_app.config['ASSET_VENDOR_FOLDER'], log = click.echo)
+    except assets.AssetError as e:
+        raise click.ClickException(str(e))
+
+@click.command('build-assets')
+@click.option('--clean', is_flag = True, help = "Delete the files of earlier builds first")
+@with_appcontext
+def Build_Assets(clean):
+    """Builds the minified bundles and fingerprinted, precompressed static files url_for serves"""
+
+    try:
+        assets.build(current_app, current_app.config['ASSET_VENDOR_FOLDER'], clean = clean, log = click.echo)
+    except assets.AssetError as e:
+        raise click.ClickException(str(e))
 
 # Configure App routes
 # Render the matching HTML file
-@app.route('/')
 def Main():
     """Renders the landing page"""
 
     return render_template("index.html")
 
-@app.route('/login')
-def Login():
-    """Renders the login form"""
-
-    # Log current user out (if any)
-    if 'user_id' in session:
-        session.pop('user_id')
-
-    message = request.args.get('message')
-    return render_template("login.html", message = message)
-
-@app.route('/register')
-def Register():
-    """Renders the register form"""
-
-    # Log current user out (if any)
-    if 'user_id' in session:
-        session.pop('user_id')
-
-    message = request.args.get('message')
-    return render_template("register.html", message = message)
-
-@app.route('/profile')
-def Own_Profile():
-    """Route for viewing own profile"""
-
-    # Display profile if user is logged in, else prompt them to login
-    if not 'user_id' in session:
-        return redirect(url_for('Login', message = "You must be logged in to view your profile."))
-    else:
-        # Connect to DB
-        with engine.connect() as con:
-            # Get user from DB
-            try:
-                statement = text("SELECT * FROM user WHERE (id = :id)")
-                user = con.execute(statement, id = session['user_id']).fetchall()[0]
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Fetching user", msg = type(e), back = "Own_Profile"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Own_Profile"))
-
-            # Get user posts from DB
-            try:
-                statement = text("SELECT * FROM post WHERE (author_id = :id) ORDER BY id DESC")
-                posts = con.execute(statement, id = session['user_id']).fetchall()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Fetching user posts", msg = type(e), back = "Own_Profile"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Own_Profile"))
-
-            # Check if the user is editing their about
-            to_edit = request.args.get('edit')
-
-        return render_template("profile.html", user = user, posts = posts, editable = True, to_edit = to_edit)
-
-@app.route('/profile/<username>')
-def User_Profile(username):
-    """Route for viewing other's profiles"""
-
-    # Connect to db
-    with engine.connect() as con:
-        # Get user from DB
-        try:
-            statement = text("SELECT * FROM user WHERE (username = :username)")
-            user = con.execute(statement, username = username).fetchall()[0]
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Fetching user", msg = type(e)))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>"))
-
-        # Get user posts from DB
-        try:
-            statement = text("SELECT * FROM post WHERE (author_id = :id) ORDER BY id DESC")
-            posts = con.execute(statement, id = user.id).fetchall()
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Fetching user posts", msg = type(e)))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>"))
-
-        # Redirect user to profile not profile/<username> if <username> is theirs (shows editing buttons and stuff)
-        if 'user_id' in session:
-            if user.id == session['user_id']:
-                return redirect(url_for('Own_Profile'))
-
-    return render_template("profile.html", user = user, posts = posts, editable = False)
-
-@app.route('/post/new')
-def New_Post():
-    """Renders the new post form"""
-
-    message = request.args.get('message')
-
-    if not 'user_id' in session:
-        return redirect(url_for('Login', message = "You must be logged in to make a post"))
-
-    return render_template("new.html", message = message)
-
-@app.route('/post/<int:post_id>')
-def View_Post(post_id):
-    """Renders the post by id to the view form"""
-
-    # Connect to DB
-    with engine.connect() as con:
-        # Select the post data
-        try:
-            statement = text("SELECT p.id AS post_id, p.title, p.content, p.author_id, p.date_created AS date, user.username AS author FROM post AS p INNER JOIN user ON (p.author_id = user.id) WHERE (p.id = :id)")
-            post = con.execute(statement, id = post_id).fetchall()[0]
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Fetching post", msg = type(e), back = "Recent"))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-        if session['user_id'] == post.author_id:
-            edit = request.args.get('edit')
-        else:
-            edit = 'false'
-
-    return render_template('post.html', post = post, edit = edit)
-
-@app.route('/recent')
-def Recent():
-    """Renders the most recent 25 posts to the recent form"""
-
-    # Connect to DB
-    with engine.connect() as con:
-        # Select the 25 most recent posts
-        try:
-            statement = text("SELECT p.id, p.title, p.content, p.date_created AS date, user.username AS author FROM post AS p INNER JOIN user ON (p.author_id = user.id) ORDER BY p.id DESC LIMIT 25")
-            posts = con.execute(statement).fetchall()
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Fetching recent posts", msg = type(e), back = "Recent"))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-    return render_template('recent.html', posts = posts)
-
-@app.route('/post/<int:post_id>/del')
-def Delete_Post_Form(post_id):
-    """Renders the delete post form for a post by id"""
-
-    return render_template("delete.html")
-
-@app.route('/password')
-def Change_Password_Form():
-    """Renders the change password form for the current user"""
-
-    # Send the user to login if they aren't logged in
-    if not 'user_id' in session:
-        return redirect(url_for('Login', message = "You must be logged in to change your password"))
-
-    message = request.args.get('message')
-
-    return render_template("changePwd.html", message = message)
-
-@app.route('/search')
-def Search_Form():
-    """Render the search form"""
-
-    return render_template("search.html")
-
-@app.route('/logout')
-def Logout():
-    """Log the current user out"""
-
-    # Delete the user's session
-    session.pop('user_id')
-
-    return redirect(url_for('Login'))
-
-@app.route('/error')
 def Error():
     """Renders the error screen with query string parameters"""
 
-    # Get the error parameters
+    # Errors are rendered in place now, this stays for links to it from elsewhere
     title = request.args.get('title')
     msg = request.args.get('msg')
     back = request.args.get('back')
 
     return render_template("error.html", title = title, msg = msg, back = back)
 
-# Configure App routes with HTTP methods
-@app.route('/login', methods = ['POST'])
-def Login_User():
-    """Checks credentials and logs user in"""
-
-    # Check if both fields are filled out
-    if not (request.form['email'] and request.form['password']):
-        return redirect(url_for('Login', message = "Invalid email or password"))
-    else:
-        # Connect to DB
-        with engine.connect() as con:
-            # Check if user exists with given credentials
-            try:
-                statement = text("SELECT user.id FROM user WHERE (email = :email AND password = :password)")
-                user_id = con.execute(statement, email = request.form['email'], password = request.form['password']).scalar()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Validating user", msg = type(e), back = "Login_User"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Login_User"))
-
-            # If user exists, log them in
-            # Else alert them to the wrong credentials
-            if user_id:
-                session['user_id'] = user_id # Create a user_id session to store login
-                return redirect(url_for('Own_Profile')) # Redirect to user's profile
-            else:
-                return redirect(url_for('Login', message = "Invalid email or password"))
-
-@app.route('/register', methods = ['POST'])
-def Register_User():
-    """Validates register form data and saves it to the database"""
-
-    # Check if the fields are filled out
-    if not (request.form['username'] and request.form['email'] and request.form['password'] and request.form['passwordConf']):
-        return redirect(url_for('Register', message = "Please fill out all the fields"))
-    else:
-        # Ensure passwords match
-        if request.form['password'] != request.form['passwordConf']:
-            return redirect(url_for('Register', message = "Passwords do not match"))
-
-        # Ensure name is only _, a-z, A-Z, 0-9, and space
-        if not re.search(r'^[\w_ ]+$', request.form['username']):
-            return redirect(url_for('Register', message = "Username can only contain _, a-z, A-Z, 0-9 and spaces."))
-        
-        # Ensure a valid email
-        if not re.search(r'^[a-zA-Z0-9]+[\._]?[a-zA-Z0-9]+[@]\w+[.]\w+$', request.form['email']):
-            return redirect(url_for('Register', message = "Invalid email"))
-
-        # Connect to DB
-        with engine.connect() as con:
-            # Check if username is taken
-            try:
-                statement = text("SELECT COUNT(1) FROM user WHERE (username = :username)")
-                result = con.execute(statement, username = request.form['username']).scalar()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Validating user availability", msg = type(e), back = "Register_User"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Register_User"))
-
-            if result > 0:
-                return redirect(url_for('Register', message = "Username is already taken"))
-
-            # Check if email is taken
-            try:
-                statement = text("SELECT COUNT(1) FROM user WHERE (email = :email)")
-                result = con.execute(statement, email = request.form['email']).scalar()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Validating user availability", msg = type(e), back = "Register_User"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Register_User"))
-
-            if result > 0:
-                return redirect(url_for('Register', message = "Email is already taken"))
-
-            # Create new user and add to the database
-            try:
-                new_user = User(request.form['username'], request.form['email'], request.form['password'])
-                db.session.add(new_user)
-                db.session.commit()
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Register_User"))
-
-            # Get the new user's ID to log them in
-            try:
-                statement = text("SELECT id FROM user WHERE (username = :username)")
-                result = con.execute(statement, username = request.form['username']).scalar()
-            except:
-                return redirect(url_for('Error', title = "Error: Login failed", msg = "REGISTRATION WAS SUCCESSFUL. Something went wrong loging you in. Please login."))
-
-            # Log the new user in with a session
-            session['user_id'] = result
-
-            # Redirect to the new user's profile
-            return redirect(url_for('Own_Profile'))
-
-@app.route('/profile', methods = ['POST'])
-def Update_About():
-    """Updates user's about in the DB"""
-
-    # If the user is updating their about
-    if request.form['about']:
-        # Limit length to 500 characters including whitespace
-        # Textarea in profile.html restricts too, this is verification
-        if len(str(request.form['about'])) - str(request.form['about']).count("\n") > 500:
-            return redirect(url_for('Error', title = "Error: About too long", msg = "Your about can not be more than 500 characters!", back = "Own_Profile"))
-
-        # Connect to DB
-        with engine.connect() as con:
-            # Update user's status in DB
-            try:
-                statement = text("UPDATE user SET about = :about WHERE id = :id")
-                result = con.execute(statement, about = request.form['about'], id = session['user_id']).rowcount
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Updating user about", msg = type(e), back = "Own_Profile"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Own_Profile"))
-
-            # If update was successful, return to profile
-            # Else throw error
-            if result == 1:
-                return redirect(url_for('Own_Profile'))
-            else:
-                return redirect(url_for('Error', title = "Error: Updating user about", msg = "<class 'blog.UnhandledError'>", back = "Own_Profile"))
-
-@app.route('/post/new', methods = ['POST'])
-def Post_New_Post():
-    """Posts new posts"""
-
-    # Check if the fields are filled out
-    if not (request.form['title'] and request.form['content']):
-        return redirect(url_for('New_Post', message = "Please fill out all the fields"))
-    else:
-        # Limit length including whitespace
-        # Inputs in new.html restrict too, this is verification
-        if len(str(request.form['title'])) > 100:
-            return redirect(url_for('New_Post', message = "Title can only be 100 characters long"))
-        if len(str(request.form['content'])) - str(request.form['content']).count("\n") > 5000:
-            return redirect(url_for('New_post', message = "Content can only be 5000 characters long"))
-
-        # Connect to DB
-        with engine.connect() as con:
-            # Create post
-            try:
-                post = Post(session['user_id'], request.form['title'], request.form['content'])
-                db.session.add(post)
-                db.session.commit()
-
-                # Get post id and redirect to the new post
-                try:
-                    statement = text("SELECT id FROM post WHERE (author_id = :author AND title = :title AND content = :content)")
-                    result = con.execute(statement, author = session['user_id'], title = request.form['title'], content = request.form['content']).scalar()
-
-                    return redirect(url_for('View_Post', post_id = result))
-                except SQLAlchemyError as e:
-                    return redirect(url_for('Error', title = "Error: Handling post", msg = type(e), back = "Own_Profile"))
-                except:
-                    return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "New_Post"))
-            except:
-                return redirect(url_for('Error', title = "Error: Creating post", msg = "<class 'blog.UnhandledError'>", back = "New_Post"))
-
-@app.route('/post/<int:post_id>', methods = ['POST'])
-def Edit_Post(post_id):
-    """Updates a post by id in the DB"""
-
-    # Verify that the fields have content
-    if not (request.form['title'] and request.form['content']):
-        return redirect(url_for('View_Post', post_id = post_id))
-
-    # Limit length including whitespace
-    # Inputs in new.html restrict too, this is verification
-    if len(str(request.form['title'])) > 100:
-        return redirect(url_for('View_Post', post_id = post_id, message = "Title can only be 100 characters long"))
-    if len(str(request.form['content'])) - str(request.form['content']).count("\n") > 5000:
-        return redirect(url_for('View_Post', post_id = post_id, message = "Content can only be 5000 characters long"))
-
-    # Connect to DB
-    with engine.connect() as con:
-        # Select the post's author's id
-        try:
-            statement = text("SELECT author_id FROM post WHERE (id = :id)")
-            author_id = con.execute(statement, id = post_id).scalar()
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Editing post", msg = type(e), back = "Recent"))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-        # Verify that the editor is the author
-        if session['user_id'] == author_id:
-            # Update the post
-            try:
-                statement = text("UPDATE post SET title = :title, content = :content, date_created = :date WHERE id = :id")
-                result = con.execute(statement, title = request.form['title'], content = request.form['content'], date = str(date.today()), id = post_id).rowcount
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Updating post", msg = type(e), back = "Recent"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-            # If there was an error updating, show that
-            if result < 1:
-                return  redirect(url_for('Error', title = "Error: Updating post", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-        else:
-            return  redirect(url_for('Error', title = "Error: Can't edit other's posts", msg = "<class 'blog.PostSecurityError'>", back = "Recent"))
-
-    return redirect(url_for("View_Post", post_id = post_id))
-
-@app.route('/post/<int:post_id>/del', methods = ['POST'])
-def Delete_Post(post_id):
-    """Deletes a post by id if user is the post's author"""
-
-    if str(request.form['confirm']).lower() == 'confirm':
-        # Connect to DB
-        with engine.connect() as con:
-            try:
-                statement = text("SELECT author_id from post WHERE (id = :id)")
-                author_id = con.execute(statement, id = post_id).scalar()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Deleting post", msg = type(e), back = "Recent"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-            if not (session['user_id'] == author_id):
-                return redirect(url_for('Error', title = "Error: Can't delete others' posts", msg = "You can't delete others' posts!!!", back = "Recent"))
-
-            # Delete post
-            try:
-                statement = text("DELETE FROM post WHERE id = :id")
-                result = con.execute(statement, id = post_id).rowcount
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Deleting post", msg = type(e), back = "Recent"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-
-            # If update was successful, return to profile
-            # Else throw error
-            if result == 1:
-                return redirect(url_for('Own_Profile'))
-            else:
-                return redirect(url_for('Error', title = "Error: Deleting post", msg = "<class 'blog.UnhandledError'>", back = "Recent"))
-    else:
-        return redirect(url_for('Delete_Post', post_id = post_id))
-
-@app.route('/password', methods = ['POST'])
-def Change_Password():
-    """Changes the current user's password"""
-
-    # Verify the fields have content
-    if not (request.form['passwordOld'] and request.form['passwordNew'] and request.form['passwordConf']):
-        return redirect(url_for('Change_Password_Form', message = "All the fields must be filled in"))
-
-    # Ensure passwords match
-    if request.form['passwordNew'] != request.form['passwordConf']:
-        return redirect(url_for('Change_Password_Form', message = "Passwords do not match"))
-
-    # Connect to DB
-    with engine.connect() as con:
-        # Check if password matches passwordOld
-        try:
-            statement = text("SELECT password FROM user WHERE id = :id")
-            passwordOld = con.execute(statement, id = session['user_id']).scalar()
-        except SQLAlchemyError as e:
-            return redirect(url_for('Error', title = "Error: Deleting password", msg = type(e), back = "Change_Password_Form"))
-        except:
-            return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Change_Password_Form"))
-
-        if passwordOld == request.form['passwordOld']:
-            # Change password
-            try:
-                statement = text("UPDATE user SET password = :password WHERE id = :id")
-                result = con.execute(statement, password = request.form['passwordNew'], id = session['user_id']).rowcount
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Deleting password", msg = type(e), back = "Change_Password_Form"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Change_Password_Form"))
-        else:
-            return redirect(url_for('Change_Password_Form', message = "Incorrect old password"))
-
-    # If update was successful, return to profile
-    # Else throw error
-    if result == 1:
-        return redirect(url_for('Own_Profile'))
-    else:
-        return redirect(url_for('Error', title = "Error: Changing password", msg = "<class 'blog.UnhandledError'>", back = "Change_Password_Form"))
-
-@app.route('/search', methods = ['POST'])
-def Search():
-    """Searches the DB for matching users and posts based on filters and renders them to the search form"""
-
-    # Get the filters and search
-    search = request.form.get('search')
-    filter_all = request.form.get('all')
-    filter_users = request.form.get('users')
-    filter_posts = request.form.get('posts')
-
-    # Verify valid search
-    if len(search) < 3:
-        return redirect(url_for("Search_Form"))
-
-    # Connect to DB
-    with engine.connect() as con:
-        if filter_all == 'true' or (filter_users == 'true' and filter_posts == 'true'):
-            # Get all similar users
-            try:
-                users = User.query.filter(User.username.like(search)).all()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Performing search", msg = type(e), back = "Search_Form"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Search_Form"))
-
-            # Get all similar posts
-            try:
-                posts = Post.query.filter(Post.title.like(search)).all()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Performing search", msg = type(e), back = "Search_Form"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Search_Form"))
-
-            return render_template("search.html", users = users, posts = posts)
-        elif filter_users == 'true':
-            # Get all similar users
-            try:
-                users = User.query.filter(User.username.like(search)).all()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Performing search", msg = type(e), back = "Search_Form"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Search_Form"))
-
-            return render_template("search.html", users = users, posts = None)
-        elif filter_posts == 'true':
-            # Get all similar posts
-            try:
-                posts = Post.query.filter(Post.title.like(search)).all()
-            except SQLAlchemyError as e:
-                return redirect(url_for('Error', title = "Error: Performing search", msg = type(e), back = "Search_Form"))
-            except:
-                return redirect(url_for('Error', title = "Error", msg = "<class 'blog.UnhandledError'>", back = "Search_Form"))
-
-            return render_template("search.html", users = None, posts = posts)
-
 # Run the code in debug mode
 # Remove debug in production
 if __name__ == '__main__':
+    app = create_app()
     app.debug = True
     app.run()
-    app.run(debug = True)
\ No newline at end of file
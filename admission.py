@@ -0,0 +1,164 @@
+from flask import g, request
+from threading import BoundedSemaphore, Lock
+from errors import render_error
+from local_sqlite import LocalSQLite
+import math
+import os
+import random
+import sqlite3
+import time
+
+# Limits of the routes that cost far more than a page read, by endpoint
+# rate: requests per second each client is allowed on average, burst: requests it may make at once
+# concurrency: requests the route handles at a time in each process, queue_timeout: seconds a request waits for one of them
+DEFAULT_LIMITS = {
+    'search.Search': {'rate': 1.0, 'burst': 10, 'concurrency': 4, 'queue_timeout': 1.0},
+    'auth.Login_User': {'rate': 1.0, 'burst': 30, 'concurrency': 8, 'queue_timeout': 2.0},
+    'auth.Register_User': {'rate': 0.2, 'burst': 10, 'concurrency': 4, 'queue_timeout': 2.0}
+}
+
+class MemoryBuckets:
+    """Token buckets of each client kept in this process"""
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self.buckets = {} # (endpoint, client) -> (tokens, time they were counted at, time the bucket is full again)
+        self.lock = Lock()
+
+    def take(self, key, rate, burst):
+        """Takes a token from the client's bucket, returning 0 or the seconds until it has one"""
+
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp, _ = self.buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0
+            if not wait:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+
+            if len(self.buckets) > self.max_clients:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as no bucket
+        for key, (_, _, full_at) in list(self.buckets.items()):
+            if full_at <= now:
+                del self.buckets[key]
+
+        # Past that the buckets closest to full go, down to nine tenths so the next prune is a while off
+        # A flood of new clients mustn't grow the process without bound
+        excess = len(self.buckets) - self.max_clients * 9 // 10
+        if excess > 0:
+            for key in sorted(self.buckets, key = lambda key: self.buckets[key][2])[:excess]:
+                del self.buckets[key]
+
+class SQLiteBuckets:
+    """Token buckets in a local SQLite file, shared by every worker process on the machine"""
+
+    def __init__(self, path):
+        # The buckets only matter for a few seconds, losing them in a crash costs nothing
+        self.file = LocalSQLite(path, timeout = 1.0, schema = [
+            "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL)"
+        ])
+
+    def take(self, key, rate, burst):
+        """Takes a token from the client's bucket, returning 0 or the seconds until it has one"""
+
+        con = self.file.connection()
+        key = '|'.join(key)
+
+        # Wall clock time, since the monotonic clocks of processes don't agree
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT tokens, stamp FROM bucket WHERE (key = ?)", (key,)).fetchone()
+            tokens, stamp = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0, now - stamp) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0
+            con.execute("INSERT OR REPLACE INTO bucket (key, tokens, stamp) VALUES (?, ?, ?)", (key, tokens if wait else tokens - 1, now))
+
+            # Buckets idle for an hour have long refilled, the same as no bucket, and are cleared out now and then
+            if random.random() < 0.001:
+                con.execute("DELETE FROM bucket WHERE (stamp < ?)", (now - 3600,))
+        except:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+        return wait
+
+class AdmissionControl:
+    """Rate limits each client on the expensive routes and caps how many of them run at once"""
+
+    # Rejected requests get a 429 when the client is over its rate and a 503 when the route is at capacity,
+    # both with a Retry-After, so they fail fast instead of tying up the worker threads cheap routes need
+    # The token buckets are shared between processes with ADMISSION_STORE = 'sqlite', the concurrency caps are always per process
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the limits of each endpoint from ADMISSION_LIMITS and hooks them into the requests"""
+
+        app.config.setdefault('ADMISSION_LIMITS', DEFAULT_LIMITS) # Endpoint -> limits, an empty dict disables admission control
+        app.config.setdefault('ADMISSION_STORE', 'memory') # 'memory' or 'sqlite' to share the rate limits between processes
+        app.config.setdefault('ADMISSION_STORE_PATH', os.path.join(app.instance_path, 'admission.db'))
+        app.config.setdefault('ADMISSION_MAX_CLIENTS', 100000) # Clients whose buckets are kept in memory
+
+        self.app = app
+        self.limits = app.config['ADMISSION_LIMITS']
+        self.slots = {endpoint: BoundedSemaphore(limits['concurrency']) for endpoint, limits in self.limits.items() if limits.get('concurrency')}
+
+        store = app.config['ADMISSION_STORE']
+        if store == 'memory':
+            self.buckets = MemoryBuckets(app.config['ADMISSION_MAX_CLIENTS'])
+        elif store == 'sqlite':
+            os.makedirs(os.path.dirname(os.path.abspath(app.config['ADMISSION_STORE_PATH'])), exist_ok = True)
+            self.buckets = SQLiteBuckets(app.config['ADMISSION_STORE_PATH'])
+        else:
+            raise ValueError(f"Unknown admission store: {store}")
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+        app.extensions['admission'] = self
+
+    def client(self):
+        """Identifies the client a request is counted against"""
+
+        # Behind a proxy, remote_addr is the client's once TRUSTED_PROXIES is set, otherwise every client shares the proxy's bucket
+        return request.remote_addr or 'unknown'
+
+    def _admit(self):
+        limits = self.limits.get(request.endpoint)
+        if limits is None:
+            return None
+
+        if limits.get('rate'):
+            try:
+                wait = self.buckets.take((request.endpoint, self.client()), limits['rate'], limits.get('burst', 1))
+            except sqlite3.Error as e:
+                # A busy or broken store lets requests through rather than turning everyone away
+                self.app.logger.warning(f"Checking the rate limit of {request.endpoint} failed, admitting the request: {e}")
+                wait = 0
+
+            if wait:
+                return render_error("Error: 429", "Too many requests, please slow down", status = 429, headers = {'Retry-After': str(math.ceil(wait))})
+
+        # Shed the request once it has queued for longer than queue_timeout
+        slots = self.slots.get(request.endpoint)
+        if slots is not None:
+            timeout = limits.get('queue_timeout', 0)
+            if not slots.acquire(timeout = timeout):
+                return render_error("Error: 503", "The server is busy, please try again in a moment", status = 503, headers = {'Retry-After': str(max(1, math.ceil(timeout)))})
+            g.admission_slots = slots
+
+        return None
+
+    def _release(self, exc):
+        # Runs once the response has been sent, streamed ones included
+        slots = g.pop('admission_slots', None)
+        if slots is not None:
+            slots.release()
@@ -0,0 +1,11 @@
+"""Entry point for ASGI servers, so slow clients wait on the event loop instead of holding the app's threads
+
+Usage: uvicorn asgi:app --workers 4 --no-access-log
+Behind a reverse proxy set TRUSTED_PROXIES=1 (or the number of proxies), so clients are rate limited by their own address
+"""
+
+from App import create_app, preload
+from asgi_bridge import ASGIBridge
+
+app = ASGIBridge(create_app())
+preload(app.app)
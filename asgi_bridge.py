@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from io import BytesIO
+from threading import Event
+import asyncio
+import sys
+
+class ASGIBridge:
+    """Serves the WSGI app to an ASGI server, with the clients' I/O on the event loop and the app on a bounded thread pool"""
+
+    # A WSGI server's threads read each request and write each response, so slow clients hold them as long as they like
+    # Here the server reads the whole request before a thread is taken, and the response is queued to the loop as it
+    # renders, so a thread is only held for the time the app runs and cheap routes never wait behind slow clients
+    # The queue is bounded, a page larger than it holds its thread until the client has read all but the last of it,
+    # so a streamed page never sits whole in memory
+    # Flask 1.1 views and SQLAlchemy 1.3 are synchronous, so the app itself still runs on threads
+
+    def __init__(self, app):
+        self.app = app
+        app.config.setdefault('ASGI_THREADS', 8) # Requests the app handles at a time
+        app.config.setdefault('ASGI_MAX_BODY_SIZE', 1024 * 1024) # Bytes, larger request bodies get a 413
+        app.config.setdefault('ASGI_QUEUE_SIZE', 16) # Response pieces queued for a client before the app thread waits
+
+        self.max_body_size = app.config['ASGI_MAX_BODY_SIZE']
+        self.queue_size = app.config['ASGI_QUEUE_SIZE']
+        self.executor = ThreadPoolExecutor(app.config['ASGI_THREADS'], thread_name_prefix = 'asgi')
+        app.extensions['asgi_bridge'] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Lets the requests still running finish, the extensions write what they hold at exit
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        # Read the whole body first, a slow upload only holds a coroutine
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if len(body) > self.max_body_size:
+                await send({'type': 'http.response.start', 'status': 413, 'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+                await send({'type': 'http.response.body', 'body': b'Request body too large'})
+                return
+            if not message.get('more_body'):
+                break
+
+        # The response is handed over piece by piece, the thread waits while the queue is full
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        disconnected = Event()
+
+        def put(message):
+            pending = asyncio.run_coroutine_threadsafe(queue.put(message), loop)
+            while True:
+                try:
+                    return pending.result(timeout = 1.0)
+                except TimeoutError:
+                    # Nothing reads the queue once the request has been cancelled
+                    if disconnected.is_set():
+                        pending.cancel()
+                        return
+
+        environ = self.environ(scope, bytes(body))
+        future = loop.run_in_executor(self.executor, self.run, environ, put, disconnected)
+        watcher = loop.create_task(self.watch(receive, disconnected))
+
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                # The rest of the response is drained so the thread is never left waiting on the queue
+                if not disconnected.is_set():
+                    await send(message)
+        finally:
+            watcher.cancel()
+            disconnected.set()
+
+            # Surfaces errors raised outside the app's own handlers, and the thread always finishes its request
+            await future
+
+    async def watch(self, receive, disconnected):
+        """Flags the request once the client has gone, so the app stops rendering a response no one will read"""
+
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    def run(self, environ, put, disconnected):
+        """Calls the app on a pool thread, putting the ASGI messages of its response until the client disconnects"""
+
+        # Everything runs on this one thread, the request context of a streamed page is only valid here
+        started = []
+
+        def start_response(status, headers, exc_info = None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+
+        def start():
+            status, headers = started
+            put({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            })
+
+        sent = False
+        try:
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if disconnected.is_set():
+                        break
+                    if not chunk:
+                        continue
+                    if not sent:
+                        start()
+                        sent = True
+                    put({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+            finally:
+                # Runs the teardowns of streamed pages, and closes the generator of one cut short
+                if hasattr(result, 'close'):
+                    result.close()
+
+            if not sent:
+                start()
+            put({'type': 'http.response.body', 'body': b''})
+        except Exception:
+            if not sent:
+                put({'type': 'http.response.start', 'status': 500, 'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+                put({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            raise
+        finally:
+            put(None)
+
+    def environ(self, scope, body):
+        """Builds the WSGI environ of an ASGI HTTP request"""
+
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+
+        # Some servers include the root path in the path, as WSGI servers don't
+        root_path, path = scope.get('root_path', ''), scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+
+        for name, value in scope.get('headers', ()):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                # Repeated headers are joined as a WSGI server joins them, HTTP/2 sends each cookie on its own
+                key = 'HTTP_' + name
+                if key in environ:
+                    value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+                environ[key] = value
+        return environ
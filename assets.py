@@ -0,0 +1,378 @@
+from base64 import b64encode
+from hashlib import md5, sha384
+from io import BytesIO
+from urllib.parse import urljoin, urlsplit
+from urllib.request import urlopen
+import gzip
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None # Brotli siblings are skipped without it
+
+try:
+    from PIL import Image
+    try:
+        import pillow_avif # noqa: F401, registers AVIF with Pillow versions that don't support it themselves
+    except ImportError:
+        pass
+except ImportError:
+    Image = None # WebP and AVIF variants are skipped without Pillow
+
+# The files layout.html loads from CDNs when no bundle has been built, with their subresource integrity hashes
+# Stylesheets also get the fonts they reference, which have no published hashes
+VENDOR = [
+    ('css/bootstrap.min.css', 'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css', 'sha384-JcKb8q3iqJ61gNV9KGb8thSsNjpSL0n8PARn9HuZOnIxN0hoP+VmmDGMN5t9UJ0Z'),
+    ('css/fontawesome.css', 'https://use.fontawesome.com/releases/v5.15.1/css/all.css', 'sha384-vp86vTRFVJgpjF9jiIGPEEqYqlDwgyBgEF109VFjmqGmIY/Y4HV4d3Gp2irVfcrp'),
+    ('js/jquery.slim.min.js', 'https://code.jquery.com/jquery-3.5.1.slim.min.js', 'sha384-DfXdz2htPH0lsSSs5nCTpuj/zy4C+OGpamoFVy38MVBnE+IbbVYUew+OrCXaRkfj'),
+    ('js/bootstrap.bundle.min.js', 'https://cdn.jsdelivr.net/npm/bootstrap@4.5.3/dist/js/bootstrap.bundle.min.js', 'sha384-ho+j7jyWK8fNQe+A12Hb8AhRq26LrZ/JpcUGGOn+Y7RsweNrtN/tE3MoK7ZeZDyx')
+]
+
+# The bundles are built from the vendored files in this order, followed by the app's own
+CSS_BUNDLE = ('css/bundle.css', ['css/bootstrap.min.css', 'css/fontawesome.css'], 'css/styles.css')
+JS_BUNDLE = ('js/bundle.js', ['js/jquery.slim.min.js', 'js/bootstrap.bundle.min.js'], 'js/main.js')
+
+# Bootstrap's scripts add these to the markup, so no template mentions them
+STATE_CLASSES = ['show', 'fade', 'collapse', 'collapsing', 'collapsed', 'active', 'focus', 'disabled', 'was-validated', 'is-valid', 'is-invalid']
+
+# Every browser we support reads WOFF2 or WOFF, the EOT, TrueType and SVG fallbacks only add weight
+FONT_FORMATS = ('.woff2', '.woff')
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.webmanifest', '.ico', '.txt')
+IMAGE_VARIANTS = [('image/avif', 'AVIF', '.avif'), ('image/webp', 'WEBP', '.webp')]
+
+URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+TOKEN_RE = re.compile(r'[\w-]+')
+CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+LICENSE_RE = re.compile(r'/\*!.*?\*/', re.S)
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+
+class AssetError(Exception):
+    """Raised when the assets can't be vendored or built"""
+
+def integrity(data):
+    """Returns the subresource integrity hash of the data"""
+
+    return 'sha384-' + b64encode(sha384(data).digest()).decode()
+
+def fetch(url):
+    try:
+        with urlopen(url, timeout = 30) as response:
+            return response.read()
+    except OSError as e:
+        raise AssetError(f"Couldn't download {url}: {e}") from e
+
+def vendor(folder, log = print):
+    """Downloads the CDN files into folder, failing if any doesn't match its integrity hash"""
+
+    for path, url, expected in VENDOR:
+        data = fetch(url)
+        if integrity(data) != expected:
+            raise AssetError(f"{url} doesn't match its integrity hash {expected}")
+        write(os.path.join(folder, path), data)
+        log(f"Vendored {path}")
+
+        if path.endswith('.css'):
+            for ref in set(match.group(2) for match in URL_RE.finditer(data.decode())):
+                ref = urlsplit(ref).path
+                if ref.endswith(FONT_FORMATS):
+                    write(os.path.normpath(os.path.join(folder, os.path.dirname(path), ref)), fetch(urljoin(url, ref)))
+                    log(f"Vendored {os.path.normpath(os.path.join(os.path.dirname(path), ref))}")
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+def read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+# Parse just enough CSS to drop the rules no page can match
+def split_top(value, separator):
+    """Splits value on separator outside of brackets and strings"""
+
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(value):
+        if quote:
+            if char == quote and value[i - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(value[start:i])
+            start = i + 1
+    parts.append(value[start:])
+    return parts
+
+def split_rules(css):
+    """Splits a stylesheet into its top level (prelude, body) rules, body is None for statements like @import"""
+
+    rules, depth, quote, start, opened = [], 0, None, 0, 0
+    for i, char in enumerate(css):
+        if quote:
+            if char == quote and css[i - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            if depth == 0:
+                opened = i
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((css[start:opened].strip(), css[opened + 1:i]))
+                start = i + 1
+        elif char == ';' and depth == 0:
+            rules.append((css[start:i].strip(), None))
+            start = i + 1
+    return rules
+
+def at_keyword(prelude):
+    match = re.match(r'@(-\w+-)?([\w-]+)', prelude)
+    return match.group(2).lower() if match else None
+
+def selector_used(selector, used):
+    """Whether every class the selector needs appears somewhere in the templates or scripts"""
+
+    # Classes in :not() and attribute values don't have to be present for the selector to match
+    needed = re.sub(r':not\([^)]*\)|\[[^\]]*\]', '', selector)
+    return all(name in used for name in CLASS_RE.findall(needed))
+
+def purge_css(css, used):
+    """Drops the rules whose selectors all need a class that is never used"""
+
+    kept = []
+    for prelude, body in split_rules(css):
+        if body is None:
+            kept.append(prelude + ';')
+        elif at_keyword(prelude) in ('media', 'supports', 'document'):
+            inner = purge_css(body, used)
+            if inner:
+                kept.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith('@'):
+            kept.append(f"{prelude}{{{body}}}")
+        else:
+            selectors = [selector.strip() for selector in split_top(prelude, ',') if selector_used(selector, used)]
+            if selectors:
+                kept.append(f"{','.join(selectors)}{{{body}}}")
+    return ''.join(kept)
+
+def prune_at_rules(css, elsewhere = ''):
+    """Drops the fonts and animations no remaining rule, here or elsewhere, refers to, and the font formats we don't serve"""
+
+    rules = split_rules(css)
+    rest = elsewhere + ''.join(f"{prelude}{{{body}}}" for prelude, body in rules if body is not None and at_keyword(prelude) not in ('font-face', 'keyframes'))
+
+    kept = []
+    for prelude, body in rules:
+        keyword = at_keyword(prelude) if body is not None else None
+        if keyword == 'font-face':
+            family = re.search(r'font-family:\s*([^;]+)', body)
+            if family and family.group(1).strip().strip('"\'') not in rest:
+                continue
+            body = trim_font_sources(body)
+        elif keyword == 'keyframes':
+            name = prelude.split(None, 1)[-1].strip()
+            if not re.search(r'(?<![\w-])' + re.escape(name) + r'(?![\w-])', rest):
+                continue
+        kept.append(prelude + ';' if body is None else f"{prelude}{{{body}}}")
+    return ''.join(kept)
+
+def trim_font_sources(body):
+    declarations = []
+    for declaration in split_top(body, ';'):
+        name, _, value = declaration.partition(':')
+        if name.strip() == 'src':
+            sources = [source for source in split_top(value, ',') if any(re.search(re.escape(font) + r'\b', source) for font in FONT_FORMATS)]
+            if not sources:
+                continue
+            declaration = f"src:{','.join(source.strip() for source in sources)}"
+        declarations.append(declaration)
+    return ';'.join(declarations)
+
+def minify_css(css):
+    css = COMMENT_RE.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    # Spaces around colons are left alone, in selectors like ".a :hover" they are a descendant combinator
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+def minify_js(js):
+    # Only whole line comments, indentation and blank lines go, so automatic semicolon insertion still sees every line break
+    lines = (line.strip() for line in COMMENT_RE.sub('', js).splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+class Builder:
+    """Writes fingerprinted files into the dist folder and records them for the manifest"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.files = {} # logical name -> path in the static folder
+        self.served = {} # path in the static folder -> {'encodings': [...], 'variants': {mimetype: path}}
+        self.emitted = {} # source path -> path in the static folder
+
+    def emit(self, name, data):
+        """Writes data under a content hashed name and its compressed siblings, returning its path in the static folder"""
+
+        stem, ext = os.path.splitext(name)
+        path = f"dist/{stem}.{md5(data).hexdigest()[:12]}{ext}"
+        write(os.path.join(self.static_folder, path), data)
+        self.served[path] = {'encodings': self.compress(path, data) if ext in COMPRESSIBLE else [], 'variants': {}}
+        return path
+
+    def emit_file(self, source, name):
+        if source not in self.emitted:
+            self.emitted[source] = self.emit(name, read(source))
+        return self.emitted[source]
+
+    def compress(self, path, data):
+        full = os.path.join(self.static_folder, path)
+        encodings = []
+
+        # mtime = 0 keeps the gzip output identical between builds of the same file
+        compressed = brotli.compress(data, quality = 11) if brotli else None
+        if compressed and len(compressed) < len(data):
+            write(full + '.br', compressed)
+            encodings.append('br')
+
+        compressed = gzip.compress(data, 9, mtime = 0)
+        if len(compressed) < len(data):
+            write(full + '.gz', compressed)
+            encodings.append('gzip')
+
+        return encodings
+
+    def variants(self, path, name, source):
+        """Writes the AVIF and WebP versions of an image that come out smaller than it"""
+
+        if Image is None:
+            return
+
+        Image.init()
+        size = os.path.getsize(source)
+        for mimetype, format, ext in IMAGE_VARIANTS:
+            if format not in Image.SAVE:
+                continue
+
+            with Image.open(source) as image:
+                buffer = BytesIO()
+                # PNGs keep every pixel, photos are re-encoded lossily
+                options = {'lossless': True} if image.format == 'PNG' and format == 'WEBP' else {'quality': 80}
+                image.save(buffer, format, **options)
+
+            if buffer.tell() < size:
+                self.served[path]['variants'][mimetype] = self.emit(os.path.splitext(name)[0] + ext, buffer.getvalue())
+
+    def rewrite_urls(self, css, source):
+        """Points the stylesheet's relative url()s at fingerprinted copies of the files"""
+
+        def replace(match):
+            ref = match.group(2)
+            if ref.startswith(('data:', 'http:', 'https:', '//', '#')):
+                return match.group(0)
+
+            target = os.path.normpath(os.path.join(os.path.dirname(source), urlsplit(ref).path))
+            if not os.path.exists(target):
+                return match.group(0)
+
+            # Vendored fonts go next to the bundle, the app's own files keep their place in the static folder
+            if target.startswith(self.static_folder + os.sep):
+                name = os.path.relpath(target, self.static_folder).replace(os.sep, '/')
+            else:
+                name = 'fonts/' + os.path.basename(target)
+            path = self.emit_file(target, name)
+            return f"url({os.path.relpath(path, 'dist/css').replace(os.sep, '/')})"
+
+        return URL_RE.sub(replace, css)
+
+def used_tokens(app, scripts):
+    """Every word in the templates and the app's scripts, a superset of the classes any page can use"""
+
+    # The vendored scripts aren't scanned, they name every class of every component
+    tokens = set(STATE_CLASSES) | set(app.config['ASSET_PURGE_SAFELIST'])
+    for name in app.jinja_env.list_templates():
+        source = app.jinja_env.loader.get_source(app.jinja_env, name)[0]
+        tokens.update(TOKEN_RE.findall(source))
+    for script in scripts:
+        tokens.update(TOKEN_RE.findall(script))
+    return tokens
+
+def build(app, vendor_folder, clean = False, log = print):
+    """Builds the bundles, fingerprinted copies of the static files and the manifest url_for resolves through"""
+
+    static_folder = app.static_folder
+    dist = os.path.join(static_folder, 'dist')
+    manifest_path = app.config['ASSET_MANIFEST']
+    if not manifest_path:
+        raise AssetError("ASSET_MANIFEST is None, so nothing would serve the built files")
+
+    missing = [path for path, _, _ in VENDOR if not os.path.exists(os.path.join(vendor_folder, path))]
+    if missing:
+        raise AssetError(f"{', '.join(missing)} haven't been vendored, run flask vendor-assets where the CDNs can be reached")
+
+    # Older builds are kept by default so pages rendered before a deploy can still load their files
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    builder = Builder(static_folder)
+
+    # Bundle and minify the scripts, the vendored ones are already minified
+    name, vendored, own = JS_BUNDLE
+    scripts = [read(os.path.join(vendor_folder, path)).decode() for path in vendored]
+    main = read(os.path.join(static_folder, own)).decode()
+    builder.files[name] = builder.emit(name, ';\n'.join(scripts + [minify_js(main)]).encode())
+
+    # Tree-shake the vendored stylesheets against the templates and our script, then bundle them with ours
+    used = used_tokens(app, [main])
+    name, vendored, own = CSS_BUNDLE
+    licenses, sheets = [], []
+    for path in vendored + [own]:
+        source = os.path.join(vendor_folder if path in vendored else static_folder, path)
+        css = read(source).decode()
+        licenses.extend(LICENSE_RE.findall(css))
+        css = minify_css(css)
+        sheets.append((source, purge_css(css, used) if path in vendored else css))
+
+    # Fonts and animations are dropped before their files are copied, so unused fonts aren't written at all
+    css = ''
+    for i, (source, sheet) in enumerate(sheets):
+        elsewhere = ''.join(other for j, (_, other) in enumerate(sheets) if j != i)
+        css += builder.rewrite_urls(prune_at_rules(sheet, elsewhere), source)
+    builder.files[name] = builder.emit(name, ('\n'.join(licenses) + '\n' + css).encode())
+
+    # Fingerprint every other static file, with compressed siblings and smaller image formats
+    for root, folders, files in os.walk(static_folder):
+        folders[:] = [folder for folder in folders if os.path.join(root, folder) != dist]
+        for file in files:
+            source = os.path.join(root, file)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            path = builder.emit_file(source, name)
+            builder.files[name] = path
+            if os.path.splitext(file)[1].lower() in ('.jpg', '.jpeg', '.png'):
+                builder.variants(path, name, source)
+
+    # Replace the manifest in one step, running servers pick it up on their next url_for
+    manifest = {'files': builder.files, 'served': builder.served}
+    write(manifest_path + '.tmp', json.dumps(manifest, indent = 2, sort_keys = True).encode())
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    for name, path in sorted(builder.files.items()):
+        info = builder.served[path]
+        extras = info['encodings'] + sorted(os.path.splitext(variant)[1][1:] for variant in info['variants'].values())
+        log(f"{name} -> {path} ({os.path.getsize(os.path.join(static_folder, path))} bytes{', ' if extras else ''}{', '.join(extras)})")
+
+    if brotli is None:
+        log("brotli isn't installed, skipped the .br files")
+    if Image is None:
+        log("Pillow isn't installed, skipped the WebP and AVIF images")
+
+    return manifest
@@ -0,0 +1,351 @@
+"""Load-tests every route of the blog against a seeded database
+
+Usage: python benchmarks/bench.py --database bench.db --output results.json [--baseline baseline.json]
+
+Each scenario runs through the Flask test client (no network, one request at a time)
+and through a local multi-threaded WSGI server driven by concurrent clients.
+The scenarios run against a copy of the database, so the writes they make never reach the seeded one.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from flask import g
+from http.cookiejar import CookieJar
+from threading import Lock, Thread
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+import urllib.request
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from seed import PASSWORD, WORDS, open_app
+from sqlalchemy.sql import text
+
+class Scenario:
+    """One kind of request, with a generator for its path and form data"""
+
+    def __init__(self, name, method, path, data = None, login = False):
+        self.name = name
+        self.method = method
+        self.path = path # Callable taking (rng, stats) and returning the path
+        self.data = data # Callable taking (rng, stats) and returning the form data
+        self.login = login # False, True for a random user, or 'author' for the author of stats['own_post']
+
+    def build(self, rng, stats):
+        return self.path(rng, stats), self.data(rng, stats) if self.data else None
+
+def database_stats(app):
+    """Reads the id ranges the scenarios pick random rows from"""
+
+    from extensions import db
+
+    with app.app_context(), db.engine.connect() as con:
+        posts = con.execute(text("SELECT MIN(id), MAX(id) FROM post")).first()
+        users = con.execute(text('SELECT MIN(id), MAX(id) FROM "user"')).first()
+        own_post = con.execute(text("SELECT id, author_id FROM post ORDER BY id DESC LIMIT 1")).first()
+
+    return {
+        'min_post': posts[0] or 1, 'max_post': posts[1] or 1,
+        'min_user': users[0] or 1, 'max_user': users[1] or 1,
+        'own_post': tuple(own_post) if own_post else (1, 1)
+    }
+
+def client_rng(seed_value, mode, index = 0):
+    """Returns the random numbers of one client, different for every mode and thread so their registrations don't collide"""
+
+    return random.Random(f'{seed_value}-{mode}-{index}')
+
+def copy_database(source, target):
+    """Copies a SQLite database, its write-ahead log included"""
+
+    with closing(sqlite3.connect(source)) as original, closing(sqlite3.connect(target)) as copy:
+        original.backup(copy)
+
+def random_post(rng, stats):
+    return rng.randint(stats['min_post'], stats['max_post'])
+
+def random_user(rng, stats):
+    return f"user{rng.randint(stats['min_user'], stats['max_user']) - 1}"
+
+def login_email(rng, stats, login):
+    # Seeded usernames are numbered from 0 while ids start at 1
+    user_id = stats['own_post'][1] if login == 'author' else rng.randint(stats['min_user'], stats['max_user'])
+    return user_id, f"user{user_id - 1}@example.com"
+
+def scenarios():
+    """Returns a scenario for every route of the app"""
+
+    return [
+        Scenario('GET /', 'GET', lambda rng, s: '/'),
+        Scenario('GET /login', 'GET', lambda rng, s: '/login'),
+        Scenario('GET /register', 'GET', lambda rng, s: '/register'),
+        Scenario('GET /search', 'GET', lambda rng, s: '/search'),
+        Scenario('GET /error', 'GET', lambda rng, s: '/error?title=Error&msg=Benchmark'),
+        Scenario('GET /recent', 'GET', lambda rng, s: '/recent'),
+        Scenario('GET /recent (deep page)', 'GET', lambda rng, s: f'/recent?before={random_post(rng, s)}'),
+        Scenario('GET /trending', 'GET', lambda rng, s: '/trending'),
+        Scenario('GET /authors', 'GET', lambda rng, s: '/authors'),
+        Scenario('GET /atom.xml', 'GET', lambda rng, s: '/atom.xml'),
+        Scenario('GET /profile/<username>/atom.xml', 'GET', lambda rng, s: f'/profile/{random_user(rng, s)}/atom.xml'),
+        Scenario('GET /sitemap.xml', 'GET', lambda rng, s: '/sitemap.xml'),
+        Scenario('GET /sitemaps/posts-0.xml', 'GET', lambda rng, s: '/sitemaps/posts-0.xml'),
+        Scenario('GET /feed', 'GET', lambda rng, s: f'/feed?before={random_post(rng, s)}'),
+        Scenario('GET /post/<id>', 'GET', lambda rng, s: f'/post/{random_post(rng, s)}'),
+        Scenario('GET /profile/<username>', 'GET', lambda rng, s: f'/profile/{random_user(rng, s)}'),
+        Scenario('GET /profile', 'GET', lambda rng, s: '/profile', login = True),
+        Scenario('GET /post/new', 'GET', lambda rng, s: '/post/new', login = True),
+        Scenario('GET /password', 'GET', lambda rng, s: '/password', login = True),
+        Scenario('GET /post/<id>/del', 'GET', lambda rng, s: f'/post/{random_post(rng, s)}/del', login = True),
+        Scenario('POST /search', 'POST', lambda rng, s: '/search',
+                 lambda rng, s: {'search': ' '.join(rng.sample(WORDS, 2)), 'all': 'true'}),
+        Scenario('POST /login', 'POST', lambda rng, s: '/login',
+                 lambda rng, s: {'email': f"{random_user(rng, s)}@example.com", 'password': PASSWORD}),
+        Scenario('POST /register', 'POST', lambda rng, s: '/register',
+                 lambda rng, s: {'username': f'bench{rng.getrandbits(48)}', 'email': f'bench{rng.getrandbits(48)}@example.com', 'password': PASSWORD, 'passwordConf': PASSWORD}),
+        Scenario('POST /post/new', 'POST', lambda rng, s: '/post/new',
+                 lambda rng, s: {'title': 'Benchmark post', 'content': ' '.join(rng.choice(WORDS) for _ in range(200))}, login = True),
+        Scenario('POST /post/<id>', 'POST', lambda rng, s: f"/post/{s['own_post'][0]}",
+                 lambda rng, s: {'title': 'Benchmark edit', 'content': ' '.join(rng.choice(WORDS) for _ in range(200))}, login = 'author'),
+        Scenario('POST /profile', 'POST', lambda rng, s: '/profile',
+                 lambda rng, s: {'about': ' '.join(rng.choice(WORDS) for _ in range(30))}, login = True),
+        Scenario('POST /password', 'POST', lambda rng, s: '/password',
+                 lambda rng, s: {'passwordOld': PASSWORD, 'passwordNew': PASSWORD, 'passwordConf': PASSWORD}, login = True),
+    ]
+
+class StatementRecorder:
+    """Records how many SQL statements each request issued, from the app's query counter"""
+
+    def __init__(self, app):
+        self.lock = Lock()
+        self.counts = []
+        # Teardown runs after a streamed response has been sent, so its statements are counted too
+        app.teardown_request(self.record)
+
+    def record(self, exc):
+        with self.lock:
+            self.counts.append(g.get('query_count', 0))
+
+    def take(self):
+        with self.lock:
+            counts, self.counts = self.counts, []
+        return counts
+
+def summarize(latencies, elapsed, statements, errors):
+    """Turns raw timings into the reported figures, latencies in milliseconds"""
+
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'statements_per_request': round(sum(statements) / len(statements), 2) if statements else None
+    }
+
+def run_client(app, scenario, stats, requests, rng, recorder):
+    """Runs a scenario sequentially through the Flask test client"""
+
+    client = app.test_client()
+    if scenario.login:
+        with client.session_transaction() as session:
+            session['user_id'] = login_email(rng, stats, scenario.login)[0]
+
+    latencies, errors = [], 0
+    recorder.take()
+    started = time.perf_counter()
+
+    for _ in range(requests):
+        path, data = scenario.build(rng, stats)
+        start = time.perf_counter()
+        response = client.open(path, method = scenario.method, data = data)
+        # Streamed pages render as their body is read
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400 or '/error' in (response.location or ''):
+            errors += 1
+
+    return summarize(latencies, time.perf_counter() - started, recorder.take(), errors)
+
+def run_server(base_url, scenario, stats, requests, threads, seed_value, recorder):
+    """Runs a scenario through the WSGI server with concurrent clients"""
+
+    lock = Lock()
+    latencies, failures = [], []
+
+    # Every client gets its own cookies, logged in before the clock starts if the scenario needs it
+    openers = []
+    for index in range(threads):
+        rng = client_rng(seed_value, 'server', index)
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+        if scenario.login:
+            login = urlencode({'email': login_email(rng, stats, scenario.login)[1], 'password': PASSWORD}).encode()
+            try:
+                opener.open(base_url + '/login', login).close()
+            except HTTPError:
+                pass # The redirect to the profile, the session cookie is already set
+        openers.append((rng, opener))
+
+    def client(index):
+        rng, opener = openers[index]
+
+        for _ in range(requests // threads):
+            path, data = scenario.build(rng, stats)
+            body = urlencode(data).encode() if data is not None else None
+            start = time.perf_counter()
+            failed = False
+            try:
+                with opener.open(base_url + path, body) as response:
+                    response.read()
+            except HTTPError as e:
+                # Redirects surface as errors too since they aren't followed
+                failed = e.code >= 400 or '/error' in (e.headers.get('Location') or '')
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                failures.append(failed)
+
+    recorder.take()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(client, range(threads)))
+
+    return summarize(latencies, time.perf_counter() - started, recorder.take(), sum(failures))
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Reports redirects instead of following them, so each request is measured on its own"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def start_server(app):
+    """Starts a threaded WSGI server on a free local port and returns its URL"""
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded = True, request_handler = QuietHandler)
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def compare(results, baseline, threshold):
+    """Prints how the results moved against a baseline and returns the regressions"""
+
+    regressions = []
+    for name, modes in results['scenarios'].items():
+        for mode, current in modes.items():
+            previous = baseline.get('scenarios', {}).get(name, {}).get(mode)
+            if not previous or not previous.get('p95_ms') or not current.get('p95_ms'):
+                continue
+
+            change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms']
+            marker = ''
+            if change > threshold:
+                marker = '  REGRESSION'
+                regressions.append((name, mode, change))
+            print(f"{name:32} {mode:7} p95 {previous['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({change:+.0%}){marker}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load-tests every route of the blog")
+    parser.add_argument('--database', default = 'bench.db', help = "Database seeded with benchmarks/seed.py")
+    parser.add_argument('--requests', type = int, default = 200, help = "Requests per scenario and mode")
+    parser.add_argument('--threads', type = int, default = 8, help = "Concurrent clients against the WSGI server")
+    parser.add_argument('--mode', choices = ['client', 'server', 'both'], default = 'both')
+    parser.add_argument('--only', help = "Only run scenarios whose name contains this")
+    parser.add_argument('--no-cache', action = 'store_true', help = "Disable the rendered page cache")
+    parser.add_argument('--admission', action = 'store_true', help = "Keep the rate limits and concurrency caps, which turn most of a single client's POSTs away")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = "Write the results to this JSON file")
+    parser.add_argument('--baseline', help = "Compare against the results in this JSON file")
+    parser.add_argument('--threshold', type = float, default = 0.2, help = "p95 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} doesn't exist, create it with benchmarks/seed.py")
+
+    # The write scenarios register users and add posts, on a copy so every run starts from the same seeded data
+    # Feeds are written next to the copy and go with it
+    workspace = tempfile.TemporaryDirectory(prefix = 'bench-')
+    database = os.path.join(workspace.name, 'bench.db')
+    copy_database(args.database, database)
+
+    config = {'MAX_QUERIES_PER_REQUEST': None, 'FEEDS_FOLDER': database + '.feeds'}
+    if args.no_cache:
+        config['PAGE_CACHE_BACKEND'] = None
+    if not args.admission:
+        config['ADMISSION_LIMITS'] = {}
+    app = open_app(database, **config)
+
+    stats = database_stats(app)
+    recorder = StatementRecorder(app)
+    server, base_url = start_server(app) if args.mode != 'client' else (None, None)
+
+    results = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': stats,
+            'requests': args.requests,
+            'threads': args.threads,
+            'page_cache': not args.no_cache,
+            'admission': args.admission
+        },
+        'scenarios': {}
+    }
+
+    for scenario in scenarios():
+        if args.only and args.only not in scenario.name:
+            continue
+
+        modes = {}
+        if args.mode in ('client', 'both'):
+            modes['client'] = run_client(app, scenario, stats, args.requests, client_rng(args.seed, 'client'), recorder)
+        if args.mode in ('server', 'both'):
+            modes['server'] = run_server(base_url, scenario, stats, args.requests, args.threads, args.seed, recorder)
+        results['scenarios'][scenario.name] = modes
+
+        for mode, figures in modes.items():
+            print(f"{scenario.name:32} {mode:7} p50 {figures['p50_ms']:8.2f} p95 {figures['p95_ms']:8.2f} p99 {figures['p99_ms']:8.2f} ms "
+                  f"{figures['throughput_rps']:8.1f} req/s {figures['statements_per_request'] or 0:6.2f} SQL/req {figures['errors']} errors")
+
+    if server is not None:
+        server.shutdown()
+    with app.app_context():
+        from extensions import db
+        db.engine.dispose()
+    workspace.cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
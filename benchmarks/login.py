@@ -0,0 +1,121 @@
+"""Measures login throughput at a fixed password hashing cost factor
+
+Usage: python benchmarks/login.py --database bench.db --cost 14 --workers 1 2 4 --threads 16
+
+Logs seeded users in through a local multi-threaded WSGI server, once per worker pool size,
+and reports latency, throughput and how many logins were turned away with a 503.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+import urllib.request
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from seed import PASSWORD, open_app
+from bench import NoRedirect, start_server, summarize
+from sqlalchemy.sql import text
+
+def configure(app, cost, workers, queue_timeout):
+    """Restarts the app's password pool with the given cost factor and size"""
+
+    from extensions import passwords
+
+    app.config['PASSWORD_HASH_N'] = 2 ** cost
+    app.config['PASSWORD_WORKERS'] = workers
+    app.config['PASSWORD_QUEUE_TIMEOUT'] = queue_timeout
+    app.extensions['passwords'].executor.shutdown()
+    passwords.init_app(app)
+
+def hash_users(app, users):
+    """Stores a current hash for the first users so logins don't measure the plaintext upgrade"""
+
+    from extensions import db, passwords
+
+    with app.app_context(), db.engine.begin() as con:
+        hashed = passwords.hash(PASSWORD)
+        con.execute(text('UPDATE "user" SET password = :password WHERE id <= :users'), password = hashed, users = users)
+
+def run_logins(base_url, users, requests, threads, seed_value):
+    """Logs random users in with concurrent clients, every login on a fresh session"""
+
+    lock = Lock()
+    latencies, failures, busy = [], [], []
+    opener = urllib.request.build_opener(NoRedirect())
+
+    def client(index):
+        rng = random.Random(seed_value * 1000 + index)
+
+        for _ in range(requests // threads):
+            # Seeded user n has id n + 1, so these are the users hash_users updated
+            body = urlencode({'email': f'user{rng.randrange(users)}@example.com', 'password': PASSWORD}).encode()
+            start = time.perf_counter()
+            status = 200
+            try:
+                with opener.open(base_url + '/login', body) as response:
+                    response.read()
+            except HTTPError as e:
+                # A successful login is a redirect to the profile, anything else is a failure
+                status = 302 if (e.headers.get('Location') or '').endswith('/profile') else e.code
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                failures.append(status != 302)
+                busy.append(status == 503)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(client, range(threads)))
+
+    result = summarize(latencies, time.perf_counter() - started, [], sum(failures))
+    result['rejected_503'] = sum(busy)
+    del result['statements_per_request']
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measures login throughput at a fixed password hashing cost factor")
+    parser.add_argument('--database', default = 'bench.db', help = "Database seeded with benchmarks/seed.py")
+    parser.add_argument('--cost', type = int, default = 14, help = "scrypt cost factor as a power of two")
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4], help = "Password pool sizes to compare")
+    parser.add_argument('--queue-timeout', type = float, default = 2.0, help = "Seconds a login waits for a worker")
+    parser.add_argument('--users', type = int, default = 100, help = "How many seeded users log in")
+    parser.add_argument('--requests', type = int, default = 200, help = "Logins per pool size")
+    parser.add_argument('--threads', type = int, default = 16, help = "Concurrent clients")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = "Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} doesn't exist, create it with benchmarks/seed.py")
+
+    # Every login comes from one address, the rate limits would turn most away and measure themselves
+    app = open_app(args.database, MAX_QUERIES_PER_REQUEST = None, ADMISSION_LIMITS = {})
+    server, base_url = start_server(app)
+
+    results = {'cost': args.cost, 'threads': args.threads, 'cpus': os.cpu_count(), 'workers': {}}
+    try:
+        configure(app, args.cost, max(args.workers), args.queue_timeout)
+        hash_users(app, args.users)
+
+        for workers in args.workers:
+            configure(app, args.cost, workers, args.queue_timeout)
+            result = run_logins(base_url, args.users, args.requests, args.threads, args.seed)
+            results['workers'][workers] = result
+            print(f"{workers:3} workers  {result['throughput_rps']:8.1f} logins/s  p50 {result['p50_ms']:9.2f} ms  "
+                  f"p95 {result['p95_ms']:9.2f} ms  503s {result['rejected_503']}  errors {result['errors']}")
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Seeds a synthetic blog database for the benchmarks
+
+Usage: python benchmarks/seed.py --database bench.db --users 10000 --posts 1000000
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import os
+import random
+import sys
+import time
+
+# Seeded users all share this password so the benchmarks can log in as any of them
+PASSWORD = 'password'
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore "
+         "magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+         "consequat duis aute irure in reprehenderit voluptate velit esse cillum eu fugiat nulla pariatur python "
+         "flask blog post search feed profile database index query cache latency throughput").split()
+
+def sentence(rng, low, high):
+    """Returns between low and high random words"""
+
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def open_app(database, **config):
+    """Creates an app pointed at the given SQLite file"""
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from App import create_app
+
+    config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(database)
+    config.setdefault('SITE_URL', 'http://localhost/') # The feeds are only written with one
+    return create_app(config)
+
+def seed(app, users, posts, seed_value = 0, batch_size = 10000, log = print):
+    """Fills an empty database with users and posts, newest posts last"""
+
+    from extensions import db
+    from models import User, Post
+    from rendering import render_markdown, RENDERER_VERSION
+    from views.common import Get_Search_Index
+    import user_stats
+    import migrations
+
+    rng = random.Random(seed_value)
+    start = time.perf_counter()
+
+    with app.app_context(), db.engine.connect() as con:
+        db.create_all()
+        migrations.stamp(con)
+        user_table = User.__table__
+        post_table = Post.__table__
+        now = datetime.utcnow()
+
+        for first in range(0, users, batch_size):
+            rows = [{
+                'username': f'user{n}',
+                'email': f'user{n}@example.com',
+                'password': PASSWORD,
+                'about': sentence(rng, 5, 40),
+                'updated_at': now
+            } for n in range(first, min(first + batch_size, users))]
+            with con.begin():
+                con.execute(user_table.insert(), rows)
+
+        log(f"Seeded {users} users in {time.perf_counter() - start:.1f}s")
+
+        # Spread the posts over the last few years, oldest first so ids follow dates
+        started = now - timedelta(days = 3 * 365)
+        step = (now - started) / max(posts, 1)
+        for first in range(0, posts, batch_size):
+            rows = []
+            for n in range(first, min(first + batch_size, posts)):
+                content = '\n'.join(sentence(rng, 10, 120) for _ in range(rng.randint(1, 8)))
+                excerpt, word_count = Post.Summarize(content)
+                created = started + step * n
+                rows.append({
+                    'title': sentence(rng, 2, 8).capitalize(),
+                    'content': content,
+                    'content_html': render_markdown(content),
+                    'renderer_version': RENDERER_VERSION,
+                    'excerpt': excerpt,
+                    'word_count': word_count,
+                    'date_created': created,
+                    'updated_at': created,
+                    'author_id': rng.randint(1, users)
+                })
+            with con.begin():
+                con.execute(post_table.insert(), rows)
+
+            log(f"Seeded {min(first + batch_size, posts)}/{posts} posts")
+
+        Get_Search_Index().rebuild(con)
+        user_stats.rebuild(con)
+
+    log(f"Seeded the database in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Seeds a synthetic blog database for the benchmarks")
+    parser.add_argument('--database', default = 'bench.db', help = "SQLite file to create")
+    parser.add_argument('--users', type = int, default = 1000)
+    parser.add_argument('--posts', type = int, default = 20000)
+    parser.add_argument('--seed', type = int, default = 0, help = "Random seed, the same seed gives the same database")
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f"{args.database} already exists")
+
+    seed(open_app(args.database), args.users, args.posts, args.seed)
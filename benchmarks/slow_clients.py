@@ -0,0 +1,174 @@
+"""Compares the WSGI and ASGI serving modes while slow clients hold connections open
+
+Usage: python benchmarks/slow_clients.py --database bench.db --threads 8 --slow 32 --fast 8 --duration 10
+
+Both modes get the same number of app threads. Slow clients trickle their requests in and read the responses
+slowly, the way clients on bad mobile links do, while fast clients read posts as quickly as they can.
+The fast clients' throughput and latency show how much the slow ones hold up everyone else.
+The ASGI mode needs uvicorn, which is in requirements.txt.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from threading import Event, Lock, Thread
+import urllib.request
+import argparse
+import importlib.util
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from seed import open_app
+from bench import database_stats, random_post, summarize
+
+def start_wsgi(app, threads):
+    """Starts a WSGI server with a fixed pool of threads, as gunicorn's gthread workers have, and returns its URL"""
+
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledServer(ThreadingMixIn, BaseWSGIServer):
+        pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    server = PooledServer('127.0.0.1', 0, app, handler = QuietHandler)
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server.shutdown, f'http://127.0.0.1:{server.server_port}'
+
+def start_asgi(app, threads):
+    """Starts uvicorn serving the app through the ASGI bridge with the given app threads, and returns its URL"""
+
+    import uvicorn
+    from asgi_bridge import ASGIBridge
+
+    app.config['ASGI_THREADS'] = threads
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(ASGIBridge(app), host = '127.0.0.1', port = port, log_level = 'warning', access_log = False, lifespan = 'off'))
+    Thread(target = server.run, daemon = True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop, f'http://127.0.0.1:{port}'
+
+def slow_client(port, path, trickle, deadline, completed, lock):
+    """Sends requests a few bytes at a time and reads the responses as slowly, until the deadline"""
+
+    request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUser-Agent: slow-client\r\nConnection: close\r\n\r\n".encode()
+    pieces = [request[i:i + 4] for i in range(0, len(request), 4)]
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout = 30) as connection:
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                for piece in pieces:
+                    connection.sendall(piece)
+                    time.sleep(trickle / len(pieces))
+                while connection.recv(1024):
+                    time.sleep(trickle / 20)
+        except OSError:
+            continue
+        with lock:
+            completed.append(1)
+
+def run(base_url, stats, slow, fast, duration, trickle, seed_value):
+    """Runs the slow and fast clients together and returns the fast clients' figures"""
+
+    port = int(base_url.rsplit(':', 1)[1])
+    lock = Lock()
+    latencies, failures, completed = [], [], []
+
+    # The slow clients get a head start so they already hold connections when the clock starts
+    deadline = time.perf_counter() + duration + trickle
+    slow_clients = []
+    for index in range(slow):
+        path = f'/post/{random_post(random.Random(seed_value * 1000 + index), stats)}'
+        slow_clients.append(Thread(target = slow_client, args = (port, path, trickle, deadline, completed, lock), daemon = True))
+        slow_clients[-1].start()
+    time.sleep(trickle)
+
+    stop = Event()
+
+    def fast_client(index):
+        rng = random.Random(seed_value * 1000 + slow + index)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f'{base_url}/post/{random_post(rng, stats)}', timeout = 30) as response:
+                    response.read()
+                failed = False
+            except OSError:
+                failed = True
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                failures.append(failed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(fast) as pool:
+        futures = [pool.submit(fast_client, index) for index in range(fast)]
+        time.sleep(duration)
+        stop.set()
+        for future in futures:
+            future.result()
+
+    result = summarize(latencies, time.perf_counter() - started, [], sum(failures))
+
+    # Their last requests finish before the next mode starts
+    for thread in slow_clients:
+        thread.join()
+    result['slow_requests_completed'] = len(completed)
+    del result['statements_per_request']
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compares the WSGI and ASGI serving modes under slow clients")
+    parser.add_argument('--database', default = 'bench.db', help = "Database seeded with benchmarks/seed.py")
+    parser.add_argument('--threads', type = int, default = 8, help = "App threads in both modes")
+    parser.add_argument('--slow', type = int, default = 32, help = "Slow clients")
+    parser.add_argument('--fast', type = int, default = 8, help = "Fast clients whose throughput is measured")
+    parser.add_argument('--duration', type = float, default = 10.0, help = "Seconds the fast clients run for")
+    parser.add_argument('--trickle', type = float, default = 2.0, help = "Seconds a slow client takes to send its request, and again to read the response")
+    parser.add_argument('--modes', nargs = '+', choices = ['wsgi', 'asgi'], default = ['wsgi', 'asgi'])
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = "Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} doesn't exist, create it with benchmarks/seed.py")
+    if 'asgi' in args.modes:
+        if importlib.util.find_spec('uvicorn') is None:
+            parser.error("The ASGI mode needs uvicorn, pip install uvicorn or pass --modes wsgi")
+
+    results = {'threads': args.threads, 'slow': args.slow, 'fast': args.fast, 'trickle': args.trickle, 'cpus': os.cpu_count(), 'modes': {}}
+    for mode in args.modes:
+        # A fresh app per mode, so neither starts with the other's cached pages
+        app = open_app(args.database, MAX_QUERIES_PER_REQUEST = None, ADMISSION_LIMITS = {}, FEEDS_FOLDER = os.path.abspath(args.database) + '.feeds')
+        stats = database_stats(app)
+        stop, base_url = (start_wsgi if mode == 'wsgi' else start_asgi)(app, args.threads)
+        try:
+            result = run(base_url, stats, args.slow, args.fast, args.duration, args.trickle, args.seed)
+        finally:
+            stop()
+
+        results['modes'][mode] = result
+        print(f"{mode}  {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+              f"p99 {result['p99_ms']:9.2f} ms  errors {result['errors']}  slow requests completed {result['slow_requests_completed']}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+if __name__ == '__main__':
+    main()
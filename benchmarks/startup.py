@@ -0,0 +1,104 @@
+"""Measures how long a worker takes from import to its first response
+
+Usage: python benchmarks/startup.py --database bench.db --runs 10 [--path /recent]
+
+Cold runs start a fresh interpreter, import the app, create it and serve one request.
+Fork runs create the app once, with and without preload, then fork workers the way
+gunicorn --preload does and time each worker's first response.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter, so the import is timed from the very start
+COLD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import App
+imported = time.perf_counter()
+app = App.create_app({config!r})
+created = time.perf_counter()
+response = app.test_client().get({path!r})
+served = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({{'import': imported - start, 'create_app': created - imported, 'first_response': served - created, 'total': served - start}}))
+"""
+
+def run_cold(config, path, runs):
+    """Times import, create_app and the first response in fresh interpreters"""
+
+    script = COLD.format(root = ROOT, config = config, path = path)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', script], capture_output = True, text = True, check = True).stdout
+        timings.append(json.loads(output.strip().splitlines()[-1]))
+    return timings
+
+def run_fork(app, path, runs):
+    """Forks workers from an already created app and times each one's first response"""
+
+    timings = []
+    for _ in range(runs):
+        read, write = os.pipe()
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            status = app.test_client().get(path).status_code
+            os.write(write, json.dumps({'first_response': time.perf_counter() - start, 'status': status}).encode())
+            os._exit(0)
+
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            result = json.loads(pipe.read())
+        os.waitpid(pid, 0)
+        assert result.pop('status') == 200
+        timings.append(result)
+    return timings
+
+def summarize(timings):
+    """Median of every phase in milliseconds"""
+
+    return {phase: round(statistics.median(timing[phase] for timing in timings) * 1000, 2) for phase in timings[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measures how long a worker takes from import to its first response")
+    parser.add_argument('--database', default = 'bench.db', help = "Database seeded with benchmarks/seed.py")
+    parser.add_argument('--path', default = '/recent', help = "Page requested as the first response")
+    parser.add_argument('--runs', type = int, default = 10)
+    parser.add_argument('--output', help = "Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} doesn't exist, create it with benchmarks/seed.py")
+
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(args.database), 'PAGE_CACHE_BACKEND': None}
+    results = {'path': args.path, 'runs': args.runs, 'cold': summarize(run_cold(config, args.path, args.runs))}
+    print(f"cold            {results['cold']}")
+
+    if hasattr(os, 'fork'):
+        sys.path.insert(0, ROOT)
+        from App import create_app, preload
+
+        for preloaded in (False, True):
+            app = create_app(config)
+            if preloaded:
+                preload(app)
+            name = 'fork_preloaded' if preloaded else 'fork'
+            results[name] = summarize(run_fork(app, args.path, args.runs))
+            print(f"{name:15} {results[name]}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+if __name__ == '__main__':
+    main()
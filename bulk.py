@@ -0,0 +1,296 @@
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import bindparam, text
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from credentials import parse_hash
+import user_stats
+import csv
+import json
+import os
+import time
+
+# Posts given as a folder hold one Markdown file each, with an optional header of key: value lines between --- lines
+MARKDOWN_SUFFIX = '.md'
+
+class TransferError(Exception):
+    """Raised when records can't be read or imported"""
+
+# Reading
+def read_records(path):
+    """Yields the records of a JSONL or CSV file, or of a folder of Markdown posts, one at a time"""
+
+    if os.path.isdir(path):
+        yield from read_markdown(path)
+        return
+
+    suffix = os.path.splitext(path)[1].lower()
+    with open(path, newline = '', encoding = 'utf-8') as file:
+        if suffix == '.jsonl':
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise TransferError(f"{path}:{number}: {e}")
+        elif suffix == '.csv':
+            yield from csv.DictReader(file)
+        else:
+            raise TransferError(f"{path} isn't a .jsonl or .csv file or a folder of {MARKDOWN_SUFFIX} files")
+
+def read_markdown(folder):
+    # Sorted so posts without dates get ids in file name order
+    names = sorted(name for name in os.listdir(folder) if name.endswith(MARKDOWN_SUFFIX))
+    for name in names:
+        with open(os.path.join(folder, name), encoding = 'utf-8') as file:
+            content = file.read()
+
+        record = {}
+        if content.startswith('---\n'):
+            header, _, content = content[4:].partition('\n---\n')
+            for line in header.splitlines():
+                key, _, value = line.partition(':')
+                if value:
+                    record[key.strip().lower()] = value.strip()
+
+        # Posts without a title in their header take their first heading, or else their file name
+        if 'title' not in record:
+            first, _, rest = content.lstrip('\n').partition('\n')
+            if first.startswith('# '):
+                record['title'], content = first[2:].strip(), rest
+            else:
+                record['title'] = os.path.splitext(name)[0]
+
+        record['content'] = content.strip('\n')
+        yield record
+
+def parse_date(value):
+    """Reads an ISO 8601 date or timestamp as a naive UTC datetime"""
+
+    if not value or isinstance(value, datetime):
+        return value or None
+
+    try:
+        date = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise TransferError(f"Can't read the date {value!r}, use ISO 8601")
+
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo = None)
+    return date
+
+def chunks(records, size):
+    records = iter(records)
+    return iter(lambda: list(islice(records, size)), [])
+
+# Importing
+def import_users(con, records, batch_size = 10000, hash_password = None, log = print):
+    """Inserts users a batch per transaction, skipping taken usernames and emails, and returns (imported, skipped)"""
+
+    from models import User
+
+    # Known up front so a duplicate skips one row instead of failing its whole batch
+    taken_names, taken_emails = set(), set()
+    for username, email in con.execute(text('SELECT username, email FROM "user"')):
+        taken_names.add(username)
+        taken_emails.add(email)
+
+    table = User.__table__
+    imported, skipped, start = 0, 0, time.perf_counter()
+    for batch in chunks(records, batch_size):
+        now = datetime.utcnow()
+        rows = []
+        for record in batch:
+            username, email, password = record.get('username'), record.get('email'), record.get('password')
+            if not (username and email and password) or username in taken_names or email in taken_emails:
+                skipped += 1
+                continue
+
+            # Exported passwords are already hashed, any other is treated as plaintext
+            if hash_password and parse_hash(password) is None:
+                password = hash_password(password)
+
+            taken_names.add(username)
+            taken_emails.add(email)
+            rows.append({'username': username, 'email': email, 'password': password, 'about': record.get('about') or None, 'updated_at': now})
+
+        if rows:
+            with con.begin():
+                con.execute(table.insert(), rows)
+        imported += len(rows)
+        log(f"Imported {imported} users ({imported / (time.perf_counter() - start):.0f}/s), skipped {skipped}")
+
+    return imported, skipped
+
+# Usernames and ids of the authors posts can be imported for, set in each worker process by use_authors
+authors = {}
+author_ids = set()
+
+def use_authors(known):
+    authors.clear()
+    authors.update(known)
+    author_ids.clear()
+    author_ids.update(known.values())
+
+def prepare_posts(batch, keep_ids):
+    """Turns a batch of records into post rows, returning them with their authors' ids and how many were skipped"""
+
+    from models import Post
+
+    now = datetime.utcnow()
+    rows, touched, skipped = [], set(), 0
+    for record in batch:
+        # Authors are given by username, or by id as in the post table
+        author_id = authors.get(record.get('author'))
+        if author_id is None and str(record.get('author_id') or '').isdigit() and int(record['author_id']) in author_ids:
+            author_id = int(record['author_id'])
+        if not (record.get('title') and record.get('content')) or author_id is None:
+            skipped += 1
+            continue
+
+        # The HTML is left to flask render-posts, posts render as they are read until then
+        excerpt, word_count = Post.Summarize(record['content'])
+        created = parse_date(record.get('date_created') or record.get('date')) or now
+        row = {
+            'title': record['title'],
+            'content': record['content'],
+            'excerpt': excerpt,
+            'word_count': word_count,
+            'date_created': created,
+            'updated_at': parse_date(record.get('updated_at')) or created,
+            'views': int(record.get('views') or 0),
+            'author_id': author_id
+        }
+        if keep_ids:
+            if record.get('id') in (None, ''):
+                raise TransferError(f"Post {record['title']!r} has no id to keep")
+            row['id'] = int(record['id'])
+        rows.append(row)
+        touched.add(author_id)
+
+    return rows, touched, skipped
+
+def pipeline(pool, function, batches, *args, ahead = 2):
+    """Maps the batches over the pool in order, with only ahead of them read and in flight at a time"""
+
+    if pool is None:
+        yield from (function(batch, *args) for batch in batches)
+        return
+
+    # Executor.map would read every batch up front
+    pending = deque()
+    for batch in batches:
+        pending.append(pool.submit(function, batch, *args))
+        if len(pending) > ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def import_posts(con, records, batch_size = 10000, keep_ids = False, defer_indexes = True, workers = None, log = print):
+    """Inserts posts a batch per transaction, skipping those without a title, content or known author, and returns (imported, skipped)"""
+
+    from models import Post
+
+    known = {username: user_id for user_id, username in con.execute(text('SELECT id, username FROM "user"'))}
+    use_authors(known)
+
+    # Summarizing the posts is most of the work, so workers prepare the next batches while this process inserts
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers, initializer = use_authors, initargs = (known,)) if workers > 1 else None
+
+    # Dropping the post indexes and building each once at the end beats updating them on every insert
+    table = Post.__table__
+    existing = {index['name'] for index in inspect(con).get_indexes('post')}
+    deferred = [index for index in table.indexes if index.name in existing] if defer_indexes else []
+    for index in deferred:
+        index.drop(con)
+
+    imported, skipped, start = 0, 0, time.perf_counter()
+    try:
+        for rows, touched, passed in pipeline(pool, prepare_posts, chunks(records, batch_size), keep_ids, ahead = 2 * workers):
+            if rows:
+                try:
+                    with con.begin():
+                        con.execute(table.insert(), rows)
+
+                        # The authors' profiles list the new posts
+                        now = datetime.utcnow()
+                        con.execute(text('UPDATE "user" SET updated_at = :now WHERE (id = :id)'), [{'id': author_id, 'now': now} for author_id in touched])
+                except IntegrityError as e:
+                    raise TransferError(f"{rejected_post(con, rows, e)}, the {imported} posts before its batch were imported") from e
+            imported += len(rows)
+            skipped += passed
+            log(f"Imported {imported} posts ({imported / (time.perf_counter() - start):.0f}/s), skipped {skipped}")
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures = True)
+        for index in deferred:
+            log(f"Building index {index.name}")
+            index.create(con)
+
+        # The batches committed before a failure stay, so the stats are rebuilt for them too
+        # They are rebuilt in one pass rather than batch by batch
+        log("Rebuilding the user stats")
+        user_stats.rebuild(con)
+
+        # Postgres hands out ids from a sequence that doesn't see ids inserted explicitly
+        if keep_ids and con.dialect.name == 'postgresql':
+            con.execute(text("SELECT setval(pg_get_serial_sequence('post', 'id'), (SELECT COALESCE(MAX(id), 1) FROM post))"))
+
+    return imported, skipped
+
+def rejected_post(con, rows, error):
+    """Describes the row of a batch the database rejected, for the error the import stops with"""
+
+    # Only kept ids can clash, either with a post already in the table or with another record of the batch
+    ids = [row['id'] for row in rows if 'id' in row]
+    if ids:
+        seen = set()
+        taken = {post_id for post_id, in con.execute(text("SELECT id FROM post WHERE id IN :ids").bindparams(bindparam('ids', expanding = True)), ids = ids)}
+        for row in rows:
+            if row['id'] in taken or row['id'] in seen:
+                return f"Post {row['title']!r} has the id {row['id']}, which another post already has"
+            seen.add(row['id'])
+
+    return f"The database rejected the batch of posts starting with {rows[0]['title']!r}: {error.orig}"
+
+# Exporting
+def stream_rows(con, statement, batch_size):
+    # One read transaction for the whole export, so it is a consistent snapshot however long it takes
+    with con.begin():
+        result = con.execution_options(stream_results = True).execute(statement)
+        try:
+            for rows in iter(lambda: result.fetchmany(batch_size), []):
+                yield from rows
+        finally:
+            result.close()
+
+def write_jsonl(rows, file, log = print, kind = 'rows'):
+    written = 0
+    for row in rows:
+        record = {key: value.isoformat(' ') if isinstance(value, datetime) else value for key, value in row.items()}
+        file.write(json.dumps(record, ensure_ascii = False) + '\n')
+        written += 1
+        if written % 10000 == 0:
+            log(f"Exported {written} {kind}")
+    return written
+
+def export_users(con, file, batch_size = 1000, log = print):
+    """Writes every user as a line of JSON with their password hash, and returns how many"""
+
+    from extensions import db
+
+    statement = text('SELECT username, email, password, about, updated_at FROM "user" ORDER BY id').columns(updated_at = db.DateTime)
+    return write_jsonl(stream_rows(con, statement, batch_size), file, log, 'users')
+
+def export_posts(con, file, batch_size = 1000, log = print):
+    """Writes every post as a line of JSON, oldest first with its author's username, and returns how many"""
+
+    from extensions import db
+
+    statement = text('SELECT p.id, p.title, p.content, "user".username AS author, p.date_created, p.updated_at, p.views FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) ORDER BY p.id')
+    statement = statement.columns(date_created = db.DateTime, updated_at = db.DateTime)
+    return write_jsonl(stream_rows(con, statement, batch_size), file, log, 'posts')
@@ -0,0 +1,124 @@
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+import base64
+import hashlib
+import hmac
+import os
+
+# Hashes are stored as scrypt$<n>$<r>$<p>$<salt>$<hash>, anything else is a legacy plaintext password
+PREFIX = 'scrypt'
+
+class CredentialsBusyError(Exception):
+    """Raised when a password can't get a hashing worker within the queue timeout"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing is at capacity, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+def decode(data):
+    return base64.b64decode(data.encode('ascii'), validate = True)
+
+def parse_hash(stored):
+    """Returns the n, r, p and salt of a stored hash, or None for a legacy plaintext password"""
+
+    # A plaintext password may well start with the prefix, only a value of the full form is taken as a hash
+    fields = stored.split('$')
+    if len(fields) != 6 or fields[0] != PREFIX or not all(field.isdigit() for field in fields[1:4]):
+        return None
+
+    n, r, p = int(fields[1]), int(fields[2]), int(fields[3])
+    if n < 2 or n & (n - 1) or r < 1 or p < 1:
+        return None
+    try:
+        salt = decode(fields[4])
+        decode(fields[5])
+    except ValueError:
+        return None
+    return n, r, p, salt
+
+class PasswordPool:
+    """The cost factor and hashing workers of one app"""
+
+    def __init__(self, config):
+        self.n = config['PASSWORD_HASH_N']
+        self.r = config['PASSWORD_HASH_R']
+        self.p = config['PASSWORD_HASH_P']
+        self.queue_timeout = config['PASSWORD_QUEUE_TIMEOUT']
+
+        # hashlib.scrypt releases the GIL, so threads hash in parallel without starving the request threads
+        # beyond the worker cap, and the semaphore bounds how many requests can wait for one
+        # The executor only starts its threads on first use, so forked workers each get their own
+        workers = config['PASSWORD_WORKERS']
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix = 'password')
+        self.slots = BoundedSemaphore(workers)
+
+        # Verifying an unknown email costs as much as a real one so response times don't reveal accounts
+        self.dummy_salt = os.urandom(16)
+
+    def _hash(self, password, salt, n, r, p):
+        key = hashlib.scrypt(password.encode('utf-8'), salt = salt, n = n, r = r, p = p, maxmem = 128 * n * r * p + 2 ** 20, dklen = 32)
+        return f"{PREFIX}${n}${r}${p}${encode(salt)}${encode(key)}"
+
+    def _run(self, function, *args):
+        # Queue-timeout backpressure: give up rather than pile up requests behind the workers
+        if not self.slots.acquire(timeout = self.queue_timeout):
+            raise CredentialsBusyError(max(1, round(self.queue_timeout)))
+        try:
+            return self.executor.submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._run(self._hash, password, os.urandom(16), self.n, self.r, self.p)
+
+    def _verify(self, stored, password):
+        if stored is None:
+            self._hash(password, self.dummy_salt, self.n, self.r, self.p)
+            return False, False
+
+        parsed = parse_hash(stored)
+        if parsed is None:
+            # Legacy plaintext row, upgraded to a hash by the caller on success
+            return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8')), True
+
+        n, r, p, salt = parsed
+        matches = hmac.compare_digest(self._hash(password, salt, n, r, p), stored)
+
+        # Rows hashed with an older cost factor are rehashed on login
+        return matches, (n, r, p) != (self.n, self.r, self.p)
+
+    def verify(self, stored, password):
+        return self._run(self._verify, stored, password)
+
+class PasswordHasher:
+    """Salted scrypt hashing run on a bounded worker pool"""
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the cost factor and pool limits from the config"""
+
+        app.config.setdefault('PASSWORD_HASH_N', 2 ** 14) # CPU/memory cost, a power of two
+        app.config.setdefault('PASSWORD_HASH_R', 8)
+        app.config.setdefault('PASSWORD_HASH_P', 1)
+        app.config.setdefault('PASSWORD_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_QUEUE_TIMEOUT', 2.0) # Seconds a request waits for a worker before a 503
+
+        app.extensions['passwords'] = PasswordPool(app.config)
+
+    def hash(self, password):
+        """Returns a new salted hash of the password"""
+
+        return current_app.extensions['passwords'].hash(password)
+
+    def verify(self, stored, password):
+        """Checks a password against its stored hash, returns (matches, needs_rehash)"""
+
+        # stored is None when the user doesn't exist
+        return current_app.extensions['passwords'].verify(stored, password)
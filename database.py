@@ -0,0 +1,142 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from threading import Lock
+import os
+
+def configure_database(app):
+    """Fills in the database URI and pool options, must run before db.init_app(app)"""
+
+    # DATABASE_URL lets deployments point at Postgres (or another SQLite file) without code changes
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///blog.db'))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config.setdefault('DATABASE_POOL_SIZE', 5)
+    app.config.setdefault('DATABASE_MAX_OVERFLOW', 10)
+    app.config.setdefault('DATABASE_POOL_TIMEOUT', 30)
+    app.config.setdefault('DATABASE_POOL_RECYCLE', 1800)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000) # Milliseconds a writer waits for the lock before failing
+    app.config.setdefault('SQLITE_CACHED_STATEMENTS', 256) # Prepared statements kept per connection
+
+    options = {
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DATABASE_POOL_TIMEOUT']
+    }
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if url.database not in (None, '', ':memory:'):
+            # Flask-SQLAlchemy would otherwise open a new connection for every checkout
+            options['poolclass'] = QueuePool
+            options['connect_args'] = {
+                'check_same_thread': False,
+                'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000,
+                'cached_statements': app.config['SQLITE_CACHED_STATEMENTS']
+            }
+        else:
+            # In-memory databases live on a single shared connection
+            options = {}
+    else:
+        # Network databases drop idle connections, so checkouts ping them first, a local SQLite file never needs it
+        options['pool_recycle'] = app.config['DATABASE_POOL_RECYCLE']
+        options['pool_pre_ping'] = True
+
+    # Options set explicitly in the config win
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def tune_engine(app, engine):
+    """Applies the SQLite pragmas to every new connection of the engine"""
+
+    if engine.dialect.name != 'sqlite':
+        return
+
+    busy_timeout = app.config['SQLITE_BUSY_TIMEOUT']
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers carry on while a writer holds the lock
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+        # Safe with WAL, only the last transactions can be lost on power failure
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+def on_engine(app, hook):
+    """Registers a function to run on the app's engine once it is created"""
+
+    app.extensions.setdefault('engine_hooks', []).append(hook)
+
+class LazySQLAlchemy(SQLAlchemy):
+    """Creates each app's engine on first use and runs the hooks registered with on_engine on it"""
+
+    # Extensions that listen to engine events hook in here instead of forcing the engine into existence,
+    # so importing and creating the app never touch the database
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hook_lock = Lock()
+
+    def get_engine(self, app = None, bind = None):
+        app = self.get_app(app)
+        engine = super().get_engine(app, bind)
+
+        # Engines are recreated when the URI changes, so hooks run once per engine rather than once per app
+        hooked = app.extensions.setdefault('hooked_engines', {})
+        if hooked.get(bind) is not engine:
+            with self.hook_lock:
+                if hooked.get(bind) is not engine:
+                    for hook in app.extensions.get('engine_hooks', ()):
+                        hook(engine)
+                    hooked[bind] = engine
+
+        return engine
+
+@event.listens_for(Session, 'after_commit')
+def run_after_commit(session):
+    for callback in session.info.pop('after_commit', ()):
+        callback()
+
+@event.listens_for(Session, 'after_transaction_end')
+def drop_after_commit(session, transaction):
+    # A transaction that ended without committing takes its callbacks with it
+    if transaction.parent is None:
+        session.info.pop('after_commit', None)
+
+class Database:
+    """Hands every request the connection of its db.session, so reads and writes share one connection"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @contextmanager
+    def connection(self):
+        """Yields the request's connection for reading, it is released when the request ends"""
+
+        yield self.db.session.connection()
+
+    def release(self):
+        """Ends the request's read transaction and returns its connection to the pool, before slow work that doesn't need it"""
+
+        self.db.session.close()
+
+    @contextmanager
+    def transaction(self):
+        """Yields the request's connection and commits everything done in the block, ORM changes included"""
+
+        con = self.db.session.connection()
+        try:
+            yield con
+        except:
+            self.db.session.rollback()
+            raise
+        else:
+            self.db.session.commit()
+
+    def after_commit(self, callback):
+        """Runs the callback once the request's transaction commits, it is dropped if the transaction rolls back"""
+
+        self.db.session().info.setdefault('after_commit', []).append(callback)
@@ -0,0 +1,77 @@
+from flask import render_template
+from sqlalchemy.exc import SQLAlchemyError
+from contextlib import contextmanager
+
+class BlogError(Exception):
+    """An error shown to the user as the error page, with the status code of its class"""
+
+    status = 500
+
+    def __init__(self, title, msg = None, back = None):
+        super().__init__(title)
+        self.title = title
+        self.msg = msg
+        self.back = back # Endpoint the page's Go Back button links to
+
+class NotFoundError(BlogError):
+    """Raised when a requested post or user doesn't exist"""
+
+    status = 404
+
+class ForbiddenError(BlogError):
+    """Raised when a user acts on something that isn't theirs"""
+
+    status = 403
+
+class DatabaseError(BlogError):
+    """Raised when a statement fails, the original SQLAlchemyError is its cause"""
+
+    status = 500
+
+@contextmanager
+def reporting(title, back = None):
+    """Turns database errors raised in the block into a DatabaseError with the given title"""
+
+    try:
+        yield
+    except SQLAlchemyError as e:
+        raise DatabaseError(title, str(type(e)), back) from e
+
+def render_error(title, msg = None, back = None, status = 500, headers = None):
+    """Renders the error page in place, saving the client a redirect to /error"""
+
+    return render_template("error.html", title = title, msg = msg, back = back), status, headers or {}
+
+class ErrorPages:
+    """Renders BlogErrors and HTTP errors as the error page with their status codes"""
+
+    def __init__(self, app = None, db = None):
+        self.db = db
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Registers the error handlers on the app"""
+
+        self.app = app
+        self.db = db
+
+        app.register_error_handler(BlogError, self.blog_error)
+        for code in (400, 403, 404, 405, 500):
+            app.register_error_handler(code, self.http_error)
+
+    def blog_error(self, e):
+        if isinstance(e, DatabaseError):
+            # The session's transaction is unusable after a failed statement
+            self.db.session.rollback()
+            self.app.logger.error("%s: %r", e.title, e.__cause__)
+
+        return render_error(e.title, e.msg, e.back, e.status)
+
+    def http_error(self, e):
+        # Unhandled exceptions reach here as a 500, and are re-raised instead in debug mode
+        if e.code == 500:
+            self.db.session.rollback()
+
+        headers = {'Allow': ', '.join(e.valid_methods)} if getattr(e, 'valid_methods', None) else None
+        return render_error(f"Error: {e.code}", e.description, status = e.code, headers = headers)
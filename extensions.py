@@ -0,0 +1,28 @@
+from flask_bootstrap import Bootstrap
+from database import LazySQLAlchemy, Database
+from page_cache import PageCache
+from credentials import PasswordHasher
+from view_counts import ViewCounter
+from feeds import Feeds
+
+# Extensions the views and models use directly, created unbound and set up for each app by create_app
+# Each keeps its per-app state in app.extensions, so one instance serves every app the process creates
+db = LazySQLAlchemy()
+
+# Every request reads and writes through its db.session's connection
+database = Database(db)
+
+# Configure the rendered page cache
+page_cache = PageCache()
+
+# Hash passwords on a bounded worker pool, see credentials.py for the cost factor and pool limits
+passwords = PasswordHasher()
+
+# Count post views in memory and write them behind the requests, see view_counts.py for the flush and trending settings
+view_counter = ViewCounter()
+
+# Write the Atom feeds and sitemaps as static files, see feeds.py for the folder and site URL settings
+feeds = Feeds()
+
+# Configure bootstrap
+bootstrap = Bootstrap()
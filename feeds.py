@@ -0,0 +1,256 @@
+from flask import current_app, render_template, send_from_directory
+from sqlalchemy.sql import text
+from sqlalchemy.exc import SQLAlchemyError
+from threading import Event, Lock, Thread, get_ident
+from urllib.parse import quote, urlsplit
+from datetime import datetime
+from rendering import render_markdown, RENDERER_VERSION
+import atexit
+import shutil
+import os
+
+# Sitemaps list at most 50,000 URLs each, the posts and users are split into files of this many ids
+SITEMAP_CHUNK = 10000
+
+# Pages listed in the sitemap besides the posts and profiles
+SITEMAP_PAGES = ('Main', 'posts.Recent', 'posts.Trending', 'profiles.Authors', 'search.Search_Form')
+
+FEED_COLUMNS = 'p.id, p.title, p.excerpt, p.content, p.content_html, p.renderer_version, p.date_created, p.updated_at, "user".username AS author'
+
+def Format_Timestamp(value):
+    """Formats a naive UTC timestamp as RFC 3339, the format Atom and sitemaps use"""
+
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ') if value else ''
+
+def author_file(username):
+    # Usernames are quoted so any of them makes a single safe file name
+    return f"authors/{quote(username, safe = '')}.xml"
+
+def entries(posts):
+    # Posts rendered by an older renderer are rendered here, as View_Post does
+    return [(post, post.content_html if post.renderer_version == RENDERER_VERSION else render_markdown(post.content)) for post in posts]
+
+class FeedWriter:
+    """The files waiting to be regenerated and the thread regenerating them, for one app in one process"""
+
+    def __init__(self, app):
+        self.app = app
+        self.folder = app.config['FEEDS_FOLDER']
+        self.delay = app.config['FEEDS_DELAY']
+        self.size = app.config['FEEDS_SIZE']
+
+        self.lock = Lock()
+        self.pending = set() # ('site',), ('author', user id), ('posts', chunk), ('users', chunk), ('index',)
+        self.base_url = app.config['SITE_URL'] # None disables the files, their links can't come from a request's Host
+        self.adapter = None
+        self.wake = Event()
+        self.thread = None
+        self.pid = os.getpid()
+
+    def touch(self, *keys):
+        if self.base_url is None:
+            return
+
+        # Threads don't survive a fork, a forked worker starts its own
+        if self.pid != os.getpid():
+            self.__init__(self.app)
+
+        with self.lock:
+            self.pending.update(keys)
+            if self.thread is None:
+                self.thread = Thread(target = self._run, name = 'feeds', daemon = True)
+                self.thread.start()
+                atexit.register(self.flush)
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+
+            # A burst of writes regenerates each file once
+            self.wake.clear()
+            self.wake.wait(self.delay)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Regenerates the pending files"""
+
+        from extensions import db
+
+        with self.lock:
+            pending, self.pending = self.pending, set()
+        if not pending:
+            return
+
+        try:
+            with self.app.app_context(), db.engine.connect() as con:
+                for key in sorted(pending, key = lambda key: key[0] == 'index'):
+                    self.generate(con, *key)
+        except (SQLAlchemyError, OSError) as e:
+            with self.lock:
+                self.pending.update(pending)
+            self.app.logger.warning(f"Regenerating {len(pending)} feeds and sitemaps failed, retrying on the next write: {e}")
+
+    def link(self, endpoint, **values):
+        """Builds the absolute URL of a page on SITE_URL"""
+
+        # Bound to the site's URL rather than url_for's request, whose Host header any client can set
+        if self.adapter is None:
+            url = urlsplit(self.base_url)
+            self.adapter = self.app.url_map.bind(url.netloc, script_name = url.path or '/', url_scheme = url.scheme)
+        return self.adapter.build(endpoint, values, force_external = True)
+
+    def write(self, filename, content):
+        path = os.path.join(self.folder, filename)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+
+        # Replaced whole, so a poll never reads half a file
+        temporary = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(temporary, 'w', encoding = 'utf-8') as file:
+            file.write(content)
+        os.replace(temporary, path)
+
+    def last_chunk(self, con, kind):
+        table = 'post' if kind == 'posts' else '"user"'
+        return (con.execute(text(f"SELECT MAX(id) FROM {table}")).scalar() or 0) // SITEMAP_CHUNK
+
+    def generate(self, con, kind, *args):
+        """Writes one feed or sitemap file, returning its name or None if there is nothing to write"""
+
+        from extensions import db
+
+        if kind == 'site':
+            statement = text(f'SELECT {FEED_COLUMNS} FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) ORDER BY p.id DESC LIMIT :limit')
+            posts = con.execute(statement.columns(date_created = db.DateTime, updated_at = db.DateTime), limit = self.size).fetchall()
+            self.write('atom.xml', render_template('feeds/atom.xml', entries = entries(posts), author = None, now = datetime.utcnow(), link = self.link))
+            return 'atom.xml'
+
+        if kind == 'author':
+            # Writes know the author's id, requests for a feed that was never written their username
+            column = 'id' if isinstance(args[0], int) else 'username'
+            author = con.execute(text(f'SELECT id, username FROM "user" WHERE ({column} = :key)'), key = args[0]).first()
+            if author is None:
+                return None
+
+            statement = text(f'SELECT {FEED_COLUMNS} FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) WHERE (p.author_id = :id) ORDER BY p.id DESC LIMIT :limit')
+            posts = con.execute(statement.columns(date_created = db.DateTime, updated_at = db.DateTime), id = author.id, limit = self.size).fetchall()
+            filename = author_file(author.username)
+            self.write(filename, render_template('feeds/atom.xml', entries = entries(posts), author = author.username, now = datetime.utcnow(), link = self.link))
+            return filename
+
+        if kind in ('posts', 'users') and args[0] > self.last_chunk(con, kind):
+            # Requests for chunks past the last id would otherwise fill the folder with empty sitemaps
+            return None
+
+        if kind == 'posts':
+            # A chunk is one range of ids, so a write only rereads the ids around its post
+            statement = text("SELECT id, updated_at FROM post WHERE (id >= :low AND id < :high) ORDER BY id").columns(updated_at = db.DateTime)
+            rows = con.execute(statement, low = args[0] * SITEMAP_CHUNK, high = (args[0] + 1) * SITEMAP_CHUNK).fetchall()
+            urls = [(self.link('posts.View_Post', post_id = row.id), row.updated_at) for row in rows]
+            filename = f'sitemaps/posts-{args[0]}.xml'
+            self.write(filename, render_template('feeds/sitemap.xml', urls = urls))
+            return filename
+
+        if kind == 'users':
+            statement = text('SELECT username, updated_at FROM "user" WHERE (id >= :low AND id < :high) ORDER BY id').columns(updated_at = db.DateTime)
+            rows = con.execute(statement, low = args[0] * SITEMAP_CHUNK, high = (args[0] + 1) * SITEMAP_CHUNK).fetchall()
+            urls = [(self.link('profiles.User_Profile', username = row.username), row.updated_at) for row in rows]
+            filename = f'sitemaps/users-{args[0]}.xml'
+            self.write(filename, render_template('feeds/sitemap.xml', urls = urls))
+            return filename
+
+        if kind == 'index':
+            urls = [(self.link(endpoint), None) for endpoint in SITEMAP_PAGES]
+            self.write('sitemaps/pages.xml', render_template('feeds/sitemap.xml', urls = urls))
+
+            # Chunks are only written here the first time, afterwards each write regenerates its own
+            sitemaps = ['sitemaps/pages.xml']
+            for listing in ('posts', 'users'):
+                for chunk in range(self.last_chunk(con, listing) + 1):
+                    filename = f'sitemaps/{listing}-{chunk}.xml'
+                    if not os.path.exists(os.path.join(self.folder, filename)):
+                        self.generate(con, listing, chunk)
+                    sitemaps.append(filename)
+
+            listed = []
+            for filename in sitemaps:
+                modified = datetime.utcfromtimestamp(os.path.getmtime(os.path.join(self.folder, filename)))
+                listed.append((self.link('feeds.Sitemap_File', name = filename.split('/', 1)[1]), modified))
+            self.write('sitemap.xml', render_template('feeds/sitemap_index.xml', sitemaps = listed))
+            return 'sitemap.xml'
+
+        raise ValueError(f"Unknown feed: {kind}")
+
+class Feeds:
+    """Writes the Atom feeds and sitemaps as static files, regenerating only those a write changes"""
+
+    # Readers and crawlers polling them cost a file read, answered with a 304 when the ETag still matches
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the folder, feed size and site URL from the config"""
+
+        app.config.setdefault('FEEDS_FOLDER', os.path.join(app.instance_path, 'feeds'))
+        app.config.setdefault('FEEDS_SIZE', 20) # Latest posts in each feed
+        app.config.setdefault('FEEDS_DELAY', 0.5) # Seconds a write waits for others to regenerate the files with
+        app.config.setdefault('FEEDS_MAX_AGE', 300) # Seconds clients may use a feed before revalidating it
+        app.config.setdefault('SITE_URL', os.environ.get('SITE_URL')) # e.g. https://blog.example.com/, the feeds' links are built from it
+
+        app.add_template_filter(Format_Timestamp, 'rfc3339')
+        app.extensions['feeds'] = FeedWriter(app)
+        if app.config['SITE_URL'] is None:
+            app.logger.warning("SITE_URL isn't set, the Atom feeds and sitemaps won't be written")
+
+    @property
+    def writer(self):
+        return current_app.extensions['feeds']
+
+    def post_changed(self, post_id, author_id):
+        """Queues the feeds and sitemaps listing a post that was created, edited or deleted"""
+
+        self.writer.touch(('site',), ('author', author_id), ('posts', post_id // SITEMAP_CHUNK), ('users', author_id // SITEMAP_CHUNK), ('index',))
+
+    def user_changed(self, user_id):
+        """Queues the sitemap listing a user's profile"""
+
+        self.writer.touch(('users', user_id // SITEMAP_CHUNK), ('index',))
+
+    def send(self, filename, mimetype, *key):
+        """Serves a feed or sitemap file, generating it first if it has never been written, or returns None if there is none"""
+
+        writer = self.writer
+        if not os.path.exists(os.path.join(writer.folder, filename)):
+            if writer.base_url is None:
+                return None
+
+            from extensions import database
+            with database.connection() as con:
+                if writer.generate(con, *key) is None:
+                    return None
+
+        return send_from_directory(writer.folder, filename, mimetype = mimetype, conditional = True, cache_timeout = current_app.config['FEEDS_MAX_AGE'])
+
+    def build(self, con, base_url = None):
+        """Writes every feed and sitemap from scratch, linking to base_url or else SITE_URL"""
+
+        writer = self.writer
+        if base_url is not None:
+            writer.base_url, writer.adapter = base_url, None
+        if writer.base_url is None:
+            raise ValueError("The feeds hold absolute links, they need SITE_URL or a base URL")
+
+        # The index writes every chunk it finds missing
+        self.clear()
+        writer.generate(con, 'site')
+        for (user_id,) in con.execute(text('SELECT id FROM "user" ORDER BY id')).fetchall():
+            writer.generate(con, 'author', user_id)
+        writer.generate(con, 'index')
+
+    def clear(self):
+        """Deletes every file, each is generated again when next requested"""
+
+        shutil.rmtree(self.writer.folder, ignore_errors = True)
@@ -0,0 +1,173 @@
+from flask import request, session, make_response, send_from_directory
+from werkzeug.http import is_resource_modified
+from functools import wraps
+from hashlib import sha1, md5
+import mimetypes
+import json
+import os
+
+# Suffixes of the precompressed siblings written by flask build-assets, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+def conditional(validator):
+    """Decorates a view to answer conditional GETs with 304 before the view runs"""
+
+    # validator takes the view's arguments and returns (version, last_modified), or None to skip validation
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(**kwargs)
+
+            validators = validator(**kwargs)
+            if validators is None:
+                return view(**kwargs)
+            version, last_modified = validators
+
+            # Pages show edit controls and the navbar differently to each viewer, so the tag depends on them too
+            seed = f"{request.endpoint}|{sorted(kwargs.items())}|{request.query_string}|{session.get('user_id')}|{version}"
+            etag = sha1(seed.encode()).hexdigest()
+            last_modified = last_modified.replace(microsecond = 0) if last_modified else None
+
+            if not is_resource_modified(request.environ, etag = etag, last_modified = last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+
+            # Let caches keep the page but make them check it is still current
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+class StaticVersioning:
+    """Adds content hashes to static URLs and serves versioned files as immutable"""
+
+    # Once flask build-assets has written its manifest, url_for points at the fingerprinted files it lists
+    # Those are served precompressed, and as WebP or AVIF, to the clients that accept them
+
+    def __init__(self, app = None):
+        self.hashes = {} # filename -> (mtime, hash)
+        self.manifest = (None, {'files': {}, 'served': {}}) # (mtime, manifest)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Hooks the versioning into url_for and static responses"""
+
+        self.app = app
+        app.config.setdefault('STATIC_MAX_AGE', 31536000)
+        app.config.setdefault('ASSET_MANIFEST', os.path.join(app.static_folder, 'dist', 'manifest.json')) # None ignores built assets
+        app.config.setdefault('ASSET_PURGE_SAFELIST', []) # Classes the asset build keeps though no template names them
+        app.url_defaults(self._add_version)
+        app.after_request(self._cache_headers)
+        app.add_template_global(self.built, 'static_built')
+        if 'static' in app.view_functions:
+            app.view_functions['static'] = self._send_static
+        app.extensions['static_versioning'] = self
+
+    def version(self, filename):
+        """Returns the content hash of a static file, or None if it doesn't exist"""
+
+        path = os.path.join(self.app.static_folder, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        # Only rehash when the file changes
+        cached = self.hashes.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as file:
+                cached = (mtime, md5(file.read()).hexdigest()[:12])
+            self.hashes[filename] = cached
+
+        return cached[1]
+
+    def assets(self):
+        """Returns the manifest of the built assets, empty if there isn't one"""
+
+        path = self.app.config['ASSET_MANIFEST']
+        try:
+            mtime = os.path.getmtime(path) if path else None
+        except OSError:
+            mtime = None
+
+        # Only reload when a build replaces it
+        if mtime != self.manifest[0]:
+            assets = {'files': {}, 'served': {}}
+            if mtime is not None:
+                with open(path) as file:
+                    assets = json.load(file)
+            self.manifest = (mtime, assets)
+
+        return self.manifest[1]
+
+    def built(self, filename):
+        """Whether the last asset build produced the file, e.g. the css/bundle.css the layout links to"""
+
+        return filename in self.assets()['files']
+
+    def preload(self):
+        """Hashes every static file up front, for workers forked from a preloaded app"""
+
+        self.assets()
+        for root, _, files in os.walk(self.app.static_folder):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), self.app.static_folder)
+                self.version(path.replace(os.sep, '/'))
+
+    def _add_version(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            # Built files carry their hash in their name
+            built = self.assets()['files'].get(values['filename'])
+            if built:
+                values['filename'] = built
+                return
+
+            version = self.version(values['filename'])
+            if version:
+                values['v'] = version
+
+    def _send_static(self, filename):
+        info = self.assets()['served'].get(filename)
+        if info is None:
+            return self.app.send_static_file(filename)
+
+        # Pick the smallest image format and encoding the client accepts, caches keep one copy per choice
+        vary = []
+        if info['variants']:
+            vary.append('Accept')
+            accepted = set(request.accept_mimetypes.values())
+            # AVIF sorts before WebP, and comes out smaller
+            variant = next((path for mimetype, path in sorted(info['variants'].items()) if mimetype in accepted), None)
+            if variant:
+                filename, info = variant, self.assets()['served'][variant]
+
+        encoding, suffix = next(((encoding, suffix) for encoding, suffix in ENCODINGS if encoding in info['encodings'] and request.accept_encodings[encoding]), (None, ''))
+        if info['encodings']:
+            vary.append('Accept-Encoding')
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.app.static_folder, filename + suffix, mimetype = mimetype, cache_timeout = self.app.config['STATIC_MAX_AGE'])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.update(vary)
+        return response
+
+    def _cache_headers(self, response):
+        # Versioned URLs change whenever the file does, so they can be cached forever
+        versioned = 'v' in request.args or (request.view_args or {}).get('filename') in self.assets()['served']
+        if request.endpoint == 'static' and versioned and response.status_code == 200:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.app.config['STATIC_MAX_AGE']
+            response.cache_control.no_cache = None
+            response.headers['Cache-Control'] += ', immutable'
+        return response
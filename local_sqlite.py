@@ -0,0 +1,33 @@
+from threading import local
+import os
+import sqlite3
+
+class LocalSQLite:
+    """A SQLite file on the local disk that every thread of every worker process opens for itself"""
+
+    # For data the workers on one machine share that a crash can afford to lose, such as caches and rate limits:
+    # writes skip the fsync, and in WAL mode readers never wait on a writer
+
+    def __init__(self, path, timeout, schema = ()):
+        self.path = path
+        self.timeout = timeout
+        self.schema = schema # Statements run on each new connection, so they should be IF NOT EXISTS
+        self.local = local()
+        self.pid = os.getpid()
+
+    def connection(self):
+        """Returns this thread's autocommit connection, opening it on first use"""
+
+        # Connections can't cross a fork or be shared between threads, each thread of each process opens its own
+        if self.pid != os.getpid():
+            self.local = local()
+            self.pid = os.getpid()
+
+        con = getattr(self.local, 'con', None)
+        if con is None:
+            con = self.local.con = sqlite3.connect(self.path, timeout = self.timeout, isolation_level = None)
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = OFF")
+            for statement in self.schema:
+                con.execute(statement)
+        return con
@@ -0,0 +1,166 @@
+from flask import g, has_request_context, request, Response
+from jinja2 import Template
+from sqlalchemy import event
+from threading import Lock
+from database import on_engine
+import bisect
+import random
+import time
+
+# Histogram buckets, the upper bounds of each bucket
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+class Histogram:
+    """Cumulative Prometheus histogram with one series per label set"""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.series = {} # labels -> [bucket counts..., overflow count, sum, count]
+
+    def observe(self, labels, value):
+        # Called with the Metrics lock held
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 3)
+
+        # Counts are stored per bucket and made cumulative on export, values above the last bound go in the overflow slot
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def export(self, names):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            label = ','.join(f'{name}="{value}"' for name, value in zip(names, labels))
+            total = 0
+            for bound, count in zip(self.buckets, series):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return lines
+
+class TimedTemplate(Template):
+    """Template that adds its render time to the current request's metrics"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            if has_request_context() and 'render_time' in g:
+                g.render_time += time.perf_counter() - start
+
+class Metrics:
+    """Records per-endpoint request metrics and serves them in Prometheus text format"""
+
+    # Everything is kept in memory per process, so each worker process exposes its own /metrics
+    # Slow requests over SLOW_REQUEST_THRESHOLD seconds are logged with their SQL, sampled by SLOW_REQUEST_SAMPLE_RATE
+
+    def __init__(self, app = None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Hooks the metrics into the app's requests, templates and its engine's statements"""
+
+        self.app = app
+        app.config.setdefault('METRICS_PATH', '/metrics') # None disables the endpoint, the metrics are still recorded
+        app.config.setdefault('SLOW_REQUEST_THRESHOLD', 0.5)
+        app.config.setdefault('SLOW_REQUEST_SAMPLE_RATE', 1.0)
+
+        self.lock = Lock()
+        self.requests = {} # (endpoint, method, status) -> count
+        self.latency = Histogram('blog_request_duration_seconds', "Time spent handling requests", LATENCY_BUCKETS)
+        self.db_time = Histogram('blog_request_db_seconds', "Time spent in SQL statements per request", LATENCY_BUCKETS)
+        self.render_time = Histogram('blog_request_render_seconds', "Time spent rendering templates per request", LATENCY_BUCKETS)
+        self.statements = Histogram('blog_request_statements', "SQL statements issued per request", STATEMENT_BUCKETS)
+        self.size = Histogram('blog_response_size_bytes', "Size of response bodies", SIZE_BUCKETS)
+
+        # Time statements on the connection, since a request's statements all run on the thread handling it
+        on_engine(app, self._listen)
+
+        # Templates are only compiled on first use, so swapping the class here times every render
+        app.jinja_env.template_class = TimedTemplate
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+        if app.config['METRICS_PATH']:
+            app.add_url_rule(app.config['METRICS_PATH'], 'Metrics', self.export)
+
+        app.extensions['metrics'] = self
+
+    def _listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._statement_start)
+        event.listen(engine, 'after_cursor_execute', self._statement_end)
+
+    def _statement_start(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['statement_start'] = time.perf_counter()
+
+    def _statement_end(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'db_time' in g:
+            elapsed = time.perf_counter() - conn.info.pop('statement_start', time.perf_counter())
+            g.db_time += elapsed
+            g.statements.append((statement, elapsed))
+
+    def _start(self):
+        g.request_start = time.perf_counter()
+        g.db_time = 0.0
+        g.render_time = 0.0
+        g.statements = []
+
+    def _record(self, status, size):
+        if 'request_start' not in g:
+            return
+        duration = time.perf_counter() - g.pop('request_start')
+
+        # Requests that didn't match a route are grouped together so the label set stays bounded
+        endpoint = request.endpoint or 'unmatched'
+        with self.lock:
+            key = (endpoint, request.method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe((endpoint, request.method), duration)
+            self.db_time.observe((endpoint,), g.db_time)
+            self.render_time.observe((endpoint,), g.render_time)
+            self.statements.observe((endpoint,), len(g.statements))
+            if size is not None:
+                self.size.observe((endpoint,), size)
+
+        if duration > self.app.config['SLOW_REQUEST_THRESHOLD'] and random.random() < self.app.config['SLOW_REQUEST_SAMPLE_RATE']:
+            sql = "\n".join(f"  {elapsed * 1000:8.2f} ms  {statement}" for statement, elapsed in g.statements)
+            self.app.logger.warning(
+                f"Slow request {request.method} {request.full_path.rstrip('?')} ({endpoint}) took {duration * 1000:.1f} ms, "
+                f"{g.db_time * 1000:.1f} ms in {len(g.statements)} SQL statements, {g.render_time * 1000:.1f} ms rendering:\n{sql}")
+
+    def _finish(self, response):
+        # Streamed responses have no length up front and aren't counted in the size histogram
+        # Asking for their length would read the whole stream into memory before the first byte is sent
+        self._record(response.status_code, None if response.is_streamed else response.calculate_content_length())
+        return response
+
+    def _teardown(self, exc):
+        # Only unhandled exceptions get here without _finish having recorded the request
+        if exc is not None:
+            self._record(500, None)
+
+    def export(self):
+        """Renders the metrics in Prometheus text format"""
+
+        with self.lock:
+            lines = ["# HELP blog_requests_total Requests handled", "# TYPE blog_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'blog_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            lines += self.latency.export(('endpoint', 'method'))
+            for histogram in (self.db_time, self.render_time, self.statements, self.size):
+                lines += histogram.export(('endpoint',))
+
+        return Response("\n".join(lines) + "\n", mimetype = 'text/plain; version=0.0.4')
@@ -0,0 +1,144 @@
+from sqlalchemy import inspect
+from sqlalchemy.sql import text
+
+# Migrations in the order they are applied, as (version, description, function)
+MIGRATIONS = []
+
+def migration(version, description):
+    """Registers a function as the migration to the given schema version"""
+
+    def decorator(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key = lambda entry: entry[0])
+        return function
+    return decorator
+
+def current_version(con):
+    """Returns the schema version of the database, creating the version table if needed"""
+
+    con.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return con.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def latest_version():
+    """Returns the version the newest migration upgrades to"""
+
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def upgrade(con, log = print):
+    """Applies every pending migration, each in its own transaction, and returns how many ran"""
+
+    applied = 0
+    for version, description, function in MIGRATIONS:
+        if version <= current_version(con):
+            continue
+
+        log(f"Upgrading to version {version}: {description}")
+        with con.begin():
+            function(con)
+            con.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), version = version)
+        applied += 1
+
+    return applied
+
+def stamp(con, version = None):
+    """Marks the database as being at a version without running migrations, for freshly created schemas"""
+
+    version = latest_version() if version is None else version
+    if version > current_version(con):
+        con.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), version = version)
+
+# Migrations are written to be safe on a schema that already has their changes,
+# since databases made with db.create_all() start out with the latest models
+def columns(con, table):
+    return {column['name'] for column in inspect(con).get_columns(table)}
+
+def indexes(con, table):
+    return {index['name'] for index in inspect(con).get_indexes(table)}
+
+@migration(1, "Add post excerpts and word counts")
+def add_excerpts(con, batch_size = 500):
+    # Imported here so the models stay the single definition of how excerpts are made
+    from models import Post
+
+    if 'excerpt' not in columns(con, 'post'):
+        con.execute(text(f"ALTER TABLE post ADD COLUMN excerpt VARCHAR({Post.EXCERPT_LENGTH + 1})"))
+    if 'word_count' not in columns(con, 'post'):
+        con.execute(text("ALTER TABLE post ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0"))
+
+    last_id = 0
+    while True:
+        rows = con.execute(text("SELECT id, content FROM post WHERE (excerpt IS NULL AND id > :last_id) ORDER BY id LIMIT :limit"), last_id = last_id, limit = batch_size).fetchall()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            excerpt, word_count = Post.Summarize(row.content)
+            params.append({'id': row.id, 'excerpt': excerpt, 'word_count': word_count})
+
+        con.execute(text("UPDATE post SET excerpt = :excerpt, word_count = :word_count WHERE id = :id"), params)
+        last_id = rows[-1].id
+
+@migration(2, "Add modification timestamps to posts and users")
+def add_updated_at(con):
+    for table in ('post', 'user'):
+        if 'updated_at' not in columns(con, table):
+            con.execute(text(f'ALTER TABLE "{table}" ADD COLUMN updated_at TIMESTAMP'))
+            con.execute(text(f'UPDATE "{table}" SET updated_at = CURRENT_TIMESTAMP'))
+
+@migration(3, "Store post dates as timestamps")
+def date_created_timestamp(con):
+    if con.dialect.name == 'sqlite':
+        # SQLite columns take any value, the day strings only need a time to parse as timestamps
+        con.execute(text("UPDATE post SET date_created = date_created || ' 00:00:00.000000' WHERE (length(date_created) = 10)"))
+    elif con.dialect.name == 'postgresql':
+        con.execute(text("ALTER TABLE post ALTER COLUMN date_created TYPE TIMESTAMP USING date_created::timestamp"))
+    else:
+        con.execute(text("ALTER TABLE post MODIFY date_created DATETIME NOT NULL"))
+
+@migration(4, "Index posts by author and by date")
+def add_post_indexes(con):
+    existing = indexes(con, 'post')
+
+    # Serves the profile pages' WHERE author_id = :id ORDER BY id DESC without a sort
+    if 'ix_post_author_id_id' not in existing:
+        con.execute(text("CREATE INDEX ix_post_author_id_id ON post (author_id, id DESC)"))
+
+    # Makes date range queries possible without a full scan
+    if 'ix_post_date_created' not in existing:
+        con.execute(text("CREATE INDEX ix_post_date_created ON post (date_created)"))
+
+@migration(5, "Add rendered Markdown to posts")
+def add_content_html(con):
+    # Posts are rendered by flask render-posts, until then View_Post renders them when they are read
+    if 'content_html' not in columns(con, 'post'):
+        con.execute(text("ALTER TABLE post ADD COLUMN content_html TEXT"))
+    if 'renderer_version' not in columns(con, 'post'):
+        con.execute(text("ALTER TABLE post ADD COLUMN renderer_version INTEGER"))
+
+@migration(6, "Add view counts and trending scores to posts")
+def add_views(con):
+    if 'views' not in columns(con, 'post'):
+        con.execute(text("ALTER TABLE post ADD COLUMN views INTEGER NOT NULL DEFAULT 0"))
+    if 'trending_score' not in columns(con, 'post'):
+        con.execute(text("ALTER TABLE post ADD COLUMN trending_score FLOAT NOT NULL DEFAULT 0"))
+
+    # The trending ranking is read off this index in score order
+    if 'ix_post_trending_score' not in indexes(con, 'post'):
+        con.execute(text("CREATE INDEX ix_post_trending_score ON post (trending_score)"))
+
+    con.execute(text("CREATE TABLE IF NOT EXISTS trending_state (id INTEGER NOT NULL PRIMARY KEY, decayed_at FLOAT NOT NULL)"))
+
+@migration(7, "Add materialised user stats")
+def add_user_stats(con):
+    import user_stats
+
+    con.execute(text("CREATE TABLE IF NOT EXISTS user_stats (user_id INTEGER NOT NULL PRIMARY KEY REFERENCES \"user\" (id), post_count INTEGER NOT NULL DEFAULT 0, word_count INTEGER NOT NULL DEFAULT 0, latest_post_at TIMESTAMP)"))
+
+    # The authors page reads the leaderboard off these in order
+    existing = indexes(con, 'user_stats')
+    for column in ('post_count', 'word_count'):
+        if f'ix_user_stats_{column}' not in existing:
+            con.execute(text(f"CREATE INDEX ix_user_stats_{column} ON user_stats ({column})"))
+
+    user_stats.rebuild(con)
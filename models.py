@@ -0,0 +1,110 @@
+from datetime import datetime
+from extensions import db
+from rendering import render_markdown, RENDERER_VERSION
+
+class User(db.Model):
+    """User model for DB"""
+
+    id = db.Column(db.Integer, primary_key = True)
+    username = db.Column(db.String(20), nullable = False, unique = True)
+    email = db.Column(db.String(50), nullable = False, unique = True)
+    password = db.Column(db.String, nullable = False)
+    about = db.Column(db.Text)
+
+    # Bumped whenever the user's profile page changes, including their posts
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+    # References the Post class
+    # Allows posts to access the User that created it
+    posts = db.relationship('Post', backref = 'author', lazy = True)
+
+    def __init__(self, username, email, password):
+        self.username = username
+        self.email = email
+        self.password = password
+
+    def __repr__(self):
+        return f'User({self.username}, {self.email})'
+
+class Post(db.Model):
+    """Post model for DB"""
+
+    # Maximum length of the precomputed excerpt shown by list pages
+    EXCERPT_LENGTH = 200
+
+    id = db.Column(db.Integer, primary_key = True)
+    date_created = db.Column(db.DateTime, nullable = False, index = True)
+    title = db.Column(db.String(100), nullable = False)
+    content = db.Column(db.Text, nullable = False)
+
+    # Summary of the content so list pages never have to read the full body
+    excerpt = db.Column(db.String(EXCERPT_LENGTH + 1))
+    word_count = db.Column(db.Integer, nullable = False, default = 0)
+
+    # The content rendered from Markdown when it is written, and the renderer version that rendered it
+    content_html = db.Column(db.Text)
+    renderer_version = db.Column(db.Integer)
+
+    # Bumped on every edit, used as the post's HTTP cache validator
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+    # Written behind the requests by the view counter, see view_counts.py
+    # They don't bump updated_at, so counting views never invalidates a cached page
+    views = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    trending_score = db.Column(db.Float, nullable = False, default = 0, server_default = '0', index = True)
+
+    # Foreign key references the author's User's id
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
+
+    def __init__(self, author_id, title, content):
+        self.date_created = datetime.utcnow()
+        self.title = title
+        self.content = content
+        self.excerpt, self.word_count = Post.Summarize(content)
+        self.content_html, self.renderer_version = render_markdown(content), RENDERER_VERSION
+        self.updated_at = self.date_created
+        self.author_id = author_id
+
+    def __repr__(self):
+        return f'Post({self.author}, {self.date_created}, {self.title})'
+
+    @staticmethod
+    def Summarize(content):
+        """Returns the excerpt and word count of a post's content"""
+
+        words = str(content).split()
+
+        # Words are at least a character with a space between, so this many always fill the excerpt
+        excerpt = ' '.join(words[:Post.EXCERPT_LENGTH // 2 + 1])
+
+        # Cut long excerpts on a word boundary and mark them as truncated
+        if len(excerpt) > Post.EXCERPT_LENGTH:
+            excerpt = excerpt[:Post.EXCERPT_LENGTH + 1].rsplit(' ', 1)[0][:Post.EXCERPT_LENGTH] + '\u2026'
+
+        return excerpt, len(words)
+
+class TrendingState(db.Model):
+    """When the trending scores were last decayed, as Unix time in a single row with id 1"""
+
+    __tablename__ = 'trending_state'
+
+    id = db.Column(db.Integer, primary_key = True)
+    decayed_at = db.Column(db.Float, nullable = False)
+
+class UserStats(db.Model):
+    """Each author's post count, total words and latest post date, kept by the post write handlers"""
+
+    # Profiles and the authors page read these instead of aggregating the author's posts
+    # flask check-stats compares them with the posts and rebuilds them, see user_stats.py
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key = True)
+    post_count = db.Column(db.Integer, nullable = False, default = 0, index = True)
+    word_count = db.Column(db.Integer, nullable = False, default = 0, index = True)
+    latest_post_at = db.Column(db.DateTime)
+
+# Columns read by every page that lists posts, the full content is only read by View_Post
+POST_SUMMARY = 'p.id, p.title, p.excerpt, p.word_count, p.date_created AS date, "user".username AS author'
+
+# Serves the profile pages' WHERE author_id = :id ORDER BY id DESC without a sort
+db.Index('ix_post_author_id_id', Post.author_id, Post.id.desc())
@@ -0,0 +1,257 @@
+from flask import current_app, g, request, session, make_response
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock, RLock
+from local_sqlite import LocalSQLite
+import sqlite3
+
+class MemoryBackend:
+    """Bounded in-process LRU store for rendered pages"""
+
+    def __init__(self, max_entries = 1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key -> (body, mimetype, tags)
+        self.tags = {} # tag -> set of keys
+        self.lock = RLock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.delete(key)
+            self.entries[key] = entry
+            for tag in entry[2]:
+                self.tags.setdefault(tag, set()).add(key)
+
+            # Evict the least recently used pages
+            while len(self.entries) > self.max_entries:
+                self.delete(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+
+            for tag in entry[2]:
+                keys = self.tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.tags[tag]
+
+    def invalidate(self, tag):
+        with self.lock:
+            for key in list(self.tags.get(tag, ())):
+                self.delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+class SQLiteBackend:
+    """Bounded store for rendered pages in a SQLite file, shared by every worker process on the machine"""
+
+    # Invalidating here drops the page for every worker, where each MemoryBackend only sees its own process's writes
+    # An invalidation that can't get the lock is kept and retried by this process's next write to the cache, and until
+    # it goes through the pages it covers are misses here, so a committed write never fails or shows stale pages after it
+
+    def __init__(self, path, max_entries = 1024):
+        self.max_entries = max_entries
+
+        # A crash only loses pages that are rendered again
+        self.file = LocalSQLite(path, timeout = 5.0, schema = [
+            "CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, body BLOB NOT NULL, mimetype TEXT NOT NULL, tags TEXT NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS page_tag (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID",
+            "CREATE INDEX IF NOT EXISTS page_tag_key ON page_tag (key)"
+        ])
+        self.lock = Lock()
+        self.stale = set() # ('tag', tag), ('key', key) or ('all',) still to be dropped from the file
+
+    def _delete(self, con, keys):
+        con.executemany("DELETE FROM page WHERE (key = ?)", [(key,) for key in keys])
+        con.executemany("DELETE FROM page_tag WHERE (key = ?)", [(key,) for key in keys])
+
+    def _write(self, change):
+        """Runs the change in a write transaction, returning False if another worker held the lock past the timeout"""
+
+        con = self.file.connection()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            return False
+        try:
+            change(con)
+        except:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+        return True
+
+    def _drop(self, *items):
+        """Drops the pages covered by the items along with any still stale, returning False if they have to wait"""
+
+        with self.lock:
+            self.stale.update(items)
+            stale = set(self.stale)
+        if not stale:
+            return True
+
+        def change(con):
+            if ('all',) in stale:
+                con.execute("DELETE FROM page")
+                con.execute("DELETE FROM page_tag")
+                return
+            keys = [item[1] for item in stale if item[0] == 'key']
+            for item in stale:
+                if item[0] == 'tag':
+                    keys += [row[0] for row in con.execute("SELECT key FROM page_tag WHERE (tag = ?)", (item[1],))]
+            self._delete(con, keys)
+
+        try:
+            dropped = self._write(change)
+        except sqlite3.OperationalError:
+            dropped = False
+        if dropped:
+            with self.lock:
+                self.stale -= stale
+        return dropped
+
+    def _is_stale(self, key, tags):
+        with self.lock:
+            return bool(self.stale) and (('all',) in self.stale or ('key', key) in self.stale or any(('tag', tag) in self.stale for tag in tags))
+
+    def get(self, key):
+        # A busy cache is a miss, the page is rendered instead
+        try:
+            row = self.file.connection().execute("SELECT body, mimetype, tags FROM page WHERE (key = ?)", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row is None:
+            return None
+
+        tags = frozenset(row[2].split('\n')) - {''}
+        return None if self._is_stale(key, tags) else (row[0], row[1], tags)
+
+    def set(self, key, entry):
+        if self.stale and not self._drop():
+            return # Pages rendered meanwhile could be stale, they are cached once the lock is free again
+
+        body, mimetype, tags = entry
+
+        def change(con):
+            self._delete(con, [key])
+            con.execute("INSERT INTO page (key, body, mimetype, tags) VALUES (?, ?, ?, ?)", (key, body, mimetype, '\n'.join(tags)))
+            con.executemany("INSERT INTO page_tag (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+
+            # Evict the pages cached longest ago, rowids grow with every insert
+            evicted = [row[0] for row in con.execute("SELECT key FROM page ORDER BY rowid DESC LIMIT -1 OFFSET ?", (self.max_entries,))]
+            self._delete(con, evicted)
+
+        # Another worker holds the lock, the page is cached next time
+        self._write(change)
+
+    def delete(self, key):
+        return self._drop(('key', key))
+
+    def invalidate(self, tag):
+        return self._drop(('tag', tag))
+
+    def clear(self):
+        return self._drop(('all',))
+
+class PageCache:
+    """Caches rendered GET responses by route, parameters and viewer, invalidated by tags"""
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Creates the backend chosen by PAGE_CACHE_BACKEND ('memory', 'sqlite' or None to disable)"""
+
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_SIZE', 1024)
+        app.config.setdefault('PAGE_CACHE_PATH', 'page_cache.db')
+
+        backend = app.config['PAGE_CACHE_BACKEND']
+        if backend == 'memory':
+            app.extensions['page_cache'] = MemoryBackend(app.config['PAGE_CACHE_SIZE'])
+        elif backend in ('sqlite', 'shelf'): # 'shelf' is the name of the on-disk backend this replaced
+            app.extensions['page_cache'] = SQLiteBackend(app.config['PAGE_CACHE_PATH'], app.config['PAGE_CACHE_SIZE'])
+        elif backend is None:
+            app.extensions['page_cache'] = None
+        else:
+            raise ValueError(f"Unknown page cache backend: {backend}")
+
+    @property
+    def backend(self):
+        """The current app's backend, None when caching is disabled"""
+
+        return current_app.extensions.get('page_cache')
+
+    @staticmethod
+    def key():
+        """Builds the cache key of the current request"""
+
+        # Pages show edit controls and the navbar differently to each logged in user,
+        # so their entries are kept apart from each other and from anonymous ones
+        viewer = f"user:{session['user_id']}" if 'user_id' in session else 'anonymous'
+        view_args = sorted((request.view_args or {}).items())
+        args = sorted(request.args.items(multi = True))
+        return f"{request.endpoint}|{view_args}|{args}|{viewer}"
+
+    def tag(self, *tags):
+        """Adds tags to the page being rendered, for tags only known once the view has run"""
+
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+    def cached(self, *tags):
+        """Decorates a view to cache its successful responses under the given tags"""
+
+        # Tags are formatted with the view's arguments, e.g. 'post:{post_id}'
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if self.backend is None or request.method != 'GET':
+                    return view(**kwargs)
+
+                key = self.key()
+                entry = self.backend.get(key)
+                if entry is not None:
+                    body, mimetype, _ = entry
+                    response = make_response(body)
+                    response.mimetype = mimetype
+                    return response
+
+                g.page_cache_tags = {tag.format(**kwargs) for tag in tags}
+                response = make_response(view(**kwargs))
+
+                # Only cache complete pages, never redirects or errors
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, (response.get_data(), response.mimetype, frozenset(g.page_cache_tags)))
+
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        """Drops every cached page tagged with any of the tags"""
+
+        # Runs after writes have committed, so a busy cache is logged rather than failing the request
+        if self.backend is not None:
+            for tag in tags:
+                if self.backend.invalidate(tag) is False:
+                    current_app.logger.warning(f"Invalidating the cached pages tagged {tag} is waiting for the cache's lock, retrying on the next write to it")
+
+    def clear(self):
+        """Drops every cached page"""
+
+        if self.backend is not None and self.backend.clear() is False:
+            current_app.logger.warning("Clearing the page cache is waiting for the cache's lock, retrying on the next write to it")
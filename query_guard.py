@@ -0,0 +1,79 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from contextlib import contextmanager
+from database import on_engine
+
+class TooManyQueriesError(Exception):
+    """Raised when a request issues more SQL statements than it is allowed to"""
+
+class QueryCountGuard:
+    """Counts the SQL statements issued by each request to catch N+1 query patterns"""
+
+    # The limit comes from MAX_QUERIES_PER_REQUEST, overridden per endpoint by QUERY_LIMITS
+    # Requests over the limit raise TooManyQueriesError in debug and testing, and are logged otherwise
+
+    def __init__(self, app = None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Hooks the guard into the app's requests and its engine's statements"""
+
+        self.app = app
+        app.config.setdefault('MAX_QUERIES_PER_REQUEST', None)
+        app.config.setdefault('QUERY_LIMITS', {})
+
+        on_engine(app, lambda engine: event.listen(engine, 'before_cursor_execute', self._count))
+        app.before_request(self._start)
+        app.after_request(self._check)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'query_count' in g:
+            g.query_count += 1
+            g.queries.append(statement)
+
+    def _start(self):
+        g.query_count = 0
+        g.queries = []
+
+    def _check(self, response):
+        limit = self.app.config['QUERY_LIMITS'].get(request.endpoint, self.app.config['MAX_QUERIES_PER_REQUEST'])
+        if limit is None:
+            return response
+
+        description = f"{request.method} {request.path} ({request.endpoint})"
+        if response.is_streamed:
+            # Streamed pages run most of their queries as they are sent, so count them once the stream is done
+            # It is too late to fail the response then, so they are only logged
+            state = g._get_current_object()
+            response.call_on_close(lambda: self._report(description, state.query_count, state.queries, limit, False))
+        else:
+            self._report(description, g.get('query_count', 0), g.get('queries', []), limit, self.app.debug or self.app.testing)
+
+        return response
+
+    def _report(self, description, count, queries, limit, fail):
+        if count > limit:
+            message = f"{description} issued {count} SQL statements, the limit is {limit}"
+            if fail:
+                raise TooManyQueriesError(message + ":\n" + "\n".join(queries))
+            self.app.logger.warning(message)
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """Fails the block if it issues more than limit SQL statements, for use in tests and scripts"""
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    if len(statements) > limit:
+        raise TooManyQueriesError(f"Issued {len(statements)} SQL statements, the limit is {limit}:\n" + "\n".join(statements))
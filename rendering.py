@@ -0,0 +1,67 @@
+from sqlalchemy.sql import text
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import markdown
+import bleach
+import os
+
+# Stored with every rendered post, bump it whenever the output for the same Markdown changes:
+# the extensions, the allowed tags or the pinned Markdown and bleach versions
+# Then run flask render-posts to re-render the posts rendered by an older version
+RENDERER_VERSION = 1
+
+# nl2br keeps the line breaks of posts written before Markdown, which were shown as typed
+EXTENSIONS = ['fenced_code', 'sane_lists', 'nl2br']
+
+ALLOWED_TAGS = ['p', 'br', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'em', 'strong', 'code', 'pre', 'blockquote', 'ul', 'ol', 'li', 'a']
+ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
+
+def allowed_attribute(tag, name, value):
+    # Fenced code blocks name their language in a class
+    if tag == 'code':
+        return name == 'class' and value.startswith('language-')
+    return tag == 'a' and name in ('href', 'title', 'rel')
+
+def render_markdown(content):
+    """Renders a post's Markdown into HTML that is safe to show as is"""
+
+    html = markdown.markdown(str(content), extensions = EXTENSIONS, output_format = 'html5')
+
+    # Raw HTML in the post is escaped, not stripped, so it shows as the author typed it
+    html = bleach.clean(html, tags = ALLOWED_TAGS, attributes = allowed_attribute, protocols = ALLOWED_PROTOCOLS)
+    return bleach.linkify(html, callbacks = [bleach.callbacks.nofollow], skip_tags = ['pre', 'code'])
+
+def render_posts(con, batch_size = 200, workers = None, everything = False, log = print):
+    """Re-renders the posts rendered by another renderer version, a batch at a time across a process pool, and returns how many"""
+
+    # Rendering is pure CPU, so threads would only take turns holding the GIL
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    stale = "" if everything else "AND (renderer_version IS NULL OR renderer_version != :version) "
+    statement = text(f"SELECT id, content, updated_at FROM post WHERE (id > :last_id {stale}) ORDER BY id LIMIT :limit")
+
+    rendered, last_id = 0, 0
+    try:
+        while True:
+            rows = con.execute(statement, last_id = last_id, version = RENDERER_VERSION, limit = batch_size).fetchall()
+            if not rows:
+                break
+
+            contents = [row.content for row in rows]
+            htmls = pool.map(render_markdown, contents, chunksize = max(1, len(rows) // (4 * workers))) if pool else map(render_markdown, contents)
+
+            # A post edited since it was read keeps the HTML its edit rendered
+            # Its updated_at moves on too, so browsers and caches revalidate the page
+            now = datetime.utcnow()
+            params = [{'id': row.id, 'html': html, 'version': RENDERER_VERSION, 'now': now, 'updated_at': row.updated_at} for row, html in zip(rows, htmls)]
+            with con.begin():
+                con.execute(text("UPDATE post SET content_html = :html, renderer_version = :version, updated_at = :now WHERE (id = :id AND updated_at = :updated_at)"), params)
+
+            rendered += len(rows)
+            last_id = rows[-1].id
+            log(f"Rendered {rendered} posts")
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return rendered
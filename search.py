@@ -0,0 +1,368 @@
+from sqlalchemy.sql import text
+from sqlalchemy.exc import OperationalError
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from threading import Lock
+import math
+import re
+import time
+
+# Words are runs of letters, digits and underscores, matched case-insensitively
+# This mirrors the unicode61 tokenizer FTS5 uses so both backends agree
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# BM25 weights for the title, content and username columns
+POST_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Select the searchable text of a post together with its author's username
+POST_DOCUMENT = 'SELECT p.id, p.title, p.content, "user".username FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id)'
+
+# A refresh rereads the rows updated this long before the last one started, so writes that committed
+# after their timestamp, or were stamped by a clock running behind, are still picked up
+REFRESH_OVERLAP = timedelta(seconds = 60)
+
+def tokenize(value):
+    """Splits a string into lowercase search tokens"""
+
+    return TOKEN_RE.findall(str(value or '').lower())
+
+class FTS5SearchIndex:
+    """Search index backed by SQLite FTS5 virtual tables"""
+
+    name = 'fts5'
+
+    def setup(self, con):
+        """Creates the virtual tables if they don't exist yet and fills them if they are empty, returning True if it did"""
+
+        self._create(con)
+
+        # Tables just added to an existing database would otherwise find nothing until flask rebuild-search
+        for table, indexed in (('post', 'post_fts'), ('"user"', 'user_fts')):
+            if con.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() and not con.execute(text(f"SELECT 1 FROM {indexed} LIMIT 1")).first():
+                self.rebuild(con)
+                return True
+        return False
+
+    def _create(self, con):
+        con.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, content, username, tokenize = 'unicode61')"))
+        con.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(username, tokenize = 'unicode61')"))
+
+    def rebuild(self, con):
+        """Reindexes every post and user from scratch"""
+
+        self._create(con)
+        con.execute(text("DELETE FROM post_fts"))
+        con.execute(text(f"INSERT INTO post_fts (rowid, title, content, username) {POST_DOCUMENT}"))
+        con.execute(text("DELETE FROM user_fts"))
+        con.execute(text('INSERT INTO user_fts (rowid, username) SELECT id, username FROM "user"'))
+
+    def index_post(self, con, post_id):
+        """Adds or replaces a post in the index"""
+
+        con.execute(text("DELETE FROM post_fts WHERE rowid = :id"), id = post_id)
+        con.execute(text(f"INSERT INTO post_fts (rowid, title, content, username) {POST_DOCUMENT} WHERE (p.id = :id)"), id = post_id)
+
+    def remove_post(self, con, post_id):
+        """Removes a post from the index"""
+
+        con.execute(text("DELETE FROM post_fts WHERE rowid = :id"), id = post_id)
+
+    def index_user(self, con, user_id):
+        """Adds or replaces a user in the index"""
+
+        con.execute(text("DELETE FROM user_fts WHERE rowid = :id"), id = user_id)
+        con.execute(text('INSERT INTO user_fts (rowid, username) SELECT id, username FROM "user" WHERE (id = :id)'), id = user_id)
+
+    def search_posts(self, con, query, limit, offset = 0):
+        """Returns the BM25-ranked ids of matching posts and the total number of matches"""
+
+        match = self._match(query)
+        if not match:
+            return [], 0
+
+        statement = text("SELECT COUNT(1) FROM post_fts WHERE post_fts MATCH :match")
+        total = con.execute(statement, match = match).scalar()
+
+        statement = text("SELECT rowid FROM post_fts WHERE post_fts MATCH :match ORDER BY bm25(post_fts, :w_title, :w_content, :w_username) LIMIT :limit OFFSET :offset")
+        w_title, w_content, w_username = POST_WEIGHTS
+        rows = con.execute(statement, match = match, w_title = w_title, w_content = w_content, w_username = w_username, limit = limit, offset = offset).fetchall()
+
+        return [row[0] for row in rows], total
+
+    def search_users(self, con, query, limit, offset = 0):
+        """Returns the BM25-ranked ids of matching users and the total number of matches"""
+
+        match = self._match(query)
+        if not match:
+            return [], 0
+
+        statement = text("SELECT COUNT(1) FROM user_fts WHERE user_fts MATCH :match")
+        total = con.execute(statement, match = match).scalar()
+
+        statement = text("SELECT rowid FROM user_fts WHERE user_fts MATCH :match ORDER BY bm25(user_fts) LIMIT :limit OFFSET :offset")
+        rows = con.execute(statement, match = match, limit = limit, offset = offset).fetchall()
+
+        return [row[0] for row in rows], total
+
+    @staticmethod
+    def _match(query):
+        """Builds an FTS5 MATCH expression that prefix-matches every token of the query"""
+
+        # Quoting each token keeps FTS5 operators in user input from being interpreted
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+class InvertedIndex:
+    """In-memory inverted index with BM25 scoring over weighted fields"""
+
+    # Standard BM25 tuning parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.postings = defaultdict(dict) # token -> {doc_id: weighted term frequency}
+        self.documents = {} # doc_id -> (weighted length, tokens)
+        self.vocabulary = [] # Sorted tokens, used for prefix lookups
+        self.total_length = 0.0
+
+    def clear(self):
+        """Removes every document"""
+
+        self.postings.clear()
+        self.documents.clear()
+        self.vocabulary = []
+        self.total_length = 0.0
+
+    def add(self, doc_id, fields):
+        """Adds or replaces a document made of one value per weighted field"""
+
+        self.remove(doc_id)
+
+        frequencies = defaultdict(float)
+        length = 0.0
+        for weight, value in zip(self.weights, fields):
+            for token in tokenize(value):
+                frequencies[token] += weight
+                length += weight
+
+        for token, frequency in frequencies.items():
+            if token not in self.postings:
+                self.vocabulary.insert(bisect_left(self.vocabulary, token), token)
+            self.postings[token][doc_id] = frequency
+
+        self.documents[doc_id] = (length, tuple(frequencies))
+        self.total_length += length
+
+    def remove(self, doc_id):
+        """Removes a document if it is indexed"""
+
+        if doc_id not in self.documents:
+            return
+
+        length, tokens = self.documents.pop(doc_id)
+        self.total_length -= length
+
+        for token in tokens:
+            postings = self.postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+                self.vocabulary.pop(bisect_left(self.vocabulary, token))
+
+    def expand(self, prefix):
+        """Returns every indexed token starting with prefix"""
+
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def search(self, query):
+        """Returns (doc_id, score) pairs for documents matching every query token, best first"""
+
+        tokens = tokenize(query)
+        if not tokens or not self.documents:
+            return []
+
+        count = len(self.documents)
+        average = self.total_length / count or 1.0
+        scores = None
+
+        # Every query token must match (as a prefix), like FTS5's implicit AND
+        for token in tokens:
+            token_scores = defaultdict(float)
+            for term in self.expand(token):
+                postings = self.postings[term]
+                idf = math.log((count - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+                for doc_id, frequency in postings.items():
+                    length = self.documents[doc_id][0]
+                    token_scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average))
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc_id: score + token_scores[doc_id] for doc_id, score in scores.items() if doc_id in token_scores}
+
+            if not scores:
+                return []
+
+        # Ties are broken by newest first
+        return sorted(scores.items(), key = lambda item: (-item[1], -item[0]))
+
+class MemorySearchIndex:
+    """Pure-Python fallback for SQLite builds without FTS5, and for Postgres"""
+
+    # Every process holds its own copy of the whole index, all post content included
+    # Its own writes are applied once they commit, so a rolled back write never shows up in results
+    # Writes by other processes are picked up from the updated_at columns every refresh_interval seconds
+
+    name = 'memory'
+
+    def __init__(self, after_commit = None, refresh_interval = 60.0):
+        self.posts = InvertedIndex(POST_WEIGHTS)
+        self.users = InvertedIndex((1.0,))
+        self.lock = Lock()
+        self.ready = False
+        self.after_commit = after_commit # Callable deferring a change until the transaction commits, None applies it at once
+        self.refresh_interval = refresh_interval # Seconds, None never refreshes
+        self.refreshed_at = None # The database time the index was last brought up to date at
+        self.refresh_due = 0.0
+
+    def setup(self, con):
+        """Builds the index from the database the first time it is used"""
+
+        if not self.ready:
+            self.rebuild(con)
+
+    def rebuild(self, con):
+        """Reindexes every post and user from scratch"""
+
+        started = datetime.utcnow()
+        posts = con.execute(text(POST_DOCUMENT)).fetchall()
+        users = con.execute(text('SELECT id, username FROM "user"')).fetchall()
+
+        with self.lock:
+            self.posts.clear()
+            for post in posts:
+                self.posts.add(post[0], post[1:])
+
+            self.users.clear()
+            for user in users:
+                self.users.add(user[0], user[1:])
+
+            self.ready = True
+            self._refreshed(started)
+
+    def refresh(self, con):
+        """Picks up the posts and users written by other processes since the last refresh, and drops deleted posts"""
+
+        started = datetime.utcnow()
+        since = self.refreshed_at - REFRESH_OVERLAP
+        posts = con.execute(text(f"{POST_DOCUMENT} WHERE (p.updated_at >= :since)"), since = since).fetchall()
+        users = con.execute(text('SELECT id, username FROM "user" WHERE (updated_at >= :since)'), since = since).fetchall()
+        existing = {row[0] for row in con.execute(text("SELECT id FROM post"))}
+
+        with self.lock:
+            for post in posts:
+                self.posts.add(post[0], post[1:])
+            for user in users:
+                self.users.add(user[0], user[1:])
+            for post_id in set(self.posts.documents) - existing:
+                self.posts.remove(post_id)
+            self._refreshed(started)
+
+    def _refreshed(self, started):
+        self.refreshed_at = started
+        if self.refresh_interval is not None:
+            self.refresh_due = time.monotonic() + self.refresh_interval
+
+    def _refresh_if_due(self, con):
+        if self.refresh_interval is None or time.monotonic() < self.refresh_due:
+            return
+
+        # One search refreshes, the ones arriving meanwhile search the index as it is
+        with self.lock:
+            if time.monotonic() < self.refresh_due:
+                return
+            self.refresh_due = time.monotonic() + self.refresh_interval
+        self.refresh(con)
+
+    def _apply(self, change):
+        if self.after_commit is None:
+            change()
+        else:
+            self.after_commit(change)
+
+    def index_post(self, con, post_id):
+        """Adds or replaces a post in the index once the transaction commits"""
+
+        # Read inside the transaction, which sees the post as written
+        post = con.execute(text(f"{POST_DOCUMENT} WHERE (p.id = :id)"), id = post_id).first()
+
+        def change():
+            with self.lock:
+                if post:
+                    self.posts.add(post[0], post[1:])
+                else:
+                    self.posts.remove(post_id)
+        self._apply(change)
+
+    def remove_post(self, con, post_id):
+        """Removes a post from the index once the transaction commits"""
+
+        def change():
+            with self.lock:
+                self.posts.remove(post_id)
+        self._apply(change)
+
+    def index_user(self, con, user_id):
+        """Adds or replaces a user in the index once the transaction commits"""
+
+        user = con.execute(text('SELECT id, username FROM "user" WHERE (id = :id)'), id = user_id).first()
+
+        def change():
+            with self.lock:
+                if user:
+                    self.users.add(user[0], user[1:])
+                else:
+                    self.users.remove(user_id)
+        self._apply(change)
+
+    def search_posts(self, con, query, limit, offset = 0):
+        """Returns the BM25-ranked ids of matching posts and the total number of matches"""
+
+        self._refresh_if_due(con)
+        with self.lock:
+            results = self.posts.search(query)
+        return [doc_id for doc_id, score in results[offset:offset + limit]], len(results)
+
+    def search_users(self, con, query, limit, offset = 0):
+        """Returns the BM25-ranked ids of matching users and the total number of matches"""
+
+        self._refresh_if_due(con)
+        with self.lock:
+            results = self.users.search(query)
+        return [doc_id for doc_id, score in results[offset:offset + limit]], len(results)
+
+def fts5_available(con):
+    """Checks whether the connected database is an SQLite build compiled with FTS5"""
+
+    if con.dialect.name != 'sqlite':
+        return False
+
+    try:
+        con.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(value)"))
+        con.execute(text("DROP TABLE IF EXISTS temp.fts5_probe"))
+        return True
+    except OperationalError:
+        return False
+
+def create_search_index(con, backend = 'auto', after_commit = None, refresh_interval = 60.0):
+    """Creates the search index for the backend ('auto', 'fts5' or 'memory')"""
+
+    # FTS5 tables are written in the transaction itself, only the memory index needs after_commit and refreshing
+    if backend == 'fts5' or (backend == 'auto' and fts5_available(con)):
+        return FTS5SearchIndex()
+    return MemorySearchIndex(after_commit, refresh_interval)
@@ -14,4 +14,55 @@ $(document).ready(function() {
     });
     $('.textarea-expand').trigger('keypress')
 
+    // Load the next page of a feed in place of following its "Older posts" link
+    function loadMore(link) {
+        var feed = link.prev('.feed');
+
+        if (link.data('loading')) {
+            return;
+        }
+        link.data('loading', true);
+
+        var url = new URL(feed.data('feed-url'), window.location.href);
+        url.searchParams.set('before', link.data('next'));
+
+        fetch(url).then(function(response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function(page) {
+            feed.append(page.html);
+
+            if (page.next) {
+                link.data('next', page.next);
+                link.attr('href', link.attr('href').replace(/before=\d+/, 'before=' + page.next));
+                link.data('loading', false);
+            } else {
+                link.remove();
+            }
+        }).catch(function() {
+            // Fall back to a full page load
+            window.location = link.attr('href');
+        });
+    }
+
+    $('.feed-more').each(function() {
+        var link = $(this);
+
+        link.on('click', function(e) {
+            e.preventDefault();
+            loadMore(link);
+        });
+
+        // Infinite scroll: load the next page as the link comes into view
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(function(entries) {
+                if (entries[0].isIntersecting) {
+                    loadMore(link);
+                }
+            }, { rootMargin: '200px' }).observe(this);
+        }
+    });
+
 });
\ No newline at end of file
@@ -0,0 +1,45 @@
+import os
+import pytest
+import sys
+
+# The app's modules are imported by name from the repository root, as App.py imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope = 'session')
+def make_app():
+    """Returns a function that creates an app on a new database in the given folder"""
+
+    def make_app(folder, config = {}, users = ()):
+        from App import create_app
+        from extensions import db
+        from models import User
+
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(folder / 'blog.db'),
+            'FEEDS_FOLDER': str(folder / 'feeds'),
+            'SITE_URL': 'https://blog.example/',
+            'PASSWORD_HASH_N': 2 ** 10, # Hashing at the real cost would slow every test that logs in
+            **config
+        })
+        app.test_cli_runner().invoke(args = ['upgrade-db'])
+        with app.app_context():
+            db.session.add_all(User(*user) for user in users)
+            db.session.commit()
+        return app
+
+    return make_app
+
+@pytest.fixture
+def config():
+    """Settings a test module adds to or overrides in the app's config"""
+    return {}
+
+@pytest.fixture
+def users():
+    """The (username, email, password) of each user the app starts with"""
+    return [('author', 'author@example.com', 'password')]
+
+@pytest.fixture
+def app(make_app, tmp_path, config, users):
+    return make_app(tmp_path, config, users)
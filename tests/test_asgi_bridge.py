@@ -0,0 +1,70 @@
+from asgi_bridge import ASGIBridge
+from flask import Flask, Response
+import asyncio
+
+def streaming_app(rendered, closed):
+    app = Flask(__name__)
+    app.config['ASGI_QUEUE_SIZE'] = 2
+
+    @app.route('/stream')
+    def Stream():
+        def generate():
+            try:
+                for n in range(100):
+                    rendered.append(n)
+                    yield f'{n}\n'
+            finally:
+                closed.append(True)
+        return Response(generate())
+
+    return ASGIBridge(app)
+
+def request(bridge, read):
+    """Runs one GET /stream through the bridge, with read(message) standing in for the client"""
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/stream', 'query_string': b'', 'headers': []}
+    disconnected = asyncio.Event()
+
+    async def main():
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if await read(message):
+                disconnected.set()
+
+        await bridge(scope, receive, send)
+
+    asyncio.run(main())
+
+def test_a_slow_client_holds_back_the_render():
+    rendered, closed, ahead = [], [], []
+
+    async def read(message):
+        if message['type'] == 'http.response.body' and message.get('more_body'):
+            # The app may only run a queue's length ahead of what the client has read
+            ahead.append(len(rendered) - int(message['body']))
+            await asyncio.sleep(0.001)
+        return False
+
+    request(streaming_app(rendered, closed), read)
+    assert len(rendered) == 100 and closed
+    assert max(ahead) <= 4
+
+def test_a_disconnect_stops_the_render():
+    rendered, closed, bodies = [], [], []
+
+    async def read(message):
+        if message['type'] == 'http.response.body':
+            bodies.append(message['body'])
+        await asyncio.sleep(0.01)
+        return len(bodies) == 3
+
+    request(streaming_app(rendered, closed), read)
+    assert closed
+    assert len(rendered) < 100
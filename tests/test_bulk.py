@@ -0,0 +1,43 @@
+import json
+import pytest
+from extensions import db
+from sqlalchemy.sql import text
+
+@pytest.fixture
+def users():
+    # The author is brought in by import-users instead
+    return []
+
+@pytest.fixture
+def app(app, tmp_path):
+    users = tmp_path / 'users.jsonl'
+    users.write_text(json.dumps({'username': 'author', 'email': 'author@example.com', 'password': 'password'}) + '\n')
+    app.test_cli_runner().invoke(args = ['import-users', str(users)])
+    return app
+
+def test_a_clashing_id_names_its_post_and_keeps_the_earlier_batches(app, tmp_path):
+    posts = tmp_path / 'posts.jsonl'
+    records = [{'id': n, 'title': f'Post {n}', 'content': 'Imported words', 'author': 'author'} for n in (1, 2, 3, 2)]
+    posts.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+    result = app.test_cli_runner().invoke(args = ['import-posts', str(posts), '--keep-ids', '--batch-size', '2', '--workers', '1'])
+    assert result.exit_code != 0
+    assert "Post 'Post 2' has the id 2" in result.output
+
+    # The first batch was committed, so it is counted and indexed
+    with app.app_context(), db.engine.connect() as con:
+        assert con.execute(text("SELECT post_count FROM user_stats")).scalar() == 2
+
+        from views.common import Get_Search_Index
+        assert Get_Search_Index().search_posts(con, 'imported', 10)[1] == 2
+
+def test_a_password_that_only_looks_hashed_is_hashed_on_import(app, tmp_path):
+    from credentials import parse_hash
+
+    users = tmp_path / 'more_users.jsonl'
+    users.write_text(json.dumps({'username': 'other', 'email': 'other@example.com', 'password': 'scrypt$foo'}) + '\n')
+    app.test_cli_runner().invoke(args = ['import-users', str(users)])
+
+    with app.app_context(), db.engine.connect() as con:
+        stored = con.execute(text("SELECT password FROM \"user\" WHERE (username = 'other')")).scalar()
+    assert parse_hash(stored) is not None
@@ -0,0 +1,19 @@
+import pytest
+from credentials import PasswordPool, parse_hash
+
+@pytest.fixture
+def pool():
+    return PasswordPool({'PASSWORD_HASH_N': 2 ** 10, 'PASSWORD_HASH_R': 8, 'PASSWORD_HASH_P': 1, 'PASSWORD_WORKERS': 1, 'PASSWORD_QUEUE_TIMEOUT': 2.0})
+
+def test_a_hash_verifies_and_parses(pool):
+    stored = pool.hash('password')
+
+    assert parse_hash(stored) is not None
+    assert pool.verify(stored, 'password') == (True, False)
+    assert pool.verify(stored, 'wrong') == (False, False)
+
+@pytest.mark.parametrize('stored', ['scrypt$', 'scrypt$foo', 'scrypt$x$8$1$c2FsdA==$a2V5', 'scrypt$1024$8$1$c2FsdA==$a2V5$more', 'scrypt$1000$8$1$c2FsdA==$a2V5', 'scrypt$1024$8$1$not base64$a2V5'])
+def test_a_malformed_hash_is_a_legacy_password(pool, stored):
+    assert parse_hash(stored) is None
+    assert pool.verify(stored, stored) == (True, True)
+    assert pool.verify(stored, 'password') == (False, True)
@@ -0,0 +1,26 @@
+import pytest
+import re
+
+@pytest.mark.parametrize('path', ['/atom.xml', '/profile/author/atom.xml'])
+def test_a_feed_without_entries_has_an_updated_date(app, path):
+    response = app.test_client().get(path)
+
+    assert response.status_code == 200
+    assert b'<entry>' not in response.data
+    assert re.search(rb'<updated>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ</updated>', response.data)
+
+@pytest.mark.parametrize('path', ['/atom.xml', '/sitemap.xml', '/sitemaps/users-0.xml'])
+def test_feeds_link_to_the_site_url_whatever_host_the_request_names(app, path):
+    spoofed = app.test_client().get(path, headers = {'Host': 'evil.example'})
+    assert spoofed.status_code == 200
+    assert b'evil.example' not in spoofed.data
+    assert b'https://blog.example/' in spoofed.data
+
+    # The file written for that request is the one every later reader gets
+    assert b'evil.example' not in app.test_client().get(path).data
+
+def test_feeds_are_not_written_without_a_site_url(app):
+    app.extensions['feeds'].base_url = None
+
+    assert app.test_client().get('/sitemap.xml', headers = {'Host': 'evil.example'}).status_code == 404
+    assert app.test_client().get('/atom.xml').status_code == 404
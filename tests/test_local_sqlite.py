@@ -0,0 +1,19 @@
+from local_sqlite import LocalSQLite
+from threading import Thread
+
+def test_each_thread_and_process_opens_its_own_connection(tmp_path):
+    file = LocalSQLite(str(tmp_path / 'local.db'), timeout = 1.0, schema = ["CREATE TABLE IF NOT EXISTS item (n INTEGER)"])
+    con = file.connection()
+    assert file.connection() is con
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    others = []
+    thread = Thread(target = lambda: others.append(file.connection()))
+    thread.start()
+    thread.join()
+    assert others[0] is not con
+
+    # A forked child finds the parent's pid and opens a new connection
+    file.pid -= 1
+    assert file.connection() is not con
+    assert file.connection().execute("SELECT COUNT(*) FROM item").fetchone()[0] == 0
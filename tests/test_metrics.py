@@ -0,0 +1,21 @@
+from metrics import Histogram
+
+def test_histogram_overflow_is_counted_apart_from_the_sum():
+    histogram = Histogram('test_seconds', "Test", (1, 2))
+    histogram.observe(('a',), 5.0)
+    histogram.observe(('a',), 0.5)
+
+    lines = histogram.export(('endpoint',))
+    assert 'test_seconds_bucket{endpoint="a",le="1"} 1' in lines
+    assert 'test_seconds_bucket{endpoint="a",le="2"} 1' in lines
+    assert 'test_seconds_bucket{endpoint="a",le="+Inf"} 2' in lines
+    assert 'test_seconds_sum{endpoint="a"} 5.500000' in lines
+    assert 'test_seconds_count{endpoint="a"} 2' in lines
+
+def test_histogram_bucket_bounds_are_inclusive():
+    histogram = Histogram('test_bytes', "Test", (1, 2))
+    histogram.observe(('a',), 2)
+
+    lines = histogram.export(('endpoint',))
+    assert 'test_bytes_bucket{endpoint="a",le="1"} 0' in lines
+    assert 'test_bytes_bucket{endpoint="a",le="2"} 1' in lines
@@ -0,0 +1,60 @@
+import sqlite3
+from page_cache import MemoryBackend, SQLiteBackend
+
+def entry(*tags):
+    return (b'<html></html>', 'text/html', frozenset(tags))
+
+def test_sqlite_backend_evicts_the_oldest_pages(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'), max_entries = 3)
+    for n in range(5):
+        backend.set(f'page{n}', entry('recent'))
+
+    assert backend.get('page0') is None and backend.get('page1') is None
+    assert backend.get('page4') == entry('recent')
+    assert backend.file.connection().execute("SELECT COUNT(*) FROM page_tag").fetchone()[0] == 3
+
+def test_sqlite_backend_invalidates_for_every_process(tmp_path):
+    # Two backends on one file stand for two worker processes
+    path = str(tmp_path / 'cache.db')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.set('post', entry('post:1', 'recent'))
+    first.set('profile', entry('user:1'))
+
+    second.invalidate('recent')
+    assert first.get('post') is None
+    assert first.get('profile') == entry('user:1')
+
+    second.clear()
+    assert first.get('profile') is None
+
+def test_memory_backend_evicts_the_least_recently_used_page():
+    backend = MemoryBackend(max_entries = 2)
+    backend.set('a', entry('x'))
+    backend.set('b', entry('x'))
+    backend.get('a')
+    backend.set('c', entry('y'))
+
+    assert backend.get('b') is None
+    backend.invalidate('x')
+    assert backend.get('a') is None and backend.get('c') == entry('y')
+
+def test_sqlite_backend_keeps_invalidations_that_cant_get_the_lock(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    backend = SQLiteBackend(path)
+    backend.set('post', entry('post:1'))
+    backend.set('profile', entry('user:1'))
+
+    # Another worker holds the write lock past the timeout
+    other = sqlite3.connect(path, isolation_level = None)
+    other.execute("BEGIN IMMEDIATE")
+    backend.file.connection().execute("PRAGMA busy_timeout = 0")
+    assert backend.invalidate('post:1') is False
+    assert backend.get('post') is None
+    assert backend.get('profile') == entry('user:1')
+
+    # Still in the file for other workers until the next write here gets the lock
+    other.execute("COMMIT")
+    assert SQLiteBackend(path).get('post') is not None
+    backend.set('about', entry('user:2'))
+    assert SQLiteBackend(path).get('post') is None
+    assert not backend.stale
@@ -0,0 +1,51 @@
+import os
+import sys
+import pytest
+from extensions import db
+from query_guard import assert_max_queries
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from seed import seed
+
+# Statements each page may issue however many posts it lists, an N+1 pattern issues one more per post
+# Each page is checked for a marker of the rows it lists, so an empty page can't pass
+LIMITS = [
+    ('GET', '/recent', None, 2, b'class="post"'),
+    ('GET', '/recent?before=150', None, 2, b'class="post"'),
+    ('GET', '/feed?before=150', None, 2, b'class=\\"post\\"'),
+    ('GET', '/trending', None, 3, b'Trending'),
+    ('GET', '/authors', None, 2, b'/profile/user'),
+    ('GET', '/profile/user3', None, 3, b'class="post"'),
+    ('GET', '/profile', None, 3, b'class="post"'),
+    ('POST', '/search', {'search': 'lorem ipsum', 'all': 'true'}, 5, b'class="post"'),
+    ('POST', '/search', {'search': 'user1', 'users': 'true'}, 5, b'/profile/user1')
+]
+
+# Seeding once for the whole module keeps it quick
+@pytest.fixture(scope = 'module')
+def app(make_app, tmp_path_factory):
+    app = make_app(tmp_path_factory.mktemp('blog'), {
+        'PAGE_CACHE_BACKEND': None, # Every request runs its queries
+        'ADMISSION_LIMITS': {},
+        'MAX_QUERIES_PER_REQUEST': 10 # The guard fails any request over it in testing
+    })
+    seed(app, users = 5, posts = 300, log = lambda message: None)
+    return app
+
+@pytest.mark.parametrize('method, path, data, limit, marker', LIMITS)
+def test_listing_pages_issue_a_fixed_number_of_queries(app, method, path, data, limit, marker):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 2
+
+    with app.app_context():
+        engine = db.engine
+    with assert_max_queries(engine, limit):
+        response = client.open(path, method = method, data = data)
+
+        # Streamed pages run their queries as they are read
+        body = response.get_data()
+        response.close()
+
+    assert response.status_code == 200
+    assert marker in body
@@ -0,0 +1,65 @@
+import pytest
+from extensions import db, database
+from models import Post
+from search import MemorySearchIndex
+from sqlalchemy.sql import text
+
+@pytest.fixture
+def config():
+    return {'SEARCH_BACKEND': 'memory'}
+
+def write_post(title):
+    post = Post(1, title, 'Some content')
+    db.session.add(post)
+    db.session.flush()
+    return post.id
+
+def test_memory_index_applies_writes_once_they_commit(app):
+    from views.common import Get_Search_Index
+
+    with app.test_request_context():
+        index = Get_Search_Index()
+        with database.connection() as con:
+            post_id = write_post('Rolled back')
+            index.index_post(con, post_id)
+            assert index.search_posts(con, 'rolled', 10) == ([], 0)
+            db.session.rollback()
+        with database.connection() as con:
+            assert index.search_posts(con, 'rolled', 10) == ([], 0)
+
+            post_id = write_post('Committed')
+            index.index_post(con, post_id)
+            db.session.commit()
+        with database.connection() as con:
+            assert index.search_posts(con, 'committed', 10) == ([post_id], 1)
+
+def test_memory_index_refreshes_from_other_workers_writes(app):
+    # This index stands for another worker, which never sees the writes happen
+    index = MemorySearchIndex(refresh_interval = 0)
+    with app.app_context():
+        with db.engine.connect() as con:
+            index.setup(con)
+
+        post_id = write_post('Elsewhere')
+        db.session.commit()
+        with db.engine.connect() as con:
+            assert index.search_posts(con, 'elsewhere', 10) == ([post_id], 1)
+
+            con.execute(text("DELETE FROM post WHERE (id = :id)"), id = post_id)
+            assert index.search_posts(con, 'elsewhere', 10) == ([], 0)
+
+def test_upgrading_an_existing_database_builds_the_search_index(make_app, tmp_path):
+    from search import FTS5SearchIndex
+
+    app = make_app(tmp_path, users = [('author', 'author@example.com', 'password')])
+    runner = app.test_cli_runner()
+    with app.app_context():
+        post_id = write_post('Before search')
+        db.session.commit()
+
+    # A database from before search has no index tables
+    result = runner.invoke(args = ['upgrade-db'])
+    assert "Built the search index" in result.output
+
+    with app.app_context(), db.engine.connect() as con:
+        assert FTS5SearchIndex().search_posts(con, 'before', 10) == ([post_id], 1)
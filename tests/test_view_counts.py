@@ -0,0 +1,35 @@
+import pytest
+from extensions import db
+from sqlalchemy.sql import text
+from view_counts import ViewBuffer
+
+@pytest.fixture
+def config():
+    return {'VIEW_FLUSH_INTERVAL': 3600.0}
+
+def test_reading_the_ranking_starts_the_flusher(app):
+    buffer = app.extensions['view_counter']
+    assert buffer.thread is None
+
+    assert buffer.top() == ()
+    assert buffer.thread is not None and buffer.thread.is_alive()
+
+class StaleRead:
+    """A connection whose read of trending_state ran before another worker's insert committed"""
+
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, statement, **params):
+        if str(statement).startswith("SELECT decayed_at"):
+            statement = text("SELECT NULL")
+        return self.con.execute(statement, **params)
+
+def test_workers_starting_together_keep_one_trending_state_row(app):
+    # Two buffers on one database stand for two worker processes that both found the table empty
+    first, second = ViewBuffer(app), ViewBuffer(app)
+    with app.app_context(), db.engine.connect() as con:
+        first._decay(con)
+        second._decay(StaleRead(con))
+
+        assert con.execute(text("SELECT id FROM trending_state")).fetchall() == [(1,)]
@@ -0,0 +1,70 @@
+from sqlalchemy.sql import text
+
+# Every author's posts aggregated in one pass, the source of truth the stats are checked and rebuilt against
+AGGREGATE = 'SELECT author_id, COUNT(*) AS post_count, SUM(word_count) AS word_count, MAX(date_created) AS latest_post_at FROM post GROUP BY author_id'
+
+# Leaderboard orders, each served by an index on user_stats
+ORDERS = {'posts': 'post_count', 'words': 'word_count'}
+
+def recompute(con, author_id):
+    """Rewrites an author's stats from their posts, for authors who have no stats row yet"""
+
+    con.execute(text("DELETE FROM user_stats WHERE (user_id = :id)"), id = author_id)
+    con.execute(text(
+        "INSERT INTO user_stats (user_id, post_count, word_count, latest_post_at) "
+        "SELECT :id, COUNT(*), COALESCE(SUM(word_count), 0), MAX(date_created) FROM post WHERE (author_id = :id)"), id = author_id)
+
+def post_written(con, author_id, post_id, posts, words):
+    """Adds a new (posts = 1) or edited (posts = 0) post to its author's stats, words being the change in word count"""
+
+    # The post's date is read back from its row, so it is stored exactly as the post table has it
+    result = con.execute(text(
+        "UPDATE user_stats SET post_count = post_count + :posts, word_count = word_count + :words, "
+        "latest_post_at = (SELECT CASE WHEN (latest_post_at IS NULL OR latest_post_at < date_created) THEN date_created ELSE latest_post_at END FROM post WHERE (id = :post_id)) "
+        "WHERE (user_id = :id)"), posts = posts, words = words, post_id = post_id, id = author_id)
+
+    if result.rowcount == 0:
+        recompute(con, author_id)
+
+def post_deleted(con, author_id, words, date_created):
+    """Removes a deleted post from its author's stats, date_created being the value read from its row"""
+
+    # Only deleting the latest post means looking through the author's other posts
+    result = con.execute(text(
+        "UPDATE user_stats SET post_count = post_count - 1, word_count = word_count - :words, "
+        "latest_post_at = CASE WHEN (latest_post_at = :date) THEN (SELECT MAX(date_created) FROM post WHERE (author_id = :id)) ELSE latest_post_at END "
+        "WHERE (user_id = :id)"), words = words, date = date_created, id = author_id)
+
+    if result.rowcount == 0:
+        recompute(con, author_id)
+
+def drifted(con):
+    """Returns the users whose stats don't match their posts, with both, in one pass over the post table"""
+
+    # Users get a stats row with their first post, so only those with posts need one
+    statement = text(
+        'SELECT "user".id, "user".username, s.post_count, s.word_count, s.latest_post_at, '
+        'COALESCE(a.post_count, 0) AS actual_post_count, COALESCE(a.word_count, 0) AS actual_word_count, a.latest_post_at AS actual_latest_post_at '
+        f'FROM "user" LEFT JOIN user_stats AS s ON (s.user_id = "user".id) LEFT JOIN ({AGGREGATE}) AS a ON (a.author_id = "user".id) '
+        'WHERE ((s.user_id IS NULL AND a.author_id IS NOT NULL) OR s.post_count != COALESCE(a.post_count, 0) OR s.word_count != COALESCE(a.word_count, 0) '
+        'OR s.latest_post_at != a.latest_post_at OR (s.latest_post_at IS NULL) != (a.latest_post_at IS NULL)) '
+        'ORDER BY "user".id')
+    return con.execute(statement).fetchall()
+
+def rebuild(con):
+    """Recomputes every author's stats from the post table in one transaction"""
+
+    with con.begin():
+        con.execute(text("DELETE FROM user_stats"))
+        con.execute(text(
+            "INSERT INTO user_stats (user_id, post_count, word_count, latest_post_at) "
+            f'SELECT a.author_id, a.post_count, a.word_count, a.latest_post_at FROM ({AGGREGATE}) AS a INNER JOIN "user" ON (a.author_id = "user".id)'))
+
+def leaderboard(con, order, limit):
+    """Returns the authors with the most posts or words, read off the user_stats index rather than the posts"""
+
+    column = ORDERS[order]
+    statement = text(
+        f'SELECT "user".username, s.post_count, s.word_count, s.latest_post_at FROM user_stats AS s INNER JOIN "user" ON (s.user_id = "user".id) '
+        f'WHERE (s.post_count > 0) ORDER BY s.{column} DESC LIMIT :limit')
+    return con.execute(statement, limit = limit).fetchall()
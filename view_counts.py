@@ -0,0 +1,202 @@
+from flask import current_app, request, make_response
+from sqlalchemy.sql import text
+from sqlalchemy.exc import SQLAlchemyError
+from collections import Counter
+from functools import wraps
+from itertools import count
+from threading import Event, Lock, Thread, local
+import atexit
+import os
+import time
+
+class Shard:
+    """Hits counted by the threads assigned to it, swapped out whole by each flush"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = {} # post id -> hits since the last flush
+
+class ViewBuffer:
+    """The pending hits, flusher thread and trending ranking of one app in one process"""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['VIEW_FLUSH_INTERVAL']
+        self.max_pending = app.config['VIEW_MAX_PENDING']
+        self.half_life = app.config['TRENDING_HALF_LIFE']
+        self.decay_interval = app.config['TRENDING_DECAY_INTERVAL']
+        self.size = app.config['TRENDING_SIZE']
+
+        # Each thread keeps to one shard, so readers of the same hot post don't queue on one lock
+        self.shards = [Shard() for _ in range(app.config['VIEW_COUNTER_SHARDS'])]
+        self.next_shard = count()
+        self.local = local()
+
+        self.flush_lock = Lock()
+        self.wake = Event()
+        self.thread = None
+        self.ranking = None # Post ids, most trending first, None until first read
+        self.pid = os.getpid()
+
+    def _shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = self.shards[next(self.next_shard) % len(self.shards)]
+        return shard
+
+    def _check_fork(self):
+        # Threads and locks don't survive a fork, a forked worker starts with its own empty buffer
+        if self.pid != os.getpid():
+            self.__init__(self.app)
+
+    def record(self, post_id):
+        self._check_fork()
+
+        shard = self._shard()
+        with shard.lock:
+            shard.counts[post_id] = shard.counts.get(post_id, 0) + 1
+            pending = len(shard.counts)
+
+        # The flusher starts on the first hit, so workers forked from a preloaded app each start their own
+        if self.thread is None:
+            self._start()
+        if pending * len(self.shards) > self.max_pending:
+            self.wake.set()
+
+    def _start(self):
+        with self.flush_lock:
+            if self.thread is not None:
+                return
+            self.thread = Thread(target = self._run, name = 'view-counter', daemon = True)
+            self.thread.start()
+
+        # Hits still pending when the process exits are written then
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def _take(self):
+        hits = Counter()
+        for shard in self.shards:
+            with shard.lock:
+                counts, shard.counts = shard.counts, {}
+            hits.update(counts)
+        return hits
+
+    def flush(self):
+        """Writes the pending hits in one transaction, decays the trending scores if due and refreshes the ranking"""
+
+        # Imported here since extensions.py creates the ViewCounter
+        from extensions import db, page_cache
+
+        with self.flush_lock, self.app.app_context():
+            hits = self._take()
+            try:
+                with db.engine.connect() as con:
+                    with con.begin():
+                        self._decay(con)
+                        if hits:
+                            params = [{'id': post_id, 'hits': n} for post_id, n in hits.items()]
+                            con.execute(text("UPDATE post SET views = views + :hits, trending_score = trending_score + :hits WHERE (id = :id)"), params)
+
+                    ranking = self._rank(con)
+            except SQLAlchemyError as e:
+                # Keep the hits for the next flush rather than lose them
+                shard = self._shard()
+                with shard.lock:
+                    for post_id, n in hits.items():
+                        shard.counts[post_id] = shard.counts.get(post_id, 0) + n
+                self.app.logger.warning(f"Flushing {sum(hits.values())} post views failed, retrying in {self.interval}s: {e}")
+                return
+
+            # View counts alone don't change the cached page, only a new order does
+            if ranking != self.ranking:
+                self.ranking = ranking
+                page_cache.invalidate('trending')
+
+    def _decay(self, con):
+        # Scores halve every TRENDING_HALF_LIFE seconds, applied in steps of TRENDING_DECAY_INTERVAL
+        # The timestamp is only moved by the process whose update matches it, so every step is applied once
+        now = time.time()
+        decayed_at = con.execute(text("SELECT decayed_at FROM trending_state WHERE (id = 1)")).scalar()
+        if decayed_at is None:
+            # Workers starting together may all find no row, the fixed id lets only the first one in
+            con.execute(text("INSERT INTO trending_state (id, decayed_at) VALUES (1, :now) ON CONFLICT (id) DO NOTHING"), now = now)
+            return
+        if now - decayed_at < self.decay_interval:
+            return
+
+        if con.execute(text("UPDATE trending_state SET decayed_at = :now WHERE (id = 1) AND (decayed_at = :decayed_at)"), now = now, decayed_at = decayed_at).rowcount:
+            factor = 0.5 ** ((now - decayed_at) / self.half_life)
+
+            # Scores that have decayed below a hundredth of a view leave the index's non-zero range
+            con.execute(text("UPDATE post SET trending_score = CASE WHEN trending_score * :factor < 0.01 THEN 0 ELSE trending_score * :factor END WHERE (trending_score > 0)"), factor = factor)
+
+    def _rank(self, con):
+        # Read off the trending_score index, never a sort of the whole table
+        statement = text("SELECT id FROM post WHERE (trending_score > 0) ORDER BY trending_score DESC LIMIT :limit")
+        return tuple(row.id for row in con.execute(statement, limit = self.size))
+
+    def top(self):
+        self._check_fork()
+
+        # A worker that only serves /trending still needs the flusher to keep its ranking fresh
+        if self.thread is None:
+            self._start()
+        if self.ranking is None:
+            self.flush()
+        return self.ranking or ()
+
+class ViewCounter:
+    """Counts post views in memory and writes them behind the requests, keeping a time-decayed trending ranking"""
+
+    # Counting in the view would take SQLite's write lock on every read of a post
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the flush and trending settings from the config"""
+
+        app.config.setdefault('VIEW_FLUSH_INTERVAL', 10.0) # Seconds between writes of the pending hits
+        app.config.setdefault('VIEW_MAX_PENDING', 10000) # Posts with pending hits that trigger an early flush
+        app.config.setdefault('VIEW_COUNTER_SHARDS', 16)
+        app.config.setdefault('TRENDING_HALF_LIFE', 6 * 3600.0) # Seconds for a view's weight in the trending score to halve
+        app.config.setdefault('TRENDING_DECAY_INTERVAL', 300.0)
+        app.config.setdefault('TRENDING_SIZE', 25)
+
+        app.extensions['view_counter'] = ViewBuffer(app)
+
+    @property
+    def buffer(self):
+        return current_app.extensions['view_counter']
+
+    def counted(self, argument):
+        """Decorates a view to count its successful GETs as views of the post named by the argument"""
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                response = make_response(view(**kwargs))
+
+                # Revalidated and cached pages are views too
+                if request.method == 'GET' and response.status_code in (200, 304):
+                    self.buffer.record(kwargs[argument])
+                return response
+            return wrapper
+        return decorator
+
+    def flush(self):
+        """Writes the pending hits now instead of waiting for the flusher"""
+
+        self.buffer.flush()
+
+    def trending(self):
+        """Returns the ids of the trending posts, most trending first, as of the last flush"""
+
+        return self.buffer.top()
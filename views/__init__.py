@@ -0,0 +1 @@
+"""Blueprints for the blog's routes"""
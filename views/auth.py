@@ -0,0 +1,198 @@
+from flask import Blueprint, current_app, render_template, redirect, url_for, request, session
+from sqlalchemy.sql import text
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from credentials import CredentialsBusyError
+from errors import reporting, render_error, BlogError
+from extensions import db, database, passwords, feeds
+from models import User
+from views.common import Get_Search_Index, Render_Form
+import re
+
+bp = Blueprint('auth', __name__)
+
+# Compiled at import so preloaded workers share them
+USERNAME_PATTERN = re.compile(r'^[\w_ ]+$')
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9]+[\._]?[a-zA-Z0-9]+[@]\w+[.]\w+$')
+
+# Handle password hashing overload
+@bp.app_errorhandler(CredentialsBusyError)
+def Credentials_Busy(e):
+    """Renders the error template with a 503 so clients back off instead of retrying at once"""
+
+    return render_error("Error: 503", "The server is busy, please try again in a moment", status = 503, headers = {'Retry-After': str(e.retry_after)})
+
+@bp.route('/login')
+def Login():
+    """Renders the login form"""
+
+    # Log current user out (if any)
+    if 'user_id' in session:
+        session.pop('user_id')
+
+    message = request.args.get('message')
+    return render_template("login.html", message = message)
+
+@bp.route('/register')
+def Register():
+    """Renders the register form"""
+
+    # Log current user out (if any)
+    if 'user_id' in session:
+        session.pop('user_id')
+
+    message = request.args.get('message')
+    return render_template("register.html", message = message)
+
+@bp.route('/logout')
+def Logout():
+    """Log the current user out"""
+
+    # Delete the user's session
+    session.pop('user_id', None)
+
+    return redirect(url_for('auth.Login'))
+
+@bp.route('/login', methods = ['POST'])
+def Login_User():
+    """Checks credentials and logs user in"""
+
+    # Check if both fields are filled out
+    if not (request.form['email'] and request.form['password']):
+        return Render_Form("login.html", "Invalid email or password")
+
+    # Connect to DB
+    with database.connection() as con:
+        # Find the user by email, the password is checked against its hash outside the database
+        with reporting("Error: Validating user", back = "auth.Login"):
+            statement = text('SELECT "user".id, password FROM "user" WHERE email = :email')
+            user = con.execute(statement, email = request.form['email']).first()
+
+    # Hashing can wait on a worker, the connection goes back to the pool meanwhile
+    database.release()
+
+    # Unknown emails are verified against a dummy hash so they take as long as wrong passwords
+    matches, needs_rehash = passwords.verify(user.password if user else None, request.form['password'])
+
+    # If the credentials don't match, alert them to the wrong credentials
+    if not matches:
+        return Render_Form("login.html", "Invalid email or password", status = 401)
+
+    # Legacy plaintext and outdated hashes are replaced now that we know the password
+    if needs_rehash:
+        password = passwords.hash(request.form['password'])
+        try:
+            with database.transaction() as con:
+                statement = text('UPDATE "user" SET password = :password WHERE id = :id')
+                con.execute(statement, password = password, id = user.id)
+        except SQLAlchemyError:
+            # The login is still valid, the upgrade is retried next time
+            current_app.logger.exception("Upgrading the password hash of user %s failed", user.id)
+
+    session['user_id'] = user.id # Create a user_id session to store login
+    return redirect(url_for('profiles.Own_Profile')) # Redirect to user's profile
+
+@bp.route('/register', methods = ['POST'])
+def Register_User():
+    """Validates register form data and saves it to the database"""
+
+    # Check if the fields are filled out
+    if not (request.form['username'] and request.form['email'] and request.form['password'] and request.form['passwordConf']):
+        return Render_Form("register.html", "Please fill out all the fields")
+
+    # Ensure passwords match
+    if request.form['password'] != request.form['passwordConf']:
+        return Render_Form("register.html", "Passwords do not match")
+
+    # Ensure name is only _, a-z, A-Z, 0-9, and space
+    if not USERNAME_PATTERN.search(request.form['username']):
+        return Render_Form("register.html", "Username can only contain _, a-z, A-Z, 0-9 and spaces.")
+
+    # Ensure a valid email
+    if not EMAIL_PATTERN.search(request.form['email']):
+        return Render_Form("register.html", "Invalid email")
+
+    # Hash the password before taking a database connection
+    password = passwords.hash(request.form['password'])
+
+    # Connect to DB
+    with database.connection() as con:
+        # Create new user in a single transaction
+        # The unique constraints on username and email reject taken ones, and the insert returns the new id
+        with reporting("Error: Creating user", back = "auth.Register"):
+            try:
+                new_user = User(request.form['username'], request.form['email'], password)
+                db.session.add(new_user)
+                db.session.flush()
+                user_id = new_user.id
+
+                # Add the new user to the search index and save everything
+                Get_Search_Index().index_user(con, user_id)
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                taken = "Email" if 'email' in str(e.orig) else "Username"
+                return Render_Form("register.html", f"{taken} is already taken", status = 409)
+
+    # List the new profile in the sitemap
+    feeds.user_changed(user_id)
+
+    # Log the new user in with a session
+    session['user_id'] = user_id
+
+    # Redirect to the new user's profile
+    return redirect(url_for('profiles.Own_Profile'))
+
+@bp.route('/password')
+def Change_Password_Form():
+    """Renders the change password form for the current user"""
+
+    # Send the user to login if they aren't logged in
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to change your password"))
+
+    message = request.args.get('message')
+
+    return render_template("changePwd.html", message = message)
+
+@bp.route('/password', methods = ['POST'])
+def Change_Password():
+    """Changes the current user's password"""
+
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to change your password"))
+
+    # Verify the fields have content
+    if not (request.form['passwordOld'] and request.form['passwordNew'] and request.form['passwordConf']):
+        return Render_Form("changePwd.html", "All the fields must be filled in")
+
+    # Ensure passwords match
+    if request.form['passwordNew'] != request.form['passwordConf']:
+        return Render_Form("changePwd.html", "Passwords do not match")
+
+    # Connect to DB
+    with database.connection() as con:
+        # Check if password matches passwordOld
+        with reporting("Error: Changing password", back = "auth.Change_Password_Form"):
+            statement = text('SELECT password FROM "user" WHERE id = :id')
+            passwordOld = con.execute(statement, id = session['user_id']).scalar()
+
+    # Hashing can wait on a worker, the connection goes back to the pool meanwhile
+    database.release()
+    if not passwords.verify(passwordOld, request.form['passwordOld'])[0]:
+        return Render_Form("changePwd.html", "Incorrect old password")
+    password = passwords.hash(request.form['passwordNew'])
+
+    with database.connection() as con:
+        # Change password
+        with reporting("Error: Changing password", back = "auth.Change_Password_Form"):
+            statement = text('UPDATE "user" SET password = :password WHERE id = :id')
+            result = con.execute(statement, password = password, id = session['user_id']).rowcount
+
+        # If update was successful, return to profile
+        # Else throw error
+        if result != 1:
+            raise BlogError("Error: Changing password", "<class 'blog.UnhandledError'>", back = "auth.Change_Password_Form")
+
+        db.session.commit()
+
+    return redirect(url_for('profiles.Own_Profile'))
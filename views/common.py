@@ -0,0 +1,144 @@
+from flask import current_app, render_template, request, stream_with_context, Response
+from sqlalchemy.sql import text
+from search import create_search_index
+from errors import NotFoundError, reporting
+from extensions import db, database
+from models import POST_SUMMARY
+
+# Configure search
+def Get_Search_Index():
+    """Returns the app's search index, creating it on first use"""
+
+    index = current_app.extensions.get('search_index')
+
+    # Set up on a connection of its own so the virtual tables are committed straight away
+    if index is None:
+        with db.engine.connect() as con:
+            index = create_search_index(con, current_app.config['SEARCH_BACKEND'], database.after_commit, current_app.config['SEARCH_REFRESH_INTERVAL'])
+            index.setup(con)
+        current_app.extensions['search_index'] = index
+
+    return index
+
+def Setup_Search():
+    """Sets the search index up before any request opens a transaction that would block it"""
+
+    Get_Search_Index()
+
+# Configure feed pagination
+def Posts_Query(before = None, author_id = None, username = None):
+    """Builds the statement selecting posts newest first below the before cursor, and its parameters bar the limit"""
+
+    conditions = []
+    params = {}
+
+    if before is not None:
+        conditions.append("p.id < :before")
+        params['before'] = before
+    if author_id is not None:
+        conditions.append("p.author_id = :author_id")
+        params['author_id'] = author_id
+    if username is not None:
+        conditions.append('"user".username = :username')
+        params['username'] = username
+
+    where = f"WHERE ({' AND '.join(conditions)}) " if conditions else ""
+    return text(f'SELECT {POST_SUMMARY} FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) {where}ORDER BY p.id DESC LIMIT :limit'), params
+
+def Fetch_Posts(con, before = None, author_id = None, username = None):
+    """Fetches one page of posts newest first, below the before cursor, and the cursor of the next page"""
+
+    # Keyset pagination on post.id keeps every page O(page size) however deep the reader is
+    page_size = current_app.config['FEED_PAGE_SIZE']
+    statement, params = Posts_Query(before, author_id, username)
+    posts = con.execute(statement, limit = page_size + 1, **params).fetchall()
+
+    # The extra row only tells us whether there is another page
+    if len(posts) > page_size:
+        return posts[:page_size], posts[page_size - 1].id
+    return posts, None
+
+class PostStream:
+    """A page of posts read from a server side cursor a chunk at a time as the template iterates over it"""
+
+    def __init__(self, con, before = None, author_id = None, username = None):
+        self.con = con
+        self.filters = {'before': before, 'author_id': author_id, 'username': username}
+        self.page_size = current_app.config['STREAM_PAGE_SIZE']
+        self.next_cursor = None # Only known once the page has been read
+
+    def __iter__(self):
+        statement, params = Posts_Query(**self.filters)
+        chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+
+        # stream_results asks the driver not to buffer the whole result, SQLite's cursor reads lazily already
+        result = self.con.execution_options(stream_results = True).execute(statement, limit = self.page_size + 1, **params)
+        try:
+            sent, last = 0, None
+            for rows in iter(lambda: result.fetchmany(chunk_size), []):
+                for row in rows:
+                    # The extra row only tells us whether there is another page
+                    if sent == self.page_size:
+                        self.next_cursor = last.id
+                        return
+                    sent += 1
+                    last = row
+                    yield row
+        finally:
+            result.close()
+
+def Fetch_Post(con, post_id):
+    """Fetches a post with its author's name, raising NotFoundError if it doesn't exist"""
+
+    with reporting("Error: Fetching post", back = "posts.Recent"):
+        statement = text('SELECT p.id AS post_id, p.title, p.content, p.word_count, p.content_html, p.renderer_version, p.author_id, p.date_created AS date, "user".username AS author FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) WHERE (p.id = :id)')
+        post = con.execute(statement, id = post_id).first()
+
+    if post is None:
+        raise NotFoundError("Error: 404", f"There is no post {post_id}", back = "posts.Recent")
+
+    return post
+
+# Render failed forms in place so fixing them doesn't cost a redirect
+def Render_Form(template, message, status = 400, **context):
+    """Re-renders a submitted form in place with the message shown inline and the fields kept"""
+
+    return render_template(template, message = message, form = request.form, **context), status
+
+# Stream long pages so the first bytes go out before their rows are read
+class Deferred:
+    """A value the template tests after the rows above it have been streamed, e.g. whether there is a next page"""
+
+    def __init__(self, compute):
+        self.compute = compute
+
+    def __bool__(self):
+        return bool(self.compute())
+
+def Buffer(chunks, size):
+    """Joins the template's many small pieces into chunks of about size characters"""
+
+    pending, length, flushed = [], 0, False
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+
+        # The head and navbar go out on their own, before the page's first query runs
+        if length >= size or (not flushed and '</nav>' in chunk):
+            yield ''.join(pending)
+            pending, length, flushed = [], 0, True
+
+    if pending:
+        yield ''.join(pending)
+
+def Render_Page(template, stream, **context):
+    """Renders a page whole, or streams it as it renders if stream is set"""
+
+    if not stream:
+        return render_template(template, **context)
+
+    # Errors past the first chunk can't change the status any more, the server logs them and cuts the response short
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    chunks = app.jinja_env.get_template(template).generate(context)
+    return Response(stream_with_context(Buffer(chunks, app.config['STREAM_BUFFER_SIZE'])), mimetype = 'text/html')
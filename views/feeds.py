@@ -0,0 +1,56 @@
+from flask import Blueprint
+from errors import NotFoundError
+from extensions import feeds
+from feeds import author_file
+import re
+
+bp = Blueprint('feeds', __name__)
+
+ATOM = 'application/atom+xml'
+SITEMAP = 'application/xml'
+
+# Sitemap files are named by what they list, anything else isn't one
+SITEMAP_PATTERN = re.compile(r'^(?:(posts|users)-(\d{1,9})|pages)\.xml$')
+
+@bp.route('/atom.xml')
+def Site_Feed():
+    """Serves the Atom feed of the latest posts"""
+
+    # There is none when SITE_URL isn't set
+    response = feeds.send('atom.xml', ATOM, 'site')
+    if response is None:
+        raise NotFoundError("Error: 404", "There is no feed", back = "Main")
+    return response
+
+@bp.route('/profile/<username>/atom.xml')
+def Author_Feed(username):
+    """Serves the Atom feed of a user's latest posts"""
+
+    response = feeds.send(author_file(username), ATOM, 'author', username)
+    if response is None:
+        raise NotFoundError("Error: 404", f"There is no user called {username}", back = "search.Search_Form")
+    return response
+
+@bp.route('/sitemap.xml')
+def Sitemap():
+    """Serves the sitemap index listing the sitemaps of the pages, posts and profiles"""
+
+    response = feeds.send('sitemap.xml', SITEMAP, 'index')
+    if response is None:
+        raise NotFoundError("Error: 404", "There is no sitemap", back = "Main")
+    return response
+
+@bp.route('/sitemaps/<name>')
+def Sitemap_File(name):
+    """Serves one of the sitemaps listed in the index"""
+
+    # Chunks past the last post or user aren't written either
+    match = SITEMAP_PATTERN.match(name)
+    if match is not None:
+        kind, chunk = match.groups()
+        key = (kind, int(chunk)) if kind else ('index',) # The index writes the pages sitemap
+        response = feeds.send(f'sitemaps/{name}', SITEMAP, *key)
+        if response is not None:
+            return response
+
+    raise NotFoundError("Error: 404", f"There is no sitemap {name}", back = "Main")
@@ -0,0 +1,249 @@
+from flask import Blueprint, current_app, render_template, redirect, url_for, request, session, jsonify
+from sqlalchemy.sql import text, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+from errors import reporting, BlogError, NotFoundError, ForbiddenError
+from extensions import db, database, page_cache, view_counter, feeds
+from http_cache import conditional
+from models import User, Post, POST_SUMMARY
+from rendering import render_markdown, RENDERER_VERSION
+from views.common import Get_Search_Index, Fetch_Posts, Fetch_Post, Render_Form
+import user_stats
+
+bp = Blueprint('posts', __name__)
+
+# Configure HTTP cache validators
+def Post_Version(post_id):
+    """Returns the version and modification time of a post"""
+
+    with database.connection() as con:
+        statement = text("SELECT updated_at FROM post WHERE (id = :id)").columns(updated_at = db.DateTime)
+        updated_at = con.execute(statement, id = post_id).scalar()
+
+    return (updated_at, updated_at) if updated_at else None
+
+def Recent_Version():
+    """Returns the version and modification time of a page of the recent feed"""
+
+    # Only the ids and timestamps of the page's posts are read, never their content
+    before = request.args.get('before', type = int)
+    where = "WHERE (id < :before) " if before is not None else ""
+    statement = text(f"SELECT id, updated_at FROM post {where}ORDER BY id DESC LIMIT :limit").columns(updated_at = db.DateTime)
+
+    with database.connection() as con:
+        rows = con.execute(statement, before = before, limit = current_app.config['FEED_PAGE_SIZE'] + 1).fetchall()
+
+    return tuple(rows), max((row.updated_at for row in rows), default = None)
+
+@bp.route('/post/new')
+def New_Post():
+    """Renders the new post form"""
+
+    message = request.args.get('message')
+
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to make a post"))
+
+    return render_template("new.html", message = message)
+
+@bp.route('/post/new', methods = ['POST'])
+def Post_New_Post():
+    """Posts new posts"""
+
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to make a post"))
+
+    # Check if the fields are filled out
+    if not (request.form['title'] and request.form['content']):
+        return Render_Form("new.html", "Please fill out all the fields")
+
+    # Limit length including whitespace
+    # Inputs in new.html restrict too, this is verification
+    if len(str(request.form['title'])) > 100:
+        return Render_Form("new.html", "Title can only be 100 characters long")
+    if len(str(request.form['content'])) - str(request.form['content']).count("\n") > 5000:
+        return Render_Form("new.html", "Content can only be 5000 characters long")
+
+    # Connect to DB
+    with database.connection() as con:
+        # Create post in a single transaction, its id comes back from the insert itself
+        with reporting("Error: Creating post", back = "posts.New_Post"):
+            post = Post(session['user_id'], request.form['title'], request.form['content'])
+            db.session.add(post)
+            User.query.filter_by(id = session['user_id']).update({'updated_at': post.updated_at}) # The author's profile lists the post
+            db.session.flush()
+            post_id = post.id
+            user_stats.post_written(con, session['user_id'], post_id, 1, post.word_count)
+
+            # Add the post to the search index and save everything
+            Get_Search_Index().index_post(con, post_id)
+            db.session.commit()
+
+        # Drop the cached pages listing the author's posts
+        page_cache.invalidate('recent', 'authors', f"user:{session['user_id']}")
+        feeds.post_changed(post_id, session['user_id'])
+
+    # Redirect to the new post
+    return redirect(url_for('posts.View_Post', post_id = post_id))
+
+@bp.route('/post/<int:post_id>')
+@view_counter.counted('post_id')
+@conditional(Post_Version)
+@page_cache.cached('post:{post_id}')
+def View_Post(post_id):
+    """Renders the post by id to the view form"""
+
+    # Connect to DB
+    with database.connection() as con:
+        # Select the post data
+        post = Fetch_Post(con, post_id)
+
+        if session.get('user_id') == post.author_id:
+            edit = request.args.get('edit')
+        else:
+            edit = 'false'
+
+    # Posts are rendered when they are written, only ones rendered by an older renderer are rendered here
+    html = post.content_html if post.renderer_version == RENDERER_VERSION else render_markdown(post.content)
+
+    return render_template('post.html', post = post, html = html, edit = edit)
+
+@bp.route('/post/<int:post_id>', methods = ['POST'])
+def Edit_Post(post_id):
+    """Updates a post by id in the DB"""
+
+    # Connect to DB
+    with database.connection() as con:
+        # Select the post and verify that the editor is the author
+        post = Fetch_Post(con, post_id)
+        if session.get('user_id') != post.author_id:
+            raise ForbiddenError("Error: Can't edit other's posts", "<class 'blog.PostSecurityError'>", back = "posts.Recent")
+
+        # Verify that the fields have content
+        if not (request.form['title'] and request.form['content']):
+            return Render_Form("post.html", "Please fill out all the fields", post = post, edit = 'true')
+
+        # Limit length including whitespace
+        # Inputs in post.html restrict too, this is verification
+        if len(str(request.form['title'])) > 100:
+            return Render_Form("post.html", "Title can only be 100 characters long", post = post, edit = 'true')
+        if len(str(request.form['content'])) - str(request.form['content']).count("\n") > 5000:
+            return Render_Form("post.html", "Content can only be 5000 characters long", post = post, edit = 'true')
+
+        # Update the post
+        with reporting("Error: Updating post", back = "posts.Recent"):
+            excerpt, word_count = Post.Summarize(request.form['content'])
+            html = render_markdown(request.form['content'])
+            now = datetime.utcnow()
+            statement = text("UPDATE post SET title = :title, content = :content, excerpt = :excerpt, word_count = :word_count, content_html = :html, renderer_version = :version, date_created = :date, updated_at = :now WHERE id = :id")
+            result = con.execute(statement, title = request.form['title'], content = request.form['content'], excerpt = excerpt, word_count = word_count, html = html, version = RENDERER_VERSION, date = now, now = now, id = post_id).rowcount
+            con.execute(text('UPDATE "user" SET updated_at = :now WHERE id = :id'), now = now, id = post.author_id) # The author's profile lists the post
+            user_stats.post_written(con, post.author_id, post_id, 0, word_count - post.word_count)
+
+        # If there was an error updating, show that
+        if result < 1:
+            raise BlogError("Error: Updating post", "<class 'blog.UnhandledError'>", back = "posts.Recent")
+
+        # Reindex the updated post and save everything
+        with reporting("Error: Updating search index", back = "posts.Recent"):
+            Get_Search_Index().index_post(con, post_id)
+            db.session.commit()
+
+        # Drop the cached pages showing the post
+        page_cache.invalidate(f'post:{post_id}', 'recent', 'trending', 'authors', f'user:{post.author_id}')
+        feeds.post_changed(post_id, post.author_id)
+
+    return redirect(url_for("posts.View_Post", post_id = post_id))
+
+@bp.route('/post/<int:post_id>/del')
+def Delete_Post_Form(post_id):
+    """Renders the delete post form for a post by id"""
+
+    return render_template("delete.html")
+
+@bp.route('/post/<int:post_id>/del', methods = ['POST'])
+def Delete_Post(post_id):
+    """Deletes a post by id if user is the post's author"""
+
+    if str(request.form['confirm']).lower() != 'confirm':
+        return Render_Form("delete.html", "Type 'confirm' to delete the post")
+
+    # Connect to DB
+    with database.connection() as con:
+        with reporting("Error: Deleting post", back = "posts.Recent"):
+            statement = text("SELECT author_id, word_count, date_created from post WHERE (id = :id)")
+            post = con.execute(statement, id = post_id).first()
+            author_id = post.author_id if post else None
+
+        if author_id is None:
+            raise NotFoundError("Error: 404", f"There is no post {post_id}", back = "posts.Recent")
+        if session.get('user_id') != author_id:
+            raise ForbiddenError("Error: Can't delete others' posts", "You can't delete others' posts!!!", back = "posts.Recent")
+
+        # Delete post
+        with reporting("Error: Deleting post", back = "posts.Recent"):
+            statement = text("DELETE FROM post WHERE id = :id")
+            result = con.execute(statement, id = post_id).rowcount
+            con.execute(text('UPDATE "user" SET updated_at = :now WHERE id = :id'), now = datetime.utcnow(), id = author_id) # The author's profile lists the post
+            user_stats.post_deleted(con, author_id, post.word_count, post.date_created)
+
+            # Remove the post from the search index
+            Get_Search_Index().remove_post(con, post_id)
+
+        # If update was successful, return to profile
+        # Else throw error
+        if result != 1:
+            raise BlogError("Error: Deleting post", "<class 'blog.UnhandledError'>", back = "posts.Recent")
+
+        db.session.commit()
+        page_cache.invalidate(f'post:{post_id}', 'recent', 'trending', 'authors', f'user:{author_id}')
+        feeds.post_changed(post_id, author_id)
+
+    return redirect(url_for('profiles.Own_Profile'))
+
+@bp.route('/recent')
+@conditional(Recent_Version)
+@page_cache.cached('recent')
+def Recent():
+    """Renders a page of the most recent posts to the recent form"""
+
+    # Connect to DB
+    with database.connection() as con:
+        # Select the most recent posts below the cursor
+        with reporting("Error: Fetching recent posts", back = "posts.Recent"):
+            posts, next_cursor = Fetch_Posts(con, request.args.get('before', type = int))
+
+    return render_template('recent.html', posts = posts, next_cursor = next_cursor)
+
+@bp.route('/trending')
+@page_cache.cached('trending')
+def Trending():
+    """Renders the most viewed posts of late, ranked by the view counter"""
+
+    # The ranking is kept by the view counter's flushes, so the page only loads its posts
+    ranking = view_counter.trending()
+    posts = []
+    if ranking:
+        with database.connection() as con, reporting("Error: Fetching trending posts", back = "posts.Recent"):
+            statement = text(f'SELECT {POST_SUMMARY}, p.views FROM post AS p INNER JOIN "user" ON (p.author_id = "user".id) WHERE (p.id IN :ids)').bindparams(bindparam('ids', expanding = True))
+            found = {post.id: post for post in con.execute(statement, ids = list(ranking))}
+            posts = [found[post_id] for post_id in ranking if post_id in found]
+
+    return render_template('trending.html', posts = posts)
+
+@bp.route('/feed')
+def Feed():
+    """Returns the next page of the recent or a user's posts as a JSON HTML fragment"""
+
+    before = request.args.get('before', type = int)
+    author = request.args.get('author')
+
+    # Connect to DB
+    with database.connection() as con:
+        try:
+            posts, next_cursor = Fetch_Posts(con, before, username = author)
+        except SQLAlchemyError as e:
+            return jsonify(error = str(type(e))), 500
+
+    html = render_template('postList.html', posts = posts, show_author = author is None)
+    return jsonify(html = html, next = next_cursor)
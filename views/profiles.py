@@ -0,0 +1,146 @@
+from flask import Blueprint, current_app, render_template, redirect, url_for, request, session
+from sqlalchemy.sql import text
+from datetime import datetime
+from errors import reporting, BlogError, NotFoundError
+from extensions import db, database, page_cache, feeds
+from http_cache import conditional
+from views.common import Fetch_Posts, PostStream, Render_Page
+import user_stats
+
+bp = Blueprint('profiles', __name__)
+
+# The user with their stats, so the profile never aggregates their posts
+USER_PROFILE = '"user".*, s.post_count, s.word_count AS total_words, s.latest_post_at FROM "user" LEFT JOIN user_stats AS s ON (s.user_id = "user".id)'
+
+# Configure HTTP cache validators
+def Profile_Version(username):
+    """Returns the version and modification time of a user's profile page"""
+
+    with database.connection() as con:
+        statement = text('SELECT updated_at FROM "user" WHERE (username = :username)').columns(updated_at = db.DateTime)
+        updated_at = con.execute(statement, username = username).scalar()
+
+    return (updated_at, updated_at) if updated_at else None
+
+def Profile_Posts(con, author_id, stream):
+    """Returns a page of the author's posts and the next page's cursor, which a streamed page only knows once it is read"""
+
+    before = request.args.get('before', type = int)
+    if stream:
+        return PostStream(con, before, author_id = author_id), None
+    return Fetch_Posts(con, before, author_id = author_id)
+
+def Render_Own_Profile(message = None, status = 200):
+    """Renders the current user's profile, with the message shown on the about form if it failed"""
+
+    # Connect to DB
+    with database.connection() as con:
+        # Get user from DB
+        with reporting("Error: Fetching user", back = "profiles.Own_Profile"):
+            statement = text(f'SELECT {USER_PROFILE} WHERE ("user".id = :id)')
+            user = con.execute(statement, id = session['user_id']).first()
+
+        # The session can outlive its user
+        if user is None:
+            session.pop('user_id')
+            return redirect(url_for('auth.Login'))
+
+        # Get a page of user posts from DB, read as the page streams if it does
+        stream = current_app.config['STREAM_PAGES']
+        with reporting("Error: Fetching user posts", back = "profiles.Own_Profile"):
+            posts, next_cursor = Profile_Posts(con, session['user_id'], stream)
+
+    # Check if the user is editing their about, a failed update stays in the editor
+    to_edit = 'about' if message else request.args.get('edit')
+    form = request.form if message else None
+
+    return Render_Page("profile.html", stream, user = user, posts = posts, next_cursor = next_cursor, editable = True, to_edit = to_edit, message = message, form = form), status
+
+@bp.route('/profile')
+def Own_Profile():
+    """Route for viewing own profile"""
+
+    # Display profile if user is logged in, else prompt them to login
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to view your profile."))
+
+    return Render_Own_Profile()
+
+@bp.route('/profile/<username>')
+@conditional(Profile_Version)
+@page_cache.cached()
+def User_Profile(username):
+    """Route for viewing other's profiles"""
+
+    # Connect to db
+    with database.connection() as con:
+        # Get user from DB
+        with reporting("Error: Fetching user"):
+            statement = text(f'SELECT {USER_PROFILE} WHERE ("user".username = :username)')
+            user = con.execute(statement, username = username).first()
+
+        if user is None:
+            raise NotFoundError("Error: 404", f"There is no user called {username}", back = "search.Search_Form")
+
+        # Redirect user to profile not profile/<username> if <username> is theirs (shows editing buttons and stuff)
+        if session.get('user_id') == user.id:
+            return redirect(url_for('profiles.Own_Profile'))
+
+        # Get a page of user posts from DB
+        # Cached pages are served whole, so they only stream when the page cache is off
+        stream = current_app.config['STREAM_PAGES'] and page_cache.backend is None
+        with reporting("Error: Fetching user posts"):
+            posts, next_cursor = Profile_Posts(con, user.id, stream)
+
+    # Cached until the user's about or posts change
+    page_cache.tag(f'user:{user.id}')
+
+    return Render_Page("profile.html", stream, user = user, posts = posts, next_cursor = next_cursor, editable = False)
+
+@bp.route('/authors')
+@page_cache.cached('authors')
+def Authors():
+    """Renders the authors with the most posts, or the most words with ?by=words"""
+
+    order = request.args.get('by', 'posts')
+    if order not in user_stats.ORDERS:
+        order = 'posts'
+
+    # Connect to DB
+    with database.connection() as con:
+        with reporting("Error: Fetching authors", back = "posts.Recent"):
+            authors = user_stats.leaderboard(con, order, current_app.config['AUTHORS_PAGE_SIZE'])
+
+    return render_template("authors.html", authors = authors, order = order)
+
+@bp.route('/profile', methods = ['POST'])
+def Update_About():
+    """Updates user's about in the DB"""
+
+    if not 'user_id' in session:
+        return redirect(url_for('auth.Login', message = "You must be logged in to view your profile."))
+
+    # If the user is updating their about
+    if request.form['about']:
+        # Limit length to 500 characters including whitespace
+        # Textarea in profile.html restricts too, this is verification
+        if len(str(request.form['about'])) - str(request.form['about']).count("\n") > 500:
+            return Render_Own_Profile("Your about can not be more than 500 characters!", status = 400)
+
+        # Connect to DB
+        with database.connection() as con:
+            # Update user's status in DB
+            with reporting("Error: Updating user about", back = "profiles.Own_Profile"):
+                statement = text('UPDATE "user" SET about = :about, updated_at = :now WHERE id = :id')
+                result = con.execute(statement, about = request.form['about'], now = datetime.utcnow(), id = session['user_id']).rowcount
+
+            # If update was successful, return to profile
+            # Else throw error
+            if result != 1:
+                raise BlogError("Error: Updating user about", "<class 'blog.UnhandledError'>", back = "profiles.Own_Profile")
+
+            db.session.commit()
+            page_cache.invalidate(f"user:{session['user_id']}")
+            feeds.user_changed(session['user_id'])
+
+    return redirect(url_for('profiles.Own_Profile'))
@@ -0,0 +1,73 @@
+from flask import Blueprint, current_app, render_template, request
+from sqlalchemy.orm import load_only, joinedload
+from errors import reporting
+from extensions import database
+from models import User, Post
+from views.common import Get_Search_Index, Render_Form, Render_Page, Deferred
+
+bp = Blueprint('search', __name__)
+
+@bp.route('/search')
+def Search_Form():
+    """Render the search form"""
+
+    return render_template("search.html")
+
+@bp.route('/search', methods = ['POST'])
+def Search():
+    """Searches the DB for matching users and posts based on filters and renders them to the search form"""
+
+    # Get the filters, search and page
+    search = request.form.get('search')
+    filter_all = request.form.get('all')
+    filter_users = request.form.get('users')
+    filter_posts = request.form.get('posts')
+    page = max(request.form.get('page', 1, type = int), 1)
+
+    # Verify valid search
+    if not search or len(search) < 3:
+        return Render_Form("search.html", "Searches must be at least 3 characters long", search = search, filters = request.form)
+
+    show_users = filter_all == 'true' or filter_users == 'true'
+    show_posts = filter_all == 'true' or filter_posts == 'true'
+    if not (show_users or show_posts):
+        return Render_Form("search.html", "Choose what to search for", search = search, filters = request.form)
+
+    per_page = current_app.config['SEARCH_PAGE_SIZE']
+    offset = (page - 1) * per_page
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+    totals = {'users': 0, 'posts': 0}
+
+    def Find_Users():
+        """Yields the best matching users, loading them a chunk at a time"""
+
+        with database.connection() as con, reporting("Error: Performing search", back = "search.Search_Form"):
+            user_ids, totals['users'] = Get_Search_Index().search_users(con, search, per_page, offset)
+            for i in range(0, len(user_ids), chunk_size):
+                chunk = user_ids[i:i + chunk_size]
+                found = {user.id: user for user in User.query.filter(User.id.in_(chunk)).all()}
+                yield from (found[user_id] for user_id in chunk if user_id in found)
+
+    def Find_Posts():
+        """Yields the best matching posts, loading them a chunk at a time"""
+
+        with database.connection() as con, reporting("Error: Performing search", back = "search.Search_Form"):
+            post_ids, totals['posts'] = Get_Search_Index().search_posts(con, search, per_page, offset)
+            # Load the authors in the same query so the template doesn't issue one SELECT per post
+            summaries = Post.query.options(load_only('id', 'title', 'excerpt', 'word_count', 'date_created', 'author_id'), joinedload('author').load_only('username'))
+            for i in range(0, len(post_ids), chunk_size):
+                chunk = post_ids[i:i + chunk_size]
+                found = {post.id: post for post in summaries.filter(Post.id.in_(chunk)).all()}
+                yield from (found[post_id] for post_id in chunk if post_id in found)
+
+    # A streamed page sends the form before searching and renders the results as they load
+    stream = current_app.config['STREAM_PAGES']
+    users = Find_Users() if show_users else None
+    posts = Find_Posts() if show_posts else None
+    if not stream:
+        users = list(users) if users is not None else None
+        posts = list(posts) if posts is not None else None
+
+    has_next = Deferred(lambda: offset + per_page < max(totals.values()))
+
+    return Render_Page("search.html", stream, users = users, posts = posts, search = search, filters = request.form, page = page, has_next = has_next)
@@ -0,0 +1,11 @@
+"""Entry point for WSGI servers, preloaded so forked workers share the parsed templates
+
+Usage: gunicorn --preload --workers 4 wsgi:app
+With several workers set PAGE_CACHE_BACKEND to 'sqlite', each worker's memory cache only sees its own edits
+Behind a reverse proxy set TRUSTED_PROXIES=1 (or the number of proxies), so clients are rate limited by their own address
+"""
+
+from App import create_app, preload
+
+app = create_app()
+preload(app)